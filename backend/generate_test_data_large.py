@@ -232,12 +232,16 @@ async def generate_large_test_data():
             "founder_id": founder["id"],
             "founder_username": founder["username"],
             "is_private": is_private,
-            "member_ids": members,
+            "member_count": len(members),
             "pending_request_ids": [],
             "created_at": datetime.utcnow() - timedelta(days=random.randint(1, 180))
         }
         
         await db.groups.insert_one(group)
+        await db.group_memberships.insert_many([
+            {"group_id": group_id, "user_id": member_id, "role": "member", "joined_at": group["created_at"]}
+            for member_id in members
+        ])
         group_ids.append(group_id)
     
     print(f"   ✓ Created 10 groups (5 private, 5 public)")
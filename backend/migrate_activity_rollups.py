@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Migration script to backfill the 'activity_rollups' hour and day buckets
+- Counts users, posts, comments, messages and reports per sector and hour from
+  the collections they live in (messages in the MESSAGE_STORAGE layout)
+- Bucket counts are set, not added, so the script can be run again; messages
+  already archived by retention are not counted
+- Buckets still open (the current hour and day) are skipped: a running server
+  adds to them, and setting them would drop or double its counts. Run the
+  script before the server starts to backfill everything up to then; with the
+  server running, open buckets keep the server's counts
+- Creates the rollup indexes the server relies on
+"""
+import asyncio
+from datetime import datetime, timedelta
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+NO_SECTOR = "none"  # ACTIVITY_NO_SECTOR of the server
+GRANULARITIES = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+# Longer than the server's ACTIVITY_FLUSH_INTERVAL, so a closed bucket has no counts in flight
+CLOSED_MARGIN = timedelta(minutes=1)
+
+def hour_pipeline(date_field, sector_expression, lookup=None, unwind=None):
+    """Pipeline counting documents per (sector, hour) of their creation"""
+    pipeline = []
+    if unwind:
+        pipeline.append({"$unwind": f"${unwind}"})
+    pipeline.append({"$match": {date_field: {"$type": "date"}}})
+    if lookup:
+        collection, local_field = lookup
+        pipeline += [
+            {"$lookup": {"from": collection, "localField": local_field, "foreignField": "id", "as": "container"}},
+            {"$unwind": {"path": "$container", "preserveNullAndEmptyArrays": True}},
+        ]
+    pipeline.append({"$group": {
+        "_id": {
+            "sector": {"$ifNull": [sector_expression, "drivers"]},
+            "hour": {"$dateToString": {"format": "%Y-%m-%dT%H", "date": f"${date_field}"}},
+        },
+        "count": {"$sum": 1},
+    }})
+    return pipeline
+
+def message_sources(storage):
+    """(collection, pipeline) of each message collection"""
+    if storage == "buckets":
+        return [
+            ("chatroom_messages_buckets", hour_pipeline("messages.created_at", "$container", unwind="messages")),
+            ("group_messages_buckets", hour_pipeline("messages.created_at", "$container.sector", ("groups", "container"), unwind="messages")),
+            ("messages_buckets", hour_pipeline("messages.created_at", "$container.sector", ("chats", "container"), unwind="messages")),
+        ]
+    return [
+        ("chatroom_messages", hour_pipeline("created_at", "$sector")),
+        ("group_messages", hour_pipeline("created_at", "$container.sector", ("groups", "group_id"))),
+        ("messages", hour_pipeline("created_at", "$container.sector", ("chats", "chat_id"))),
+    ]
+
+async def migrate_activity_rollups():
+    # Get MongoDB connection string from environment
+    mongo_url = os.getenv("MONGO_URL")
+    if not mongo_url:
+        print("❌ MONGO_URL not found in environment")
+        return
+
+    # Connect to MongoDB
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[os.getenv("DB_NAME", "drivers_chat")]
+
+    await db.activity_rollups.create_index([("granularity", 1), ("start", 1)])
+    await db.activity_rollups.create_index([("granularity", 1), ("sector", 1), ("start", 1)])
+
+    sources = {
+        # A user's first sector is the one they registered in
+        "users": [("users", hour_pipeline("created_at", {"$arrayElemAt": ["$sectors", 0]}))],
+        # Shares have no sector of their own, they count in the shared post's
+        "posts": [("posts_enhanced", hour_pipeline(
+            "created_at", {"$ifNull": ["$sector", "$container.sector"]}, ("posts_enhanced", "shared_from_id")
+        ))],
+        "comments": [("comments", hour_pipeline("created_at", "$container.sector", ("posts_enhanced", "post_id")))],
+        "messages": message_sources(os.getenv("MESSAGE_STORAGE", "documents").lower()),
+        "reports": [("reports", hour_pipeline("created_at", {"$literal": NO_SECTOR}))],
+    }
+
+    # Buckets ending after this may still get counts from a running server
+    closed_before = datetime.utcnow() - CLOSED_MARGIN
+
+    # (granularity, sector, start) -> {metric: count}
+    buckets = {}
+    for metric, collections in sources.items():
+        counted = 0
+        for collection, pipeline in collections:
+            async for row in db[collection].aggregate(pipeline):
+                hour = datetime.strptime(row["_id"]["hour"], "%Y-%m-%dT%H")
+                sector = row["_id"]["sector"]
+                for granularity, start in (("hour", hour), ("day", hour.replace(hour=0))):
+                    counts = buckets.setdefault((granularity, sector, start), {})
+                    counts[metric] = counts.get(metric, 0) + row["count"]
+                counted += row["count"]
+        print(f"📊 {metric}: {counted}")
+
+    open_buckets = [key for key in buckets if key[2] + GRANULARITIES[key[0]] > closed_before]
+    for key in open_buckets:
+        del buckets[key]
+
+    result = await db.activity_rollups.bulk_write([
+        UpdateOne(
+            {"_id": f"{granularity}:{sector}:{start.isoformat()}"},
+            {"$set": {"granularity": granularity, "sector": sector, "start": start, **counts}},
+            upsert=True
+        )
+        for (granularity, sector, start), counts in buckets.items()
+    ], ordered=False) if buckets else None
+
+    print(f"✅ Migration completed!")
+    print(f"   - Buckets created: {result.upserted_count if result else 0}")
+    print(f"   - Buckets updated: {result.modified_count if result else 0}")
+    print(f"   - Open buckets skipped: {len(open_buckets)}")
+
+    # Verify the migration
+    week = await db.activity_rollups.count_documents({
+        "granularity": "hour", "start": {"$gte": datetime.utcnow() - timedelta(days=7)}
+    })
+    print(f"\n🎉 Verification: {week} hour buckets in the last 7 days")
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("🚀 ACTIVITY ROLLUP MIGRATION SCRIPT")
+    print("=" * 60)
+    asyncio.run(migrate_activity_rollups())
+    print("=" * 60)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Migration script to give 1-1 chats a canonical 'pair_key' (sector + sorted member ids)
+- Duplicate chats of the same pair are merged into the oldest one, with their messages
+- Merged chats get their messages renumbered (seq) and their inbox summary rebuilt
+- Creates the unique pair_key index the server relies on
+"""
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+def direct_chat_key(sector, user_a, user_b):
+    return ":".join([sector, *sorted([user_a, user_b])])
+
+async def merge_duplicates(db, pair_key, chats):
+    """Keep the oldest chat of a pair, move the other chats' messages into it"""
+    chats.sort(key=lambda chat: chat.get("created_at") or chat["_id"].generation_time.replace(tzinfo=None))
+    keep, duplicates = chats[0], chats[1:]
+    duplicate_ids = [chat["id"] for chat in duplicates]
+
+    moved = await db.messages.update_many(
+        {"chat_id": {"$in": duplicate_ids}},
+        {"$set": {"chat_id": keep["id"]}}
+    )
+
+    # Sequence numbers of different chats collide, renumber the merged history
+    messages = await db.messages.find(
+        {"chat_id": keep["id"]}, {"_id": 1, "id": 1, "user_id": 1, "username": 1, "content": 1, "created_at": 1}
+    ).sort("created_at", 1).to_list(None)
+    if messages:
+        await db.messages.bulk_write([
+            UpdateOne({"_id": message["_id"]}, {"$set": {"seq": seq}})
+            for seq, message in enumerate(messages, start=1)
+        ])
+    latest_seq = len(messages)
+    await db.room_sequences.update_one({"_id": keep["id"]}, {"$set": {"seq": latest_seq}}, upsert=True)
+    await db.room_sequences.delete_many({"_id": {"$in": duplicate_ids}})
+
+    # Unread messages add up, watermarks follow from them
+    unread_counts = {}
+    for chat in chats:
+        for user_id, count in chat.get("unread_counts", {}).items():
+            unread_counts[user_id] = min(latest_seq, unread_counts.get(user_id, 0) + count)
+    summary = {
+        "pair_key": pair_key,
+        "unread_counts": {member: unread_counts.get(member, 0) for member in keep["members"]},
+        "read_seq": {member: latest_seq - unread_counts.get(member, 0) for member in keep["members"]},
+    }
+    if messages:
+        last = messages[-1]
+        summary.update({
+            "last_message": last["content"],
+            "last_message_time": last["created_at"],
+            "last_message_sender_id": last["user_id"],
+            "last_message_sender": last["username"],
+            "last_message_seq": latest_seq,
+        })
+    await db.chats.update_one({"id": keep["id"]}, {"$set": summary})
+    await db.chats.delete_many({"id": {"$in": duplicate_ids}})
+
+    print(f"   - {pair_key}: kept {keep['id']}, merged {len(duplicates)} chat(s), moved {moved.modified_count} message(s)")
+    return len(duplicates)
+
+async def migrate_pairs():
+    # Get MongoDB connection string from environment
+    mongo_url = os.getenv("MONGO_URL")
+    if not mongo_url:
+        print("❌ MONGO_URL not found in environment")
+        return
+
+    # Connect to MongoDB
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[os.getenv("DB_NAME", "drivers_chat")]
+
+    print("🔍 Checking 1-1 chats...")
+    pairs = {}
+    async for chat in db.chats.find({"is_group": False}):
+        members = chat.get("members", [])
+        if len(members) != 2:
+            print(f"   ⚠️ Skipping chat {chat.get('id')} with {len(members)} member(s)")
+            continue
+        pair_key = direct_chat_key(chat.get("sector", "drivers"), *members)
+        pairs.setdefault(pair_key, []).append(chat)
+    print(f"📊 1-1 chats: {sum(len(chats) for chats in pairs.values())}, distinct pairs: {len(pairs)}")
+
+    duplicates = {pair_key: chats for pair_key, chats in pairs.items() if len(chats) > 1}
+    print(f"🔍 Pairs with duplicate chats: {len(duplicates)}")
+
+    merged = 0
+    if duplicates:
+        print(f"\n🔧 Merging duplicate chats...")
+        for pair_key, chats in duplicates.items():
+            merged += await merge_duplicates(db, pair_key, chats)
+
+    print(f"\n🔧 Setting pair_key on 1-1 chats...")
+    result = await db.chats.bulk_write([
+        UpdateOne({"_id": chats[0]["_id"]}, {"$set": {"pair_key": pair_key}})
+        for pair_key, chats in pairs.items() if len(chats) == 1
+    ]) if any(len(chats) == 1 for chats in pairs.values()) else None
+
+    await db.chats.create_index(
+        "pair_key", unique=True, partialFilterExpression={"pair_key": {"$exists": True}}
+    )
+
+    print(f"✅ Migration completed!")
+    print(f"   - Duplicate chats merged: {merged}")
+    print(f"   - Chats given a pair_key: {result.modified_count if result else 0}")
+
+    # Verify the migration
+    remaining = await db.chats.count_documents({"is_group": False, "pair_key": {"$exists": False}})
+    print(f"\n🎉 Verification: {remaining} 1-1 chats remaining without pair_key")
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("🚀 DIRECT CHAT PAIR KEY MIGRATION SCRIPT")
+    print("=" * 60)
+    asyncio.run(migrate_pairs())
+    print("=" * 60)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Migration script to move follows into the 'follows' edge collection
+- following_ids/followers_ids arrays become one {follower_id, followee_id} edge
+  per follow (both arrays are read, a follow recorded on either side counts)
+- Users get followers_count/following_count and lose the embedded arrays
+- Creates the follow indexes the server relies on
+"""
+import asyncio
+from datetime import datetime
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+async def migrate_follows():
+    # Get MongoDB connection string from environment
+    mongo_url = os.getenv("MONGO_URL")
+    if not mongo_url:
+        print("❌ MONGO_URL not found in environment")
+        return
+
+    # Connect to MongoDB
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[os.getenv("DB_NAME", "drivers_chat")]
+
+    await db.follows.create_index([("follower_id", 1), ("followee_id", 1)], unique=True)
+    await db.follows.create_index([("followee_id", 1), ("_id", -1)])
+    await db.follows.create_index([("follower_id", 1), ("_id", -1)])
+
+    user_ids = set(await db.users.distinct("id"))
+    query = {"$or": [{"following_ids": {"$exists": True}}, {"followers_ids": {"$exists": True}}]}
+    count = await db.users.count_documents(query)
+    print(f"🔍 Users with embedded follow arrays: {count}")
+
+    edges = set()
+    async for user in db.users.find(query, {"_id": 0, "id": 1, "following_ids": 1, "followers_ids": 1}):
+        for followee_id in user.get("following_ids") or []:
+            edges.add((user["id"], followee_id))
+        for follower_id in user.get("followers_ids") or []:
+            edges.add((follower_id, user["id"]))
+    # Follows of deleted users and self-follows are dropped
+    edges = {(a, b) for a, b in edges if a != b and a in user_ids and b in user_ids}
+    print(f"📊 Distinct follows found: {len(edges)}")
+
+    edges_written = 0
+    if edges:
+        # Edges created since (e.g. by a half-finished run) are kept
+        now = datetime.utcnow()
+        result = await db.follows.bulk_write([
+            UpdateOne(
+                {"follower_id": follower_id, "followee_id": followee_id},
+                {"$setOnInsert": {"created_at": now}},
+                upsert=True
+            )
+            for follower_id, followee_id in edges
+        ], ordered=False)
+        edges_written = result.upserted_count
+
+    print(f"\n🔧 Recounting followers and following...")
+    followers = {row["_id"]: row["count"] async for row in db.follows.aggregate(
+        [{"$group": {"_id": "$followee_id", "count": {"$sum": 1}}}]
+    )}
+    following = {row["_id"]: row["count"] async for row in db.follows.aggregate(
+        [{"$group": {"_id": "$follower_id", "count": {"$sum": 1}}}]
+    )}
+    result = await db.users.bulk_write([
+        UpdateOne(
+            {"id": user_id},
+            {
+                "$set": {"followers_count": followers.get(user_id, 0), "following_count": following.get(user_id, 0)},
+                "$unset": {"following_ids": "", "followers_ids": ""}
+            }
+        )
+        for user_id in user_ids
+    ]) if user_ids else None
+
+    print(f"✅ Migration completed!")
+    print(f"   - Follows created: {edges_written}")
+    print(f"   - Users updated: {result.modified_count if result else 0}")
+
+    # Verify the migration
+    remaining = await db.users.count_documents(query)
+    print(f"\n🎉 Verification: {remaining} users remaining with embedded follow arrays")
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("🚀 FOLLOW GRAPH MIGRATION SCRIPT")
+    print("=" * 60)
+    asyncio.run(migrate_follows())
+    print("=" * 60)
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Migration script to move group members into the 'group_memberships' collection
+- member_ids/admin_ids/moderator_ids arrays become one membership per user
+  (role: admin > moderator > member), joined at the group's creation time
+- Groups get a member_count and lose the embedded arrays
+- Creates the membership indexes the server relies on
+"""
+import asyncio
+from datetime import datetime
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+def group_roles(group):
+    """user_id -> role from the embedded arrays"""
+    roles = {}
+    for field, role in (("member_ids", "member"), ("moderator_ids", "moderator"), ("admin_ids", "admin")):
+        for user_id in group.get(field) or []:
+            roles[user_id] = role
+    # Legacy groups without admin_ids: their creator administers them
+    if group.get("creator_id") and group["creator_id"] in roles and "admin" not in roles.values():
+        roles[group["creator_id"]] = "admin"
+    return roles
+
+async def migrate_memberships():
+    # Get MongoDB connection string from environment
+    mongo_url = os.getenv("MONGO_URL")
+    if not mongo_url:
+        print("❌ MONGO_URL not found in environment")
+        return
+
+    # Connect to MongoDB
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[os.getenv("DB_NAME", "drivers_chat")]
+
+    await db.group_memberships.create_index([("group_id", 1), ("user_id", 1)], unique=True)
+    await db.group_memberships.create_index([("user_id", 1), ("group_id", 1), ("role", 1)])
+    await db.group_memberships.create_index([("group_id", 1), ("joined_at", 1), ("_id", 1)])
+
+    query = {"$or": [
+        {"member_ids": {"$exists": True}},
+        {"admin_ids": {"$exists": True}},
+        {"moderator_ids": {"$exists": True}},
+    ]}
+    count = await db.groups.count_documents(query)
+    print(f"🔍 Groups with embedded member arrays: {count}")
+
+    migrated_groups = 0
+    memberships_written = 0
+    async for group in db.groups.find(query):
+        roles = group_roles(group)
+        joined_at = group.get("created_at") or datetime.utcnow()
+        if roles:
+            # Memberships created since (e.g. by a half-finished run) are kept
+            result = await db.group_memberships.bulk_write([
+                UpdateOne(
+                    {"group_id": group["id"], "user_id": user_id},
+                    {"$setOnInsert": {"role": role, "joined_at": joined_at}},
+                    upsert=True
+                )
+                for user_id, role in roles.items()
+            ], ordered=False)
+            memberships_written += result.upserted_count
+        member_count = await db.group_memberships.count_documents({"group_id": group["id"]})
+        await db.groups.update_one(
+            {"_id": group["_id"]},
+            {
+                "$set": {"member_count": member_count},
+                "$unset": {"member_ids": "", "admin_ids": "", "moderator_ids": ""}
+            }
+        )
+        migrated_groups += 1
+
+    print(f"✅ Migration completed!")
+    print(f"   - Groups migrated: {migrated_groups}")
+    print(f"   - Memberships created: {memberships_written}")
+
+    # Verify the migration
+    remaining = await db.groups.count_documents(query)
+    print(f"\n🎉 Verification: {remaining} groups remaining with embedded member arrays")
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("🚀 GROUP MEMBERSHIP MIGRATION SCRIPT")
+    print("=" * 60)
+    asyncio.run(migrate_memberships())
+    print("=" * 60)
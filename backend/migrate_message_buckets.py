@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Migration script to copy chat, group and chatroom messages into buckets
+(MESSAGE_STORAGE=buckets)
+- Messages of each chat/group/sector are packed oldest first into
+  '<collection>_buckets' documents with the server's size, span and byte limits
+- Containers that already have buckets are skipped, so the script can be re-run
+- The per-message collections are left in place; drop them once the server runs on buckets
+"""
+import asyncio
+from datetime import timedelta
+from motor.motor_asyncio import AsyncIOMotorClient
+from bson import encode as bson_encode
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MESSAGE_BUCKET_SIZE = int(os.getenv("MESSAGE_BUCKET_SIZE", "200"))
+MESSAGE_BUCKET_SPAN = timedelta(hours=float(os.getenv("MESSAGE_BUCKET_SPAN_HOURS", "168")))
+MESSAGE_BUCKET_MAX_BYTES = int(os.getenv("MESSAGE_BUCKET_MAX_BYTES", str(8 * 1024 * 1024)))
+
+MESSAGE_CONTAINERS = {
+    "messages": "chat_id",
+    "group_messages": "group_id",
+    "chatroom_messages": "sector",
+}
+AUTHOR_FIELDS = ("full_name", "user_profile_picture")
+
+def compact(collection, message):
+    dropped = {"_id", MESSAGE_CONTAINERS[collection]}
+    if collection != "messages":
+        dropped.update(AUTHOR_FIELDS)
+    return {k: v for k, v in message.items() if k not in dropped}
+
+def pack(container, messages):
+    """Split a container's messages, oldest first, into bucket documents"""
+    buckets = []
+    bucket = None
+    for message in messages:
+        size = len(bson_encode(message))
+        created_at = message["created_at"]
+        if (
+            bucket is None
+            or bucket["count"] >= MESSAGE_BUCKET_SIZE
+            or bucket["bytes"] + size > MESSAGE_BUCKET_MAX_BYTES
+            or created_at - bucket["start"] >= MESSAGE_BUCKET_SPAN
+        ):
+            bucket = {"container": container, "start": created_at, "last_at": created_at,
+                      "count": 0, "bytes": 0, "messages": []}
+            buckets.append(bucket)
+        bucket["messages"].append(message)
+        bucket["count"] += 1
+        bucket["bytes"] += size
+        bucket["last_at"] = max(bucket["last_at"], created_at)
+    return buckets
+
+async def migrate_collection(db, collection):
+    field = MESSAGE_CONTAINERS[collection]
+    buckets_collection = db[f"{collection}_buckets"]
+    containers = await db[collection].distinct(field)
+    print(f"\n🔧 {collection}: {len(containers)} container(s)")
+
+    migrated = skipped = buckets_written = 0
+    for container in containers:
+        if container is None:
+            continue
+        if await buckets_collection.find_one({"container": container}, {"_id": 1}):
+            skipped += 1
+            continue
+        messages = [
+            compact(collection, message)
+            async for message in db[collection].find({field: container}).sort("created_at", 1)
+            if message.get("created_at") is not None
+        ]
+        buckets = pack(container, messages)
+        if buckets:
+            await buckets_collection.insert_many(buckets)
+        migrated += len(messages)
+        buckets_written += len(buckets)
+
+    await buckets_collection.create_index([("container", 1), ("start", -1)])
+    await buckets_collection.create_index([("start", -1)])
+    print(f"   - Messages migrated: {migrated} into {buckets_written} bucket(s)")
+    print(f"   - Containers skipped (already bucketed): {skipped}")
+    return migrated
+
+async def migrate_buckets():
+    # Get MongoDB connection string from environment
+    mongo_url = os.getenv("MONGO_URL")
+    if not mongo_url:
+        print("❌ MONGO_URL not found in environment")
+        return
+
+    # Connect to MongoDB
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[os.getenv("DB_NAME", "drivers_chat")]
+
+    print(f"🔍 Bucket size: {MESSAGE_BUCKET_SIZE} messages, span: {MESSAGE_BUCKET_SPAN}")
+    total = 0
+    for collection in MESSAGE_CONTAINERS:
+        total += await migrate_collection(db, collection)
+
+    print(f"\n✅ Migration completed!")
+    print(f"   - Messages migrated: {total}")
+
+    # Verify the migration
+    for collection in MESSAGE_CONTAINERS:
+        documents = await db[collection].count_documents({})
+        totals = await db[f"{collection}_buckets"].aggregate(
+            [{"$group": {"_id": None, "count": {"$sum": "$count"}, "buckets": {"$sum": 1}}}]
+        ).to_list(1)
+        bucketed = totals[0] if totals else {"count": 0, "buckets": 0}
+        print(f"🎉 Verification: {collection}: {documents} document(s), "
+              f"{bucketed['count']} bucketed message(s) in {bucketed['buckets']} bucket(s)")
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("🚀 MESSAGE BUCKET MIGRATION SCRIPT")
+    print("=" * 60)
+    asyncio.run(migrate_buckets())
+    print("=" * 60)
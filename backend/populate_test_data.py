@@ -181,6 +181,7 @@ async def create_friendships(users):
 async def create_groups(users):
     print("Creating groups...")
     groups = []
+    memberships = []
     base_time = datetime.utcnow() - timedelta(days=20)
     
     for i in range(len(GROUP_NAMES)):
@@ -197,17 +198,23 @@ async def create_groups(users):
             "name": GROUP_NAMES[i],
             "description": GROUP_DESCRIPTIONS[i],
             "creator_id": creator["id"],
-            "admin_ids": [creator["id"]],
-            "moderator_ids": [],
-            "member_ids": member_ids,
+            "member_count": len(member_ids),
             "requires_approval": random.choice([True, False]),
             "created_at": base_time + timedelta(days=i)
         }
         groups.append(group)
+        memberships.extend({
+            "group_id": group_id,
+            "user_id": member_id,
+            "role": "admin" if member_id == creator["id"] else "member",
+            "joined_at": group["created_at"]
+        } for member_id in member_ids)
     
     await db.groups.insert_many(groups)
+    await db.group_memberships.insert_many(memberships)
     print(f"✅ Created {len(groups)} groups")
-    return groups
+    # Member ids are only kept in memory, for picking group posts
+    return [{**group, "member_ids": [m["user_id"] for m in memberships if m["group_id"] == group["id"]]} for group in groups]
 
 async def create_posts(users, groups):
     print("Creating 100 posts...")
@@ -385,6 +392,7 @@ async def main():
     await db.chats.delete_many({})
     await db.messages.delete_many({})
     await db.groups.delete_many({})
+    await db.group_memberships.delete_many({})
     await db.friend_requests.delete_many({})
     print("✅ Cleaned existing data\n")
     
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Multi-worker launcher for the backend (REST + Socket.IO)
+
+Examples:
+    # Single worker, rooms kept in memory (same as running uvicorn directly)
+    python run_server.py --port 8001
+
+    # 4 workers on one port, emits relayed through Redis
+    python run_server.py --workers 4 --manager redis://localhost:6379/0
+
+    # 2 workers on ports 8001 and 8002 (behind a sticky load balancer),
+    # emits relayed through MongoDB - no extra service needed
+    python run_server.py --workers 2 --manager mongo --port-per-worker
+
+Workers sharing a port get connections from the OS in turn, which only works
+for clients using the websocket transport: those workers refuse long-polling
+(SOCKETIO_TRANSPORTS=websocket). Clients that need HTTP long-polling need
+--port-per-worker and a load balancer with sticky sessions.
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+from pathlib import Path
+
+import uvicorn
+
+ROOT_DIR = Path(__file__).parent
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the backend with one or more workers")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument(
+        "--manager",
+        default=os.environ.get("SOCKETIO_MANAGER", "memory"),
+        help='Socket.IO client manager: "memory", "mongo" or a redis:// URL'
+    )
+    parser.add_argument(
+        "--port-per-worker",
+        action="store_true",
+        help="Start worker N on port+N instead of sharing one port"
+    )
+    parser.add_argument(
+        "--no-ws-deflate",
+        dest="ws_deflate",
+        action="store_false",
+        help="Disable permessage-deflate compression of websocket frames"
+    )
+    return parser.parse_args()
+
+def run_port_per_worker(args):
+    """Start one uvicorn process per port and wait for all of them"""
+    processes = []
+    for index in range(args.workers):
+        port = args.port + index
+        print(f"🚀 Worker {index} listening on {args.host}:{port}")
+        processes.append(subprocess.Popen(
+            [
+                sys.executable, "-m", "uvicorn", "server:socket_app",
+                "--host", args.host,
+                "--port", str(port),
+                "--ws-per-message-deflate", str(args.ws_deflate),
+            ],
+            cwd=ROOT_DIR,
+            env=os.environ.copy(),
+        ))
+
+    def stop(signum, frame):
+        for process in processes:
+            process.terminate()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    exit_code = 0
+    for process in processes:
+        exit_code = process.wait() or exit_code
+    return exit_code
+
+def main():
+    args = parse_args()
+
+    if args.workers > 1 and args.manager == "memory":
+        print("❌ More than one worker needs a shared client manager (--manager mongo or redis://...)")
+        return 1
+
+    # Read by server.py when it builds the Socket.IO server
+    os.environ["SOCKETIO_MANAGER"] = args.manager
+
+    if args.port_per_worker and args.workers > 1:
+        return run_port_per_worker(args)
+
+    if args.workers > 1:
+        os.environ["SOCKETIO_TRANSPORTS"] = "websocket"
+
+    print(f"🚀 Starting {args.workers} worker(s) on {args.host}:{args.port} (manager: {args.manager})")
+    uvicorn.run(
+        "server:socket_app",
+        app_dir=str(ROOT_DIR),
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        ws_per_message_deflate=args.ws_deflate,
+    )
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
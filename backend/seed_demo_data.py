@@ -169,8 +169,8 @@ async def clear_database_keep_admin():
             "invited_by": None,
             "referral_count": 0,
             "friend_ids": [],
-            "following_ids": [],
-            "followers_ids": [],
+            "following_count": 0,
+            "followers_count": 0,
             "blocked_user_ids": [],
             "is_admin": True,
             "created_at": datetime.utcnow()
@@ -183,6 +183,9 @@ async def clear_database_keep_admin():
     await db.posts_enhanced.delete_many({})
     await db.comments.delete_many({})
     await db.groups.delete_many({})
+    await db.group_memberships.delete_many({})
+    await db.follows.delete_many({})
+    await db.users.update_many({}, {"$set": {"followers_count": 0, "following_count": 0}})
     await db.group_messages.delete_many({})
     await db.chatroom_messages.delete_many({})
     await db.friend_requests.delete_many({})
@@ -217,8 +220,8 @@ async def create_users(en_count=500, tr_count=300, es_count=200):
             "invited_by": None,
             "referral_count": 0,
             "friend_ids": [],
-            "following_ids": [],
-            "followers_ids": [],
+            "following_count": 0,
+            "followers_count": 0,
             "blocked_user_ids": [],
             "is_admin": False,
             "created_at": datetime.utcnow() - timedelta(days=random.randint(1, 90))
@@ -244,8 +247,8 @@ async def create_users(en_count=500, tr_count=300, es_count=200):
             "invited_by": None,
             "referral_count": 0,
             "friend_ids": [],
-            "following_ids": [],
-            "followers_ids": [],
+            "following_count": 0,
+            "followers_count": 0,
             "blocked_user_ids": [],
             "is_admin": False,
             "created_at": datetime.utcnow() - timedelta(days=random.randint(1, 90))
@@ -271,8 +274,8 @@ async def create_users(en_count=500, tr_count=300, es_count=200):
             "invited_by": None,
             "referral_count": 0,
             "friend_ids": [],
-            "following_ids": [],
-            "followers_ids": [],
+            "following_count": 0,
+            "followers_count": 0,
             "blocked_user_ids": [],
             "is_admin": False,
             "created_at": datetime.utcnow() - timedelta(days=random.randint(1, 90))
@@ -342,25 +345,26 @@ async def create_friendships_and_follows(users):
         num_follows = random.randint(0, min(50, len(users) - 1))
         follows = random.sample([u for u in users if u["id"] != user["id"]], num_follows)
         
-        following_ids = [f["id"] for f in follows]
-        
         await db.users.update_one(
             {"id": user["id"]},
             {
-                "$set": {
-                    "friend_ids": friend_ids,
-                    "following_ids": following_ids
-                }
+                "$set": {"friend_ids": friend_ids},
+                "$inc": {"following_count": len(follows)}
             }
         )
         
-        # Update followers for followed users
-        for followed_user in follows:
-            await db.users.update_one(
-                {"id": followed_user["id"]},
-                {"$addToSet": {"followers_ids": user["id"]}}
+        # One edge per follow, counted on the followed users
+        if follows:
+            now = datetime.utcnow()
+            await db.follows.insert_many([
+                {"follower_id": user["id"], "followee_id": followed_user["id"], "created_at": now}
+                for followed_user in follows
+            ])
+            await db.users.update_many(
+                {"id": {"$in": [f["id"] for f in follows]}},
+                {"$inc": {"followers_count": 1}}
             )
-            follow_count += 1
+        follow_count += len(follows)
         
         friend_count += len(friend_ids)
     
@@ -371,6 +375,7 @@ async def create_groups(users):
     print("👥 Creating groups...")
     
     groups = []
+    memberships = []
     for i, name in enumerate(GROUP_NAMES):
         creator = random.choice(users)
         group_id = str(int(datetime.utcnow().timestamp() * 1000) + i)
@@ -385,15 +390,22 @@ async def create_groups(users):
             "name": name,
             "description": f"A community for {name.lower()}",
             "creator_id": creator["id"],
-            "member_ids": member_ids,
+            "member_count": len(member_ids),
             "pending_requests": [],
             "privacy": random.choice(["public", "private"]),
             "requires_approval": random.choice([True, False]),
             "created_at": datetime.utcnow() - timedelta(days=random.randint(1, 60))
         }
         groups.append(group)
+        memberships.extend({
+            "group_id": group_id,
+            "user_id": member_id,
+            "role": "admin" if member_id == creator["id"] else "member",
+            "joined_at": group["created_at"]
+        } for member_id in member_ids)
     
     await db.groups.insert_many(groups)
+    await db.group_memberships.insert_many(memberships)
     print(f"✅ Created {len(groups)} groups")
     return groups
 
@@ -1,26 +1,41 @@
 from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import CursorType, ReturnDocument
+from pymongo import ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError
+from bson import ObjectId, json_util, encode as bson_encode
 import os
+import json
+import asyncio
+import gzip
+import heapq
+import math
 import logging
+from collections import deque, OrderedDict
 from pathlib import Path
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError
 from typing import List, Optional
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 import socketio
+import engineio
+from socketio.async_pubsub_manager import AsyncPubSubManager
+from socketio.msgpack_packet import MsgPackPacket
 import random
 import string
 import httpx
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
+from limits import parse as parse_rate_limit
 import bleach
 import re
+from urllib.parse import quote
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -38,17 +53,421 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 
+# ==================== SOCKET.IO CLIENT MANAGER ====================
+
+class ReplayRecordingMixin:
+    """Keeps sequenced events relayed by other workers in this worker's replay buffer"""
+
+    async def _handle_emit(self, message):
+        if message.get('host_id') != self.host_id and message.get('event') in SEQUENCED_EVENTS:
+            room_replay.record(message.get('room'), message['event'], message.get('data'))
+        await super()._handle_emit(message)
+
+class MongoPubSubManager(ReplayRecordingMixin, AsyncPubSubManager):
+    """
+    Socket.IO client manager that relays emits between workers through MongoDB
+    - Messages go through a capped collection read with a tailable cursor
+    - Works on a standalone mongod (change streams would need a replica set)
+    - Meant for single-box deployments and multi-worker tests; use Redis at scale
+    """
+    name = 'mongo'
+
+    def __init__(self, database, channel='socketio', write_only=False, logger=None,
+                 capped_size=16 * 1024 * 1024):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.database = database
+        self.collection_name = f'{channel}_pubsub'
+        self.capped_size = capped_size
+        self._collection = None
+
+    async def _get_collection(self):
+        if self._collection is None:
+            names = await self.database.list_collection_names()
+            if self.collection_name not in names:
+                try:
+                    await self.database.create_collection(
+                        self.collection_name, capped=True, size=self.capped_size
+                    )
+                    # Tailable cursors die immediately on an empty collection
+                    await self.database[self.collection_name].insert_one(
+                        {"payload": None, "ts": datetime.utcnow()}
+                    )
+                except Exception:
+                    pass  # Another worker created it first
+            self._collection = self.database[self.collection_name]
+        return self._collection
+
+    async def _publish(self, data):
+        collection = await self._get_collection()
+        await collection.insert_one({"payload": json.dumps(data), "ts": datetime.utcnow()})
+
+    async def _listen(self):
+        collection = await self._get_collection()
+        # Start after the newest message, never replay what was sent before startup
+        newest = await collection.find_one(sort=[("$natural", -1)])
+        last_id = newest["_id"] if newest else None
+        since = newest["ts"] if newest else datetime.utcnow()
+        while True:
+            # ObjectIds and ts of different workers are not ordered, the capped
+            # collection's insertion order is: a restarted cursor re-reads a small
+            # time window in that order and resumes after the last delivered message
+            if last_id is not None and not await collection.find_one({"_id": last_id}, {"_id": 1}):
+                last_id = None  # Rolled out of the capped collection
+            cursor = collection.find(
+                {"ts": {"$gte": since - timedelta(seconds=5)}},
+                cursor_type=CursorType.TAILABLE_AWAIT
+            )
+            resumed = last_id is None
+            while cursor.alive:
+                async for doc in cursor:
+                    if not resumed:
+                        resumed = doc["_id"] == last_id
+                        continue
+                    last_id = doc["_id"]
+                    since = max(since, doc["ts"])
+                    if doc.get("payload"):
+                        yield doc["payload"]
+            await asyncio.sleep(0.5)
+
+class RedisManager(ReplayRecordingMixin, socketio.AsyncRedisManager):
+    pass
+
+def create_socketio_manager():
+    """
+    Pick the Socket.IO client manager from SOCKETIO_MANAGER
+    - unset / "memory": rooms live in this process (single worker only)
+    - "redis://host:6379/0": Redis pub/sub, for several workers and nodes
+    - "mongo": MongoDB capped collection, for several workers on one box
+    """
+    manager_url = os.environ.get("SOCKETIO_MANAGER", "memory")
+    if manager_url == "memory":
+        return None
+    if manager_url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisManager(manager_url)
+    if manager_url == "mongo":
+        return MongoPubSubManager(db)
+    raise ValueError(f"Unsupported SOCKETIO_MANAGER: {manager_url}")
+
+socketio_manager = create_socketio_manager()
+
+# ==================== SOCKET.IO WIRE FORMAT ====================
+
+# Chat message events whose sender details compact clients get from 'user_card' events
+COMPACT_EVENTS = {'new_message', 'new_group_message', 'new_chatroom_message'}
+USER_CARD_FIELDS = ('full_name', 'user_profile_picture')
+
+class HybridPacket(socketio.packet.Packet):
+    """Reads text packets as JSON and binary packets as msgpack"""
+
+    def decode(self, encoded_packet):
+        if isinstance(encoded_packet, bytes):
+            return MsgPackPacket.decode(self, encoded_packet)
+        return super().decode(encoded_packet)
+
+def compact_event_payload(payload: dict) -> dict:
+    """Chat message payload without sender card fields, created_at as epoch milliseconds"""
+    compact = {k: v for k, v in payload.items() if k not in USER_CARD_FIELDS}
+    if isinstance(compact.get("created_at"), str):
+        created_at = datetime.fromisoformat(compact["created_at"])
+        if created_at.tzinfo is None:
+            created_at = created_at.replace(tzinfo=timezone.utc)
+        compact["created_at"] = int(created_at.timestamp() * 1000)
+    return compact
+
+class WireFormatServer(socketio.AsyncServer):
+    """
+    Socket.IO server with a wire format negotiated per client
+    - Serializer: a client whose first packet is binary speaks msgpack, otherwise JSON
+    - Compact clients (handshake auth {"compact": true}) get chat message events
+      without full_name / user_profile_picture; a 'user_card' event with them is
+      sent before the first message of each sender, and again when they change
+    - Broadcasts are still encoded once; each variant is built once per broadcast
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, serializer=HybridPacket, **kwargs)
+        self.wire_profiles = {}  # eio_sid -> {"msgpack": bool, "compact": bool, "cards": {user_id: hash}}
+
+    async def _handle_eio_message(self, eio_sid, data):
+        if eio_sid not in self.wire_profiles:
+            self.wire_profiles[eio_sid] = {"msgpack": isinstance(data, bytes), "compact": False, "cards": {}}
+        await super()._handle_eio_message(eio_sid, data)
+
+    async def _handle_eio_disconnect(self, eio_sid, reason):
+        self.wire_profiles.pop(eio_sid, None)
+        await super()._handle_eio_disconnect(eio_sid, reason)
+
+    def set_compact(self, sid: str, compact: bool = True):
+        profile = self.wire_profiles.get(self.manager.eio_sid_from_sid(sid, '/'))
+        if profile:
+            profile["compact"] = compact
+
+    async def _send_packet(self, eio_sid, pkt):
+        profile = self.wire_profiles.get(eio_sid)
+        if profile and profile["msgpack"] and not isinstance(pkt, MsgPackPacket):
+            pkt = MsgPackPacket(pkt.packet_type, data=pkt.data, namespace=pkt.namespace, id=pkt.id)
+        await super()._send_packet(eio_sid, pkt)
+
+    async def _send_eio_packet(self, eio_sid, eio_pkt):
+        profile = self.wire_profiles.get(eio_sid)
+        if profile is None or not (profile["msgpack"] or profile["compact"]) or not isinstance(eio_pkt.data, str):
+            return await super()._send_eio_packet(eio_sid, eio_pkt)
+
+        compact = False
+        if profile["compact"]:
+            event, payload = self._event_of(eio_pkt)
+            if event in COMPACT_EVENTS and isinstance(payload, dict) and payload.get("user_id"):
+                compact = True
+                await self._send_user_card(eio_sid, profile, eio_pkt)
+        await super()._send_eio_packet(eio_sid, self._variant(eio_pkt, compact, profile["msgpack"]))
+
+    async def _send_user_card(self, eio_sid, profile: dict, eio_pkt):
+        card_entry = getattr(eio_pkt, "user_card", None)
+        if card_entry is None:
+            payload = eio_pkt.decoded[2]
+            card = {"user_id": payload["user_id"], "username": payload.get("username")}
+            card.update((field, payload.get(field)) for field in USER_CARD_FIELDS)
+            card_entry = eio_pkt.user_card = (card, hash(tuple(card.values())))
+        card, card_hash = card_entry
+        if profile["cards"].get(card["user_id"]) == card_hash:
+            return
+        profile["cards"][card["user_id"]] = card_hash
+        await self._send_packet(eio_sid, self.packet_class(socketio.packet.EVENT, data=['user_card', card], namespace='/'))
+
+    def _event_of(self, eio_pkt):
+        """(event, payload) of an encoded EVENT packet, decoded once per broadcast"""
+        decoded = getattr(eio_pkt, "decoded", None)
+        if decoded is None:
+            pkt = self.packet_class(encoded_packet=eio_pkt.data)
+            decoded = (pkt, None, None)
+            if pkt.packet_type == socketio.packet.EVENT and isinstance(pkt.data, list) and len(pkt.data) == 2:
+                decoded = (pkt, pkt.data[0], pkt.data[1])
+            eio_pkt.decoded = decoded
+        return decoded[1], decoded[2]
+
+    def _variant(self, eio_pkt, compact: bool, use_msgpack: bool):
+        """Copy of a broadcast packet in a client's wire format, built once per broadcast"""
+        if not (compact or use_msgpack):
+            return eio_pkt
+        variants = getattr(eio_pkt, "variants", None)
+        if variants is None:
+            variants = eio_pkt.variants = {}
+        key = (compact, use_msgpack)
+        if key not in variants:
+            self._event_of(eio_pkt)
+            pkt = eio_pkt.decoded[0]
+            data = [eio_pkt.decoded[1], compact_event_payload(eio_pkt.decoded[2])] if compact else pkt.data
+            packet_class = MsgPackPacket if use_msgpack else self.packet_class
+            encoded = packet_class(pkt.packet_type, data=data, namespace=pkt.namespace, id=pkt.id).encode()
+            variants[key] = engineio.packet.Packet(engineio.packet.MESSAGE, encoded)
+        return variants[key]
+
+# ==================== SOCKET.IO BACKPRESSURE ====================
+
+SOCKET_LAG_PACKETS = int(os.environ.get("SOCKET_LAG_PACKETS", "16"))  # Queued packets before a client counts as lagging
+SOCKET_QUEUE_MAX_PACKETS = int(os.environ.get("SOCKET_QUEUE_MAX_PACKETS", "256"))
+SOCKET_QUEUE_MAX_BYTES = int(os.environ.get("SOCKET_QUEUE_MAX_BYTES", str(2 * 1024 * 1024)))
+SOCKET_LARGE_PAYLOAD_BYTES = int(os.environ.get("SOCKET_LARGE_PAYLOAD_BYTES", str(16 * 1024)))
+# "disconnect": the client reconnects and gets the gap replayed (see join_* last_seq)
+# "drop": the event is lost for that client
+SOCKET_SLOW_CONSUMER_POLICY = os.environ.get("SOCKET_SLOW_CONSUMER_POLICY", "disconnect")
+REFERENCE_FIELD_BYTES = 1024  # String fields above this are left out of reference-only emits
+
+def eio_packet_size(pkt) -> int:
+    return len(pkt.data) if isinstance(pkt.data, (str, bytes)) else 0
+
+class BackpressureServer(WireFormatServer):
+    """
+    Socket.IO server with bounded per-connection outbound queues
+    - Broadcasts to a lagging client (SOCKET_LAG_PACKETS queued) are downgraded to
+      reference-only copies when large: long fields such as base64 audio are left
+      out and listed in "omitted", the client fetches them over REST
+    - A client over SOCKET_QUEUE_MAX_PACKETS / SOCKET_QUEUE_MAX_BYTES has the event
+      dropped or is disconnected, depending on SOCKET_SLOW_CONSUMER_POLICY
+    """
+
+    def __init__(self, *args, slow_consumer_policy: str = "disconnect", **kwargs):
+        super().__init__(*args, **kwargs)
+        if slow_consumer_policy not in ("drop", "disconnect"):
+            raise ValueError(f"Unsupported slow consumer policy: {slow_consumer_policy}")
+        self.slow_consumer_policy = slow_consumer_policy
+        self.backpressure_counters = {"downgraded": 0, "dropped": 0, "disconnected": 0}
+
+    async def _send_eio_packet(self, eio_sid, eio_pkt):
+        socket = self.eio.sockets.get(eio_sid)
+        if socket is None or socket.queue.qsize() < SOCKET_LAG_PACKETS:
+            return await super()._send_eio_packet(eio_sid, eio_pkt)
+
+        if eio_packet_size(eio_pkt) >= SOCKET_LARGE_PAYLOAD_BYTES:
+            eio_pkt = self._reference_only(eio_pkt)
+            self.backpressure_counters["downgraded"] += 1
+
+        queued = list(socket.queue._queue)
+        queued_bytes = sum(eio_packet_size(p) for p in queued if p is not None)
+        if (len(queued) >= SOCKET_QUEUE_MAX_PACKETS
+                or queued_bytes + eio_packet_size(eio_pkt) > SOCKET_QUEUE_MAX_BYTES):
+            self.backpressure_counters["dropped"] += 1
+            if self.slow_consumer_policy == "disconnect" and not socket.closing:
+                self._disconnect_slow_consumer(socket)
+            return
+        await super()._send_eio_packet(eio_sid, eio_pkt)
+
+    def _reference_only(self, eio_pkt):
+        """Copy of a broadcast packet without its large fields, built once per broadcast"""
+        cached = getattr(eio_pkt, "reference_only", None)
+        if cached is not None:
+            return cached
+        reference = eio_pkt
+        if isinstance(eio_pkt.data, str):
+            pkt = self.packet_class(encoded_packet=eio_pkt.data)
+            if pkt.packet_type == socketio.packet.EVENT and len(pkt.data) == 2 and isinstance(pkt.data[1], dict):
+                event, payload = pkt.data
+                omitted = [k for k, v in payload.items()
+                           if isinstance(v, str) and len(v) > REFERENCE_FIELD_BYTES]
+                if omitted:
+                    payload = {**{k: v for k, v in payload.items() if k not in omitted}, "omitted": omitted}
+                    pkt = self.packet_class(socketio.packet.EVENT, data=[event, payload],
+                                            namespace=pkt.namespace, id=pkt.id)
+                    reference = engineio.packet.Packet(engineio.packet.MESSAGE, pkt.encode())
+        eio_pkt.reference_only = reference
+        return reference
+
+    def _disconnect_slow_consumer(self, socket):
+        """Free the queued packets now and close the connection in the background"""
+        self.backpressure_counters["disconnected"] += 1
+        while not socket.queue.empty():
+            socket.queue.get_nowait()
+            socket.queue.task_done()
+        self.start_background_task(self.eio.disconnect, socket.sid)
+
+    def backpressure_stats(self) -> dict:
+        depths = [socket.queue.qsize() for socket in list(self.eio.sockets.values())]
+        return {
+            "connections": len(depths),
+            "queued_packets": sum(depths),
+            "max_queue_depth": max(depths, default=0),
+            "lagging_connections": sum(1 for depth in depths if depth >= SOCKET_LAG_PACKETS),
+            "slow_consumer_policy": self.slow_consumer_policy,
+            **self.backpressure_counters,
+        }
+
+# ==================== SOCKET.IO BLOCK FILTER ====================
+
+# Broadcast events listing users, field -> key of the user id in each entry (None: the entry is the id)
+USER_LIST_EVENTS = {
+    'typing_update': {'typing': 'user_id', 'stopped': None},
+    'presence_update': {'joined': None, 'left': None},
+}
+
+def without_users(payload: dict, fields: dict, hidden: frozenset) -> Optional[dict]:
+    """Copy of a payload without the hidden users in its user lists, None if none is listed"""
+    def user_id(entry, key):
+        return entry.get(key) if key and isinstance(entry, dict) else entry
+    if not any(
+        user_id(entry, key) in hidden
+        for field, key in fields.items() for entry in payload.get(field) or []
+    ):
+        return None
+    return {
+        **payload,
+        **{
+            field: [entry for entry in payload.get(field) or [] if user_id(entry, key) not in hidden]
+            for field, key in fields.items() if field in payload
+        },
+    }
+
+class BlockFilterServer(BackpressureServer):
+    """
+    Socket.IO server that applies blocks to broadcasts, as BlockIndex does to lists
+    - Chat messages (COMPACT_EVENTS) are not delivered to users their author
+      blocked or was blocked by; the author's exclusions are looked up once per
+      broadcast
+    - Typing and presence updates are sent without the users the recipient
+      must not see (USER_LIST_EVENTS)
+    - Filtering happens on delivery, so each worker applies it to its own sockets
+    """
+
+    def _recipient(self, eio_sid) -> Optional[str]:
+        user = socket_sessions.get_user(self.manager.sid_from_eio_sid(eio_sid, '/'))
+        return user.id if user else None
+
+    async def _author_exclusions(self, eio_pkt) -> frozenset:
+        lookup = getattr(eio_pkt, "author_exclusions", None)
+        if lookup is None:
+            event, payload = self._event_of(eio_pkt)
+            author = payload.get("user_id") if event in COMPACT_EVENTS and isinstance(payload, dict) else None
+            # Shared by every recipient's delivery task of the broadcast
+            lookup = eio_pkt.author_exclusions = asyncio.ensure_future(
+                block_index.excluded(author) if author else asyncio.sleep(0, frozenset())
+            )
+        try:
+            return await lookup
+        except PyMongoError:
+            return frozenset()  # Delivered unfiltered rather than lost
+
+    async def _send_eio_packet(self, eio_sid, eio_pkt):
+        if not isinstance(eio_pkt.data, str):
+            return await super()._send_eio_packet(eio_sid, eio_pkt)
+        event, payload = self._event_of(eio_pkt)
+        if event in COMPACT_EVENTS:
+            if self._recipient(eio_sid) in await self._author_exclusions(eio_pkt):
+                return
+        elif event in USER_LIST_EVENTS and isinstance(payload, dict):
+            recipient = self._recipient(eio_sid)
+            try:
+                hidden = await block_index.excluded(recipient) if recipient else frozenset()
+            except PyMongoError:
+                hidden = frozenset()
+            filtered = without_users(payload, USER_LIST_EVENTS[event], hidden)
+            if filtered is not None:
+                pkt = eio_pkt.decoded[0]
+                eio_pkt = engineio.packet.Packet(engineio.packet.MESSAGE, self.packet_class(
+                    socketio.packet.EVENT, data=[event, filtered], namespace=pkt.namespace, id=pkt.id
+                ).encode())
+        await super()._send_eio_packet(eio_sid, eio_pkt)
+
 # Socket.IO setup
-sio = socketio.AsyncServer(
+SOCKETIO_DEBUG_LOG = os.environ.get("SOCKETIO_DEBUG_LOG", "false").lower() == "true"
+# Workers sharing a port (run_server.py) get each HTTP request from the OS in turn,
+# so a long-polling session would hop between workers: they only accept websocket
+SOCKETIO_TRANSPORTS = os.environ.get("SOCKETIO_TRANSPORTS", "polling,websocket").split(",")
+
+sio = BlockFilterServer(
+    slow_consumer_policy=SOCKET_SLOW_CONSUMER_POLICY,
     async_mode='asgi',
+    client_manager=socketio_manager,
     cors_allowed_origins='*',
-    logger=True,
-    engineio_logger=True
+    transports=SOCKETIO_TRANSPORTS,
+    # Per-packet logging is for debugging only, it costs CPU on every broadcast
+    logger=SOCKETIO_DEBUG_LOG,
+    engineio_logger=SOCKETIO_DEBUG_LOG
 )
 
 # Rate Limiter setup
 limiter = Limiter(key_func=get_remote_address)
 
+# One 60/minute budget per user for message sends, shared by the REST endpoints and Socket.IO
+MESSAGE_RATE_LIMIT = "60/minute"
+MESSAGE_RATE_LIMIT_SCOPE = "send_message"
+
+def user_rate_limit_key(user_id: str) -> str:
+    return f"user:{user_id}"
+
+def message_rate_limit_key(request: Request) -> str:
+    """The sender's user id from the bearer token (checked by get_current_user), else the IP"""
+    authorization = request.headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        try:
+            user_id = jwt.decode(authorization[7:], SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+            if user_id:
+                return user_rate_limit_key(user_id)
+        except JWTError:
+            pass
+    return get_remote_address(request)
+
+def limit_message_sends():
+    return limiter.shared_limit(MESSAGE_RATE_LIMIT, scope=MESSAGE_RATE_LIMIT_SCOPE, key_func=message_rate_limit_key)
+
 # Create the main app
 app = FastAPI()
 app.state.limiter = limiter
@@ -132,6 +551,14 @@ def validate_audio_data(audio_data: str) -> bool:
     
     return True
 
+# Sectors of the app (frontend/store/sectorStore.ts), sector-keyed caches only take these
+SECTORS = ("drivers", "sports", "science", "construction", "finance", "tourism", "food", "health", "music", "gaming")
+
+def validate_sector(sector: str) -> str:
+    if sector not in SECTORS:
+        raise HTTPException(status_code=400, detail="Unknown sector")
+    return sector
+
 # ==================== MODELS ====================
 
 class UserRegister(BaseModel):
@@ -163,8 +590,8 @@ class User(BaseModel):
     referral_count: int = 0
     friend_ids: List[str] = []
     sectors: List[str] = ["drivers"]  # New: which sectors user has joined
-    following_ids: List[str] = []  # Users this user follows
-    followers_ids: List[str] = []  # Users following this user
+    following_count: int = 0  # Kept in step with the follows collection
+    followers_count: int = 0
     blocked_user_ids: List[str] = []
     is_admin: bool = False
     push_token: Optional[str] = None
@@ -248,6 +675,10 @@ class Chat(BaseModel):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     last_message: Optional[str] = None
     last_message_time: Optional[datetime] = None
+    last_message_sender_id: Optional[str] = None
+    last_message_sender: Optional[str] = None
+    last_message_seq: Optional[int] = None
+    unread_count: int = 0  # For the requesting user
 
 class MessageCreate(BaseModel):
     chat_id: str
@@ -260,6 +691,7 @@ class Message(BaseModel):
     username: str
     content: str
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    seq: Optional[int] = None
 
 # ==================== NEW MODELS FOR PHASE 1-4 ====================
 
@@ -357,9 +789,8 @@ class Group(BaseModel):
     name: str
     description: Optional[str] = None
     creator_id: Optional[str] = None  # Optional for legacy groups
-    admin_ids: List[str] = []
-    moderator_ids: List[str] = []
-    member_ids: List[str] = []
+    member_count: int = 0  # Kept in step with group_memberships
+    my_role: Optional[str] = None  # Caller's role: admin, moderator, member or None
     requires_approval: bool = True
     sector: str = "drivers"  # Which sector this group belongs to
     created_at: datetime = Field(default_factory=datetime.utcnow)
@@ -381,6 +812,24 @@ class GroupJoinRequest(BaseModel):
 class GroupInvite(BaseModel):
     user_ids: List[str]
 
+class GroupMember(BaseModel):
+    id: str
+    username: str
+    full_name: Optional[str] = None
+    profile_picture: Optional[str] = None
+    role: str
+    joined_at: datetime
+
+class UserCard(BaseModel):
+    id: str
+    username: str
+    full_name: Optional[str] = None
+    profile_picture: Optional[str] = None
+
+class UserSuggestion(UserCard):
+    mutual_friends: int = 0
+    shared_groups: int = 0
+
 class PushTokenRegister(BaseModel):
     token: str
 
@@ -479,7 +928,10 @@ def create_access_token(data: dict):
     return encoded_jwt
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    token = credentials.credentials
+    return await authenticate_token(credentials.credentials)
+
+async def authenticate_token(token: str) -> User:
+    """Resolve a JWT to its user (shared by REST dependencies and Socket.IO connect)"""
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id: str = payload.get("sub")
@@ -491,6 +943,8 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     user = await db.users.find_one({"id": user_id})
     if user is None:
         raise HTTPException(status_code=401, detail="User not found")
+    if user.get("is_banned"):
+        raise HTTPException(status_code=403, detail="Account banned")
     
     return User(**user)
 
@@ -597,8 +1051,8 @@ async def register(request: Request, user_data: UserRegister):
         "invited_by": referrer_id,
         "referral_count": 0,
         "friend_ids": [],
-        "following_ids": [],
-        "followers_ids": [],
+        "following_count": 0,
+        "followers_count": 0,
         "is_admin": False,
         "user_type": user_data.user_type,
         "phone_number": user_data.phone_number,
@@ -610,6 +1064,7 @@ async def register(request: Request, user_data: UserRegister):
     }
     
     await db.users.insert_one(user_dict)
+    activity_rollups.record("users", user_data.current_sector)
     
     # Send verification email
     await send_verification_email(user_data.email, verification_code, user_data.username)
@@ -620,6 +1075,7 @@ async def register(request: Request, user_data: UserRegister):
             {"id": referrer_id},
             {"$inc": {"referral_count": 1}}
         )
+        await mark_graph_changed([user_id, referrer_id])
     
     # Create token
     access_token = create_access_token(data={"sub": user_id})
@@ -649,6 +1105,7 @@ async def login(request: Request, user_data: UserLogin):
             {"id": user["id"]},
             {"$addToSet": {"sectors": user_data.current_sector}}
         )
+        await mark_graph_changed([user["id"]])
         user_sectors.append(user_data.current_sector)
         user["sectors"] = user_sectors
     
@@ -736,9 +1193,11 @@ async def delete_account(current_user: User = Depends(get_current_user)):
     await db.comments.delete_many({"user_id": current_user.id})
     
     # Delete user's messages
-    await db.messages.delete_many({"user_id": current_user.id})
+    await message_store.delete_by_user("messages", current_user.id)
     
     # Remove user from chats
+    for chat_id in await db.chats.distinct("id", {"members": current_user.id}):
+        membership_index.invalidate("chat", chat_id)
     await db.chats.update_many(
         {"members": current_user.id},
         {"$pull": {"members": current_user.id}}
@@ -747,6 +1206,13 @@ async def delete_account(current_user: User = Depends(get_current_user)):
     # Delete chats with no members
     await db.chats.delete_many({"members": {"$size": 0}})
     
+    # Leave groups
+    async for membership in db.group_memberships.find({"user_id": current_user.id}, {"_id": 0, "group_id": 1}):
+        await remove_group_member(membership["group_id"], current_user.id)
+    await db.group_recommendations.delete_many({"user_id": current_user.id})
+    await db.user_suggestions.delete_many({"user_id": current_user.id})
+    await db.user_stats.delete_one({"_id": current_user.id})
+    
     # Delete friend requests
     await db.friend_requests.delete_many({
         "$or": [
@@ -756,11 +1222,25 @@ async def delete_account(current_user: User = Depends(get_current_user)):
     })
     
     # Remove from friends lists
+    await mark_graph_changed(current_user.friend_ids)
+    friend_graph.invalidate([current_user.id] + current_user.friend_ids)
     await db.users.update_many(
         {"friend_ids": current_user.id},
         {"$pull": {"friend_ids": current_user.id}}
     )
     
+    # Remove follows both ways
+    await db.users.update_many(
+        {"id": {"$in": await following_ids(current_user.id)}},
+        {"$inc": {"followers_count": -1}}
+    )
+    followers = await db.follows.find({"followee_id": current_user.id}, {"_id": 0, "follower_id": 1}).to_list(None)
+    await db.users.update_many(
+        {"id": {"$in": [edge["follower_id"] for edge in followers]}},
+        {"$inc": {"following_count": -1}}
+    )
+    await db.follows.delete_many({"$or": [{"follower_id": current_user.id}, {"followee_id": current_user.id}]})
+    
     # Finally delete user
     await db.users.delete_one({"id": current_user.id})
     
@@ -828,8 +1308,480 @@ async def unregister_push_token(current_user: User = Depends(get_current_user)):
     )
     return {"message": "Push token unregistered successfully"}
 
+# ==================== CACHING ====================
+
+class TTLCache:
+    """
+    In-process cache of the indexes below (BlockIndex, FriendGraphCache,
+    MembershipIndex): entries expire after the TTL they were stored with, the
+    least recently used go first beyond max_entries
+    """
+    MISSING = object()
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self.stats = {"hits": 0, "misses": 0}
+
+    def get(self, key):
+        """The cached value, MISSING if absent or expired"""
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < asyncio.get_running_loop().time():
+            self.stats["misses"] += 1
+            return self.MISSING
+        self._entries.move_to_end(key)
+        self.stats["hits"] += 1
+        return entry[1]
+
+    def put(self, key, value, ttl: float):
+        self._entries[key] = (asyncio.get_running_loop().time() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def pop(self, key):
+        self._entries.pop(key, None)
+
+    def pop_where(self, predicate):
+        for key in [key for key in self._entries if predicate(key)]:
+            del self._entries[key]
+
+    def __len__(self):
+        return len(self._entries)
+
+# ==================== BLOCKING ====================
+
+BLOCK_OVERFETCH = 2  # First key window of find_visible, as a multiple of the rows needed
+
+class BlockIndex:
+    """
+    Users someone must not see, both ways: the ones they blocked and the ones
+    who blocked them
+    - Cached per user in a TTLCache; block and
+      unblock through this worker invalidate both users, other workers pick
+      changes up within BLOCK_CACHE_TTL seconds
+    - List endpoints drop excluded authors after the query (find_visible), so
+      their indexes keep working instead of carrying a $nin of every block
+    """
+
+    def __init__(self, ttl: float = 60, max_entries: int = 50000):
+        self.ttl = ttl
+        self.cache = TTLCache(max_entries)  # user_id -> frozenset of user ids
+        self.stats = self.cache.stats
+
+    async def excluded(self, user_id: str) -> frozenset:
+        excluded = self.cache.get(user_id)
+        if excluded is not TTLCache.MISSING:
+            return excluded
+        user, blockers = await asyncio.gather(
+            db.users.find_one({"id": user_id}, {"_id": 0, "blocked_user_ids": 1}),
+            db.users.find({"blocked_user_ids": user_id}, {"_id": 0, "id": 1}).to_list(None)
+        )
+        excluded = frozenset((user or {}).get("blocked_user_ids") or []) | {blocker["id"] for blocker in blockers}
+        self.cache.put(user_id, excluded, self.ttl)
+        return excluded
+
+    def invalidate(self, user_ids: List[str]):
+        for user_id in user_ids:
+            self.cache.pop(user_id)
+
+block_index = BlockIndex(
+    ttl=float(os.environ.get("BLOCK_CACHE_TTL", "60")),
+    max_entries=int(os.environ.get("BLOCK_CACHE_SIZE", "50000"))
+)
+
+async def find_visible(
+    collection,
+    query: dict,
+    sort: Optional[list],
+    skip: int,
+    limit: int,
+    excluded: frozenset,
+    author_field: str = "user_id"
+) -> List[dict]:
+    """
+    One page of a query without documents by excluded users; skip counts
+    visible documents, so pages stay full and don't overlap
+    - Keys (_id and author) are over-fetched in a growing window until the page
+      is covered, then only the page's documents are read in full
+    """
+    if not excluded:
+        cursor = collection.find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        return await cursor.skip(skip).limit(limit).to_list(limit)
+    
+    needed = skip + limit
+    window = needed * BLOCK_OVERFETCH
+    while True:
+        cursor = collection.find(query, {"_id": 1, author_field: 1})
+        if sort:
+            cursor = cursor.sort(sort)
+        keys = await cursor.limit(window).to_list(window)
+        visible = [key["_id"] for key in keys if key.get(author_field) not in excluded]
+        if len(visible) >= needed or len(keys) < window:
+            break
+        window *= 2
+    
+    page = visible[skip:needed]
+    docs = await collection.find({"_id": {"$in": page}}).to_list(len(page))
+    docs_by_id = {doc["_id"]: doc for doc in docs}
+    return [docs_by_id[key] for key in page if key in docs_by_id]
+
+# ==================== USER STATS ====================
+
+# user_stats {_id: user_id, posts_count, comments_count, groups_created};
+# follower/following/referral counts stay on the user document
+USER_STATS_FIELDS = ("posts_count", "comments_count", "groups_created")
+USER_STATS_INTERVAL = float(os.environ.get("USER_STATS_INTERVAL", "3600"))  # Seconds between reconciliations
+
+async def bump_user_stats(user_id: str, **deltas: int):
+    """Apply counter changes of one user, e.g. bump_user_stats(uid, posts_count=1)"""
+    await db.user_stats.update_one(
+        {"_id": user_id},
+        {"$inc": deltas, "$set": {"updated_at": datetime.utcnow()}},
+        upsert=True
+    )
+
+async def get_user_stats(user_id: str) -> dict:
+    stats = await db.user_stats.find_one({"_id": user_id}) or {}
+    return {field: stats.get(field, 0) for field in USER_STATS_FIELDS}
+
+async def delete_post_comments(post_id: str):
+    """Delete a post's comments, taking them off their authors' counts"""
+    authors = await db.comments.aggregate([
+        {"$match": {"post_id": post_id}},
+        {"$group": {"_id": "$user_id", "count": {"$sum": 1}}},
+    ]).to_list(None)
+    await db.comments.delete_many({"post_id": post_id})
+    if authors:
+        await db.user_stats.bulk_write([
+            UpdateOne({"_id": author["_id"]}, {"$inc": {"comments_count": -author["count"]}})
+            for author in authors
+        ], ordered=False)
+
+async def delete_post_and_comments(post_id: str) -> bool:
+    """
+    Delete a post and its comments, taking them off their authors' counts;
+    False if it was already gone, so concurrent deletes count it once
+    """
+    await db.posts.delete_one({"id": post_id})
+    post = await db.posts_enhanced.find_one_and_delete({"id": post_id}, {"_id": 0, "user_id": 1})
+    if post is None:
+        return False
+    await bump_user_stats(post["user_id"], posts_count=-1)
+    await delete_post_comments(post_id)
+    return True
+
+class UserStatsReconciler:
+    """
+    Recounts every user's stats by aggregation, run every USER_STATS_INTERVAL
+    seconds by the worker holding the lease (and right after startup, which
+    also backfills user_stats)
+    - Fixes user_stats and the followers_count/following_count/referral_count
+      of user documents where the incremental updates drifted
+    - Updates that land while it runs can be undone until the next run
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.owner = f"{os.uname().nodename}:{os.getpid()}"
+        self.stats = {"runs": 0, "fixed": 0, "last_run_at": None, "last_duration": None, "last_error": None}
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def run(self):
+        while True:
+            try:
+                if await acquire_lease("user_stats", self.owner, self.interval * 2):
+                    await self.reconcile()
+            except Exception as e:
+                self.stats["last_error"] = str(e)
+                logger.error(f"User stats reconciliation failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def _counts(self, collection, field: str) -> dict:
+        rows = await collection.aggregate([{"$group": {"_id": f"${field}", "count": {"$sum": 1}}}]).to_list(None)
+        return {row["_id"]: row["count"] for row in rows}
+
+    async def reconcile(self) -> int:
+        """Rewrite every count that differs from the source collections, returns how many users were fixed"""
+        started_at = datetime.utcnow()
+        started = asyncio.get_running_loop().time()
+        posts, comments, groups, followers, following, referrals = await asyncio.gather(
+            self._counts(db.posts_enhanced, "user_id"),
+            self._counts(db.comments, "user_id"),
+            self._counts(db.groups, "creator_id"),
+            self._counts(db.follows, "followee_id"),
+            self._counts(db.follows, "follower_id"),
+            self._counts(db.users, "invited_by")
+        )
+        stored = {doc["_id"]: doc async for doc in db.user_stats.find({})}
+
+        fixed = set()
+        stats_writes = []
+        user_writes = []
+        async for user in db.users.find({}, {
+            "_id": 0, "id": 1, "followers_count": 1, "following_count": 1, "referral_count": 1
+        }):
+            user_id = user["id"]
+            expected = {
+                "posts_count": posts.get(user_id, 0),
+                "comments_count": comments.get(user_id, 0),
+                "groups_created": groups.get(user_id, 0),
+            }
+            current = stored.pop(user_id, {})
+            if any(current.get(field) != value for field, value in expected.items()):
+                stats_writes.append(UpdateOne(
+                    {"_id": user_id}, {"$set": {**expected, "updated_at": started_at}}, upsert=True
+                ))
+                fixed.add(user_id)
+            expected = {
+                "followers_count": followers.get(user_id, 0),
+                "following_count": following.get(user_id, 0),
+                "referral_count": referrals.get(user_id, 0),
+            }
+            if any(user.get(field, 0) != value for field, value in expected.items()):
+                user_writes.append(UpdateOne({"id": user_id}, {"$set": expected}))
+                fixed.add(user_id)
+        if stats_writes:
+            await db.user_stats.bulk_write(stats_writes, ordered=False)
+        if user_writes:
+            await db.users.bulk_write(user_writes, ordered=False)
+        # Stats of deleted users
+        if stored:
+            await db.user_stats.delete_many({"_id": {"$in": list(stored)}})
+
+        self.stats["runs"] += 1
+        self.stats["fixed"] = len(fixed)
+        self.stats["last_run_at"] = started_at.isoformat()
+        self.stats["last_duration"] = round(asyncio.get_running_loop().time() - started, 3)
+        if fixed:
+            logger.info(f"User stats reconciliation fixed {len(fixed)} user(s)")
+        return len(fixed)
+
+user_stats_reconciler = UserStatsReconciler(USER_STATS_INTERVAL)
+
+# ==================== ACTIVITY ROLLUPS ====================
+
+# activity_rollups {_id: "<granularity>:<sector>:<start>", granularity, sector, start,
+# users, posts, comments, messages, reports}: how many of each were created per
+# sector and hour/day, see migrate_activity_rollups.py for the backfill
+ACTIVITY_METRICS = ("users", "posts", "comments", "messages", "reports")
+ACTIVITY_GRANULARITIES = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+ACTIVITY_NO_SECTOR = "none"  # Reports aren't tied to a sector
+ACTIVITY_FLUSH_INTERVAL = float(os.environ.get("ACTIVITY_FLUSH_INTERVAL", "5"))  # Seconds between bucket writes
+ACTIVITY_SERIES_DEFAULT_POINTS = {"hour": 48, "day": 30}
+ACTIVITY_SERIES_MAX_POINTS = 2000
+ACTIVITY_SECTOR_CACHE_SIZE = 10000
+
+def activity_bucket_start(at: datetime, granularity: str) -> datetime:
+    if granularity == "day":
+        return at.replace(hour=0, minute=0, second=0, microsecond=0)
+    return at.replace(minute=0, second=0, microsecond=0)
+
+class ActivityRollups:
+    """
+    Hourly and daily per-sector counters of created users, posts, comments,
+    messages and reports, fed by the write paths
+    - record() only counts in memory; every ACTIVITY_FLUSH_INTERVAL seconds one
+      $inc upsert per touched bucket is written, unordered: buckets whose
+      write failed keep their counts for the next flush, the others are done
+    - The loop, stop() and the chart reads share one shielded write (flush())
+    - Deletions aren't subtracted, buckets count what was created
+    - Charts read the buckets, never the source collections
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stats = {"flushes": 0, "buckets_written": 0, "last_error": None}
+        self._pending = {}  # (sector, hour start) -> {metric: count}
+        self._failed = {}  # (granularity, sector, start) -> {metric: count} not written yet
+        self._sectors = {}  # (collection, id) -> sector of a group or chat
+        self._task = None
+        self._flushing = None
+
+    def record(self, metric: str, sector: Optional[str], count: int = 1):
+        key = (sector or ACTIVITY_NO_SECTOR, activity_bucket_start(datetime.utcnow(), "hour"))
+        counts = self._pending.setdefault(key, {})
+        counts[metric] = counts.get(metric, 0) + count
+
+    async def container_sector(self, collection: str, container_id: str) -> str:
+        """Sector of a group or chat, cached as it never changes"""
+        key = (collection, container_id)
+        sector = self._sectors.get(key)
+        if sector is None:
+            doc = await db[collection].find_one({"id": container_id}, {"_id": 0, "sector": 1}) or {}
+            sector = doc.get("sector", "drivers")
+            if len(self._sectors) >= ACTIVITY_SECTOR_CACHE_SIZE:
+                self._sectors.clear()
+            self._sectors[key] = sector
+        return sector
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["last_error"] = str(e)
+                logger.error(f"Activity rollup flush failed: {e}")
+
+    def _requeue(self, buckets: dict):
+        """Keep the counts of unwritten buckets for the next flush"""
+        for key, counts in buckets.items():
+            merged = self._failed.setdefault(key, {})
+            for metric, count in counts.items():
+                merged[metric] = merged.get(metric, 0) + count
+
+    async def flush(self):
+        """
+        Write the counts recorded so far into their hour and day buckets
+        - Joins the write in progress, then starts one for what is left: one
+          write at a time, and a read after flush() sees every count recorded
+          before it
+        - Shielded, so a cancelled caller (a request, the stopped loop) never
+          abandons a write whose counts were already taken out of _pending
+        """
+        if self._flushing is not None and not self._flushing.done():
+            await asyncio.shield(self._flushing)
+        if self._pending or self._failed:
+            if self._flushing is None or self._flushing.done():
+                self._flushing = asyncio.ensure_future(self._write())
+            await asyncio.shield(self._flushing)
+
+    async def _write(self):
+        if not self._pending and not self._failed:
+            return
+        pending, self._pending = self._pending, {}
+        buckets, self._failed = self._failed, {}
+        for (sector, hour), counts in pending.items():
+            for granularity in ACTIVITY_GRANULARITIES:
+                start = activity_bucket_start(hour, granularity)
+                bucket = buckets.setdefault((granularity, sector, start), {})
+                for metric, count in counts.items():
+                    bucket[metric] = bucket.get(metric, 0) + count
+        keys = list(buckets)
+        try:
+            await db.activity_rollups.bulk_write([
+                UpdateOne(
+                    {"_id": f"{granularity}:{sector}:{start.isoformat()}"},
+                    {
+                        "$inc": buckets[(granularity, sector, start)],
+                        "$setOnInsert": {"granularity": granularity, "sector": sector, "start": start},
+                    },
+                    upsert=True
+                )
+                for granularity, sector, start in keys
+            ], ordered=False)
+        except BulkWriteError as e:
+            # Unordered: every bucket without a write error was incremented
+            failed = {keys[error["index"]] for error in e.details.get("writeErrors", [])}
+            self._requeue({key: buckets[key] for key in failed})
+            self.stats["buckets_written"] += len(keys) - len(failed)
+            self.stats["last_error"] = str(e)
+            logger.error(f"Activity rollup flush failed for {len(failed)} bucket(s): {e}")
+            return
+        except Exception as e:
+            # Nothing is known to be written, counted again with what was recorded meanwhile
+            self._requeue(buckets)
+            self.stats["last_error"] = str(e)
+            logger.error(f"Activity rollup flush failed: {e}")
+            return
+        self.stats["flushes"] += 1
+        self.stats["buckets_written"] += len(keys)
+
+    async def series(self, granularity: str, start: datetime, end: datetime, sector: Optional[str] = None) -> List[dict]:
+        """One point per bucket in [start, end), summed over sectors unless one is given, gaps as zeros"""
+        await self.flush()
+        start = activity_bucket_start(start, granularity)
+        query = {"granularity": granularity, "start": {"$gte": start, "$lt": end}}
+        if sector is not None:
+            query["sector"] = sector
+        totals = {}
+        async for bucket in db.activity_rollups.find(query, {"_id": 0, "sector": 0, "granularity": 0}):
+            point = totals.setdefault(bucket["start"], dict.fromkeys(ACTIVITY_METRICS, 0))
+            for metric in ACTIVITY_METRICS:
+                point[metric] += bucket.get(metric, 0)
+        points = []
+        step = ACTIVITY_GRANULARITIES[granularity]
+        while start < end:
+            points.append({"start": start.isoformat(), **totals.get(start, dict.fromkeys(ACTIVITY_METRICS, 0))})
+            start += step
+        return points
+
+    async def totals(self, since: datetime, sector: Optional[str] = None) -> dict:
+        """Counts since a time (to the hour), summed over its hour buckets"""
+        await self.flush()
+        query = {"granularity": "hour", "start": {"$gte": activity_bucket_start(since, "hour")}}
+        if sector is not None:
+            query["sector"] = sector
+        totals = dict.fromkeys(ACTIVITY_METRICS, 0)
+        async for bucket in db.activity_rollups.find(query, {"_id": 0, **dict.fromkeys(ACTIVITY_METRICS, 1)}):
+            for metric in ACTIVITY_METRICS:
+                totals[metric] += bucket.get(metric, 0)
+        return totals
+
+    async def ensure_indexes(self):
+        await db.activity_rollups.create_index([("granularity", 1), ("start", 1)])
+        await db.activity_rollups.create_index([("granularity", 1), ("sector", 1), ("start", 1)])
+
+    def get_stats(self) -> dict:
+        return {
+            "pending_buckets": len(self._pending),
+            "failed_buckets": len(self._failed),
+            "cached_sectors": len(self._sectors),
+            **self.stats,
+        }
+
+activity_rollups = ActivityRollups(ACTIVITY_FLUSH_INTERVAL)
+
 # ==================== USER ROUTES ====================
 
+# Before /users/{user_id}, which would match it
+@api_router.get("/users/suggestions", response_model=List[UserSuggestion])
+async def get_user_suggestions(sector: str = "drivers", limit: int = 20, current_user: User = Depends(get_current_user)):
+    """People you may know in a sector, best first (see FriendSuggestions)"""
+    # Friends and blocks made since the last run are left out here
+    excluded = set(current_user.friend_ids) | set(current_user.blocked_user_ids)
+    picks = [
+        suggestion for suggestion in await friend_suggestions.suggestions(current_user.id, sector)
+        if suggestion["id"] not in excluded
+    ][:min(max(limit, 1), SUGGESTION_LIMIT)]
+    users = await db.users.find(
+        {"id": {"$in": [suggestion["id"] for suggestion in picks]}},
+        {"_id": 0, "id": 1, "username": 1, "full_name": 1, "profile_picture": 1}
+    ).to_list(None)
+    users_by_id = {user["id"]: user for user in users}
+    return [
+        UserSuggestion(
+            **users_by_id[suggestion["id"]],
+            mutual_friends=suggestion["mutual_friends"],
+            shared_groups=suggestion["shared_groups"]
+        )
+        for suggestion in picks if suggestion["id"] in users_by_id
+    ]
+
 @api_router.get("/users/{user_id}")
 async def get_user(user_id: str, current_user: User = Depends(get_current_user)):
     user = await db.users.find_one({"id": user_id})
@@ -840,23 +1792,30 @@ async def get_user(user_id: str, current_user: User = Depends(get_current_user))
     referral_count = user.get("referral_count", 0)
     star_info = calculate_star_level(referral_count)
     
-    # Add star info to user response
+    # Add star info and stats to user response
     user_data = {k: v for k, v in user.items() if k not in ['password', '_id']}
     user_data['star_level'] = star_info
+    user_data['stats'] = {
+        **await get_user_stats(user_id),
+        "friends_count": len(user.get("friend_ids", [])),
+        "followers_count": user.get("followers_count", 0),
+        "following_count": user.get("following_count", 0),
+        "referrals_count": referral_count,
+    }
     
     return user_data
 
 @api_router.get("/users", response_model=List[User])
 async def search_users(q: str = "", current_user: User = Depends(get_current_user)):
+    query = {}
     if q:
-        users = await db.users.find({
+        query = {
             "$or": [
                 {"username": {"$regex": q, "$options": "i"}},
                 {"full_name": {"$regex": q, "$options": "i"}}
             ]
-        }).to_list(50)
-    else:
-        users = await db.users.find().limit(50).to_list(50)
+        }
+    users = await find_visible(db.users, query, None, 0, 50, await block_index.excluded(current_user.id), author_field="id")
     
     return [User(**{k: v for k, v in user.items() if k != 'password'}) for user in users]
 
@@ -871,6 +1830,8 @@ async def block_user(user_id: str, current_user: User = Depends(get_current_user
         {"id": current_user.id},
         {"$addToSet": {"blocked_user_ids": user_id}}
     )
+    await mark_graph_changed([current_user.id])
+    block_index.invalidate([current_user.id, user_id])
     
     return {"message": "User blocked successfully"}
 
@@ -881,6 +1842,8 @@ async def unblock_user(user_id: str, current_user: User = Depends(get_current_us
         {"id": current_user.id},
         {"$pull": {"blocked_user_ids": user_id}}
     )
+    await mark_graph_changed([current_user.id])
+    block_index.invalidate([current_user.id, user_id])
     
     return {"message": "User unblocked successfully"}
 
@@ -898,37 +1861,66 @@ async def get_blocked_users(current_user: User = Depends(get_current_user)):
 
 # ==================== FOLLOW ROUTES ====================
 
+# One document per edge in follows {follower_id, followee_id, created_at};
+# users keep followers_count/following_count (see migrate_follows.py)
+FOLLOW_PAGE_SIZE = 50
+
+class FollowPage(BaseModel):
+    users: List[UserCard]
+    next_cursor: Optional[str] = None  # Pass back as cursor for the next page
+
+async def following_ids(user_id: str) -> List[str]:
+    """Ids of the users someone follows (covered by the follower_id/followee_id index)"""
+    edges = await db.follows.find({"follower_id": user_id}, {"_id": 0, "followee_id": 1}).to_list(None)
+    return [edge["followee_id"] for edge in edges]
+
+async def follow_page(field: str, user_id: str, cursor: Optional[str], limit: int) -> FollowPage:
+    """Newest edges first; field is the side user_id is on, the cards are the other side"""
+    other = "follower_id" if field == "followee_id" else "followee_id"
+    query = {field: user_id}
+    if cursor:
+        if not ObjectId.is_valid(cursor):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query["_id"] = {"$lt": ObjectId(cursor)}
+    limit = min(max(limit, 1), 200)
+    edges = await db.follows.find(query, {other: 1}).sort("_id", -1).limit(limit).to_list(limit)
+    users = await db.users.find(
+        {"id": {"$in": [edge[other] for edge in edges]}},
+        {"_id": 0, "id": 1, "username": 1, "full_name": 1, "profile_picture": 1}
+    ).to_list(None)
+    users_by_id = {user["id"]: user for user in users}
+    return FollowPage(
+        users=[UserCard(**users_by_id[edge[other]]) for edge in edges if edge[other] in users_by_id],
+        next_cursor=str(edges[-1]["_id"]) if len(edges) == limit else None
+    )
+
 @api_router.post("/users/{user_id}/follow")
 @limiter.limit("100/minute")  # Max 100 follow/unfollow per minute
 async def follow_user(request: Request, user_id: str, current_user: User = Depends(get_current_user)):
-    """Follow a user"""
+    """Follow a user (following twice is a no-op)"""
     # Can't follow yourself
     if user_id == current_user.id:
         raise HTTPException(status_code=400, detail="Cannot follow yourself")
     
     # Check if user exists
-    target_user = await db.users.find_one({"id": user_id})
-    if not target_user:
+    if not await db.users.find_one({"id": user_id}, {"_id": 1}):
         raise HTTPException(status_code=404, detail="User not found")
     
-    # Check if already following
-    current_user_data = await db.users.find_one({"id": current_user.id})
-    following_ids = current_user_data.get("following_ids", [])
-    
-    if user_id in following_ids:
-        raise HTTPException(status_code=400, detail="Already following this user")
-    
-    # Add to following list
-    await db.users.update_one(
-        {"id": current_user.id},
-        {"$push": {"following_ids": user_id}}
-    )
-    
-    # Add to followers list
-    await db.users.update_one(
-        {"id": user_id},
-        {"$push": {"followers_ids": current_user.id}}
-    )
+    # Only a new edge moves the counts
+    try:
+        result = await db.follows.update_one(
+            {"follower_id": current_user.id, "followee_id": user_id},
+            {"$setOnInsert": {"created_at": datetime.utcnow()}},
+            upsert=True
+        )
+        created = result.upserted_id is not None
+    except DuplicateKeyError:
+        # A concurrent follow of the same user won
+        created = False
+    if created:
+        await db.users.update_one({"id": current_user.id}, {"$inc": {"following_count": 1}})
+        await db.users.update_one({"id": user_id}, {"$inc": {"followers_count": 1}})
+        await mark_graph_changed([current_user.id, user_id])
     
     return {
         "message": "Successfully followed user",
@@ -939,22 +1931,16 @@ async def follow_user(request: Request, user_id: str, current_user: User = Depen
 @api_router.delete("/users/{user_id}/follow")
 @limiter.limit("100/minute")
 async def unfollow_user(request: Request, user_id: str, current_user: User = Depends(get_current_user)):
-    """Unfollow a user"""
+    """Unfollow a user (unfollowing twice is a no-op)"""
     # Can't unfollow yourself
     if user_id == current_user.id:
         raise HTTPException(status_code=400, detail="Cannot unfollow yourself")
     
-    # Remove from following list
-    await db.users.update_one(
-        {"id": current_user.id},
-        {"$pull": {"following_ids": user_id}}
-    )
-    
-    # Remove from followers list
-    await db.users.update_one(
-        {"id": user_id},
-        {"$pull": {"followers_ids": current_user.id}}
-    )
+    result = await db.follows.delete_one({"follower_id": current_user.id, "followee_id": user_id})
+    if result.deleted_count:
+        await db.users.update_one({"id": current_user.id}, {"$inc": {"following_count": -1}})
+        await db.users.update_one({"id": user_id}, {"$inc": {"followers_count": -1}})
+        await mark_graph_changed([current_user.id, user_id])
     
     return {
         "message": "Successfully unfollowed user",
@@ -962,35 +1948,34 @@ async def unfollow_user(request: Request, user_id: str, current_user: User = Dep
         "following": False
     }
 
-@api_router.get("/users/{user_id}/followers", response_model=List[User])
-async def get_followers(user_id: str, current_user: User = Depends(get_current_user)):
-    """Get list of users following this user"""
-    user = await db.users.find_one({"id": user_id})
-    if not user:
+@api_router.get("/users/{user_id}/followers", response_model=FollowPage)
+async def get_followers(
+    user_id: str,
+    cursor: Optional[str] = None,
+    limit: int = FOLLOW_PAGE_SIZE,
+    current_user: User = Depends(get_current_user)
+):
+    """Get users following this user, newest first"""
+    if not await db.users.find_one({"id": user_id}, {"_id": 1}):
         raise HTTPException(status_code=404, detail="User not found")
-    
-    followers_ids = user.get("followers_ids", [])
-    
-    if not followers_ids:
-        return []
-    
-    followers = await db.users.find({"id": {"$in": followers_ids}}).to_list(200)
-    return [User(**{k: v for k, v in user.items() if k != 'password'}) for user in followers]
+    return await follow_page("followee_id", user_id, cursor, limit)
 
-@api_router.get("/users/{user_id}/following", response_model=List[User])
-async def get_following(user_id: str, current_user: User = Depends(get_current_user)):
-    """Get list of users this user is following"""
-    user = await db.users.find_one({"id": user_id})
-    if not user:
+@api_router.get("/users/{user_id}/following", response_model=FollowPage)
+async def get_following(
+    user_id: str,
+    cursor: Optional[str] = None,
+    limit: int = FOLLOW_PAGE_SIZE,
+    current_user: User = Depends(get_current_user)
+):
+    """Get users this user is following, newest first"""
+    if not await db.users.find_one({"id": user_id}, {"_id": 1}):
         raise HTTPException(status_code=404, detail="User not found")
-    
-    following_ids = user.get("following_ids", [])
-    
-    if not following_ids:
-        return []
-    
-    following = await db.users.find({"id": {"$in": following_ids}}).to_list(200)
-    return [User(**{k: v for k, v in user.items() if k != 'password'}) for user in following]
+    return await follow_page("follower_id", user_id, cursor, limit)
+
+@api_router.get("/users/me/following/ids", response_model=List[str])
+async def get_my_following_ids(current_user: User = Depends(get_current_user)):
+    """Ids of the users you follow, for follow buttons"""
+    return await following_ids(current_user.id)
 
 # ==================== REPORT ROUTES ====================
 
@@ -1017,6 +2002,7 @@ async def create_report(report_data: ReportCreate, current_user: User = Depends(
     }
     
     await db.reports.insert_one(report_dict)
+    activity_rollups.record("reports", None)
     return Report(**report_dict)
 
 @api_router.get("/reports", response_model=List[Report])
@@ -1093,7 +2079,7 @@ async def create_post(request: Request, post_data: PostCreate, current_user: Use
 
 @api_router.get("/posts", response_model=List[Post])
 async def get_posts(skip: int = 0, limit: int = 20, current_user: User = Depends(get_current_user)):
-    posts = await db.posts.find().sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
+    posts = await find_visible(db.posts, {}, [("created_at", -1)], skip, limit, await block_index.excluded(current_user.id))
     return [Post(**post) for post in posts]
 
 @api_router.get("/posts/user/{user_id}", response_model=List[Post])
@@ -1155,6 +2141,8 @@ async def create_comment(request: Request, post_id: str, comment_data: CommentCr
     }
     
     await db.comments.insert_one(comment_dict)
+    await bump_user_stats(current_user.id, comments_count=1)
+    activity_rollups.record("comments", post.get("sector", "drivers"))
     
     # Update comments count in both collections
     await db.posts.update_one(
@@ -1192,7 +2180,9 @@ async def create_comment(request: Request, post_id: str, comment_data: CommentCr
 
 @api_router.get("/posts/{post_id}/comments", response_model=List[Comment])
 async def get_comments(post_id: str, current_user: User = Depends(get_current_user)):
-    comments = await db.comments.find({"post_id": post_id}).sort("created_at", 1).to_list(1000)
+    comments = await find_visible(
+        db.comments, {"post_id": post_id}, [("created_at", 1)], 0, 1000, await block_index.excluded(current_user.id)
+    )
     return [Comment(**comment) for comment in comments]
 
 # ==================== CHAT ROUTES ====================
@@ -1207,6 +2197,10 @@ class ChatCreateSimple(BaseModel):
     members: List[str] = []
     sector: str = "drivers"
 
+def direct_chat_key(sector: str, user_a: str, user_b: str) -> str:
+    """Canonical key of the 1-1 chat between two users in a sector (unique index)"""
+    return ":".join([sector, *sorted([user_a, user_b])])
+
 @api_router.post("/chats", response_model=Chat)
 async def create_chat(
     chat_request: ChatCreateSimple,
@@ -1218,22 +2212,20 @@ async def create_chat(
     members = chat_request.members
     # Support both simple user_id (for 1-1 chat) and full ChatCreate (for groups)
     if user_id:
-        # Simple 1-1 chat
-        # Check if chat already exists in the same sector
-        existing_chat = await db.chats.find_one({
-            "is_group": False,
-            "members": {"$all": [current_user.id, user_id]},
-            "sector": chat_request.sector
-        })
+        if user_id in await block_index.excluded(current_user.id):
+            raise HTTPException(status_code=403, detail="Cannot chat with this user")
         
+        # Simple 1-1 chat, one per pair of users and sector
+        pair_key = direct_chat_key(chat_request.sector, current_user.id, user_id)
+        existing_chat = await db.chats.find_one({"pair_key": pair_key})
         if existing_chat:
             return Chat(**existing_chat)
         
-        # Create new 1-1 chat
         other_user = await db.users.find_one({"id": user_id})
         if not other_user:
             raise HTTPException(status_code=404, detail="User not found")
         
+        # Get-or-create in one upsert, concurrent requests end up with the same chat
         chat_id = str(datetime.utcnow().timestamp()).replace(".", "")
         chat_dict = {
             "id": chat_id,
@@ -1245,6 +2237,17 @@ async def create_chat(
             "last_message": None,
             "last_message_time": None
         }
+        try:
+            chat = await db.chats.find_one_and_update(
+                {"pair_key": pair_key},
+                {"$setOnInsert": chat_dict},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Lost the race against another upsert of the same pair
+            chat = await db.chats.find_one({"pair_key": pair_key})
+        return Chat(**chat)
     else:
         # Group chat
         chat_id = str(datetime.utcnow().timestamp()).replace(".", "")
@@ -1262,30 +2265,149 @@ async def create_chat(
         }
     
     await db.chats.insert_one(chat_dict)
+    membership_index.invalidate("chat", chat_id)
     return Chat(**chat_dict)
 
 @api_router.get("/chats", response_model=List[Chat])
 async def get_chats(sector: str = "drivers", current_user: User = Depends(get_current_user)):
-    chats = await db.chats.find({"members": current_user.id, "sector": sector}).sort("last_message_time", -1).to_list(100)
-    return [Chat(**chat) for chat in chats]
+    # Everything the inbox needs is kept on the chat documents (see ChatSummaryWriter)
+    chats = await db.chats.find(
+        {"members": current_user.id, "sector": sector},
+        {"_id": 0, "read_seq": 0}
+    ).sort("last_message_time", -1).to_list(100)
+    return [
+        Chat(**chat, unread_count=chat.get("unread_counts", {}).get(current_user.id, 0))
+        for chat in chats
+    ]
+
+@api_router.post("/chats/{chat_id}/read")
+async def mark_chat_read(chat_id: str, current_user: User = Depends(get_current_user)):
+    """Move the user's read watermark to the chat's latest message"""
+    if not await membership_index.is_member("chat", chat_id, current_user.id):
+        raise HTTPException(status_code=403, detail="Not authorized")
+    seq = await latest_room_seq(chat_id)
+    await chat_summaries.mark_read(chat_id, current_user.id, seq)
+    return {"chat_id": chat_id, "read_seq": seq, "unread_count": 0}
 
 @api_router.get("/chats/{chat_id}/messages", response_model=List[Message])
 async def get_messages(chat_id: str, current_user: User = Depends(get_current_user)):
     # Check if user is member
-    chat = await db.chats.find_one({"id": chat_id})
-    if not chat or current_user.id not in chat["members"]:
+    if current_user.id not in await membership_index.chat_members(chat_id):
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    messages = await db.messages.find({"chat_id": chat_id}).sort("created_at", 1).to_list(1000)
+    messages = await message_store.recent("messages", chat_id, 1000)
     return [Message(**message) for message in messages]
 
-@api_router.post("/chats/{chat_id}/messages", response_model=Message)
-async def send_message(chat_id: str, message_data: MessageCreate, current_user: User = Depends(get_current_user)):
+class ChatSummaryBatch:
+    """Summary changes of one chat waiting to be written"""
+
+    def __init__(self):
+        self.last = None  # Summary fields of the newest message
+        self.unread = {}  # user_id -> unread messages to add
+        self.read = {}  # user_id -> read watermark, resets the unread counter
+        self.done = asyncio.get_running_loop().create_future()
+
+    def message(self, message: dict, members: List[str]):
+        if self.last is None or message["seq"] > self.last["last_message_seq"]:
+            self.last = {
+                "last_message": message["content"],
+                "last_message_time": message["created_at"],
+                "last_message_sender_id": message["user_id"],
+                "last_message_sender": message["username"],
+                "last_message_seq": message["seq"],
+            }
+        for member in members:
+            if member != message["user_id"]:
+                self.unread[member] = self.unread.get(member, 0) + 1
+        # Sending a message reads the chat
+        self.mark_read(message["user_id"], message["seq"])
+
+    def mark_read(self, user_id: str, seq: int):
+        self.read[user_id] = max(seq, self.read.get(user_id, 0))
+        self.unread.pop(user_id, None)
+
+    def update(self, with_last: bool = True) -> dict:
+        update = {
+            "$set": {f"unread_counts.{user_id}": self.unread.get(user_id, 0) for user_id in self.read},
+            "$inc": {f"unread_counts.{user_id}": n for user_id, n in self.unread.items() if user_id not in self.read},
+            "$max": {f"read_seq.{user_id}": seq for user_id, seq in self.read.items()},
+        }
+        if with_last and self.last:
+            update["$set"].update(self.last)
+        return {op: fields for op, fields in update.items() if fields}
+
+class ChatSummaryWriter:
+    """
+    Maintains the inbox summary on chat documents: last message and sender,
+    per-member unread counters (unread_counts) and read watermarks (read_seq)
+    - Each change is one atomic update of the chat document
+    - While a chat's update is in flight, later changes are merged into a single
+      next update, so busy chats don't queue one write per message
+    """
+
+    def __init__(self):
+        self._pending = {}  # chat_id -> ChatSummaryBatch
+        self._writing = set()
+
+    async def message_sent(self, chat: dict, message: dict):
+        await self._submit(chat["id"], lambda batch: batch.message(message, chat["members"]))
+
+    async def mark_read(self, chat_id: str, user_id: str, seq: int):
+        await self._submit(chat_id, lambda batch: batch.mark_read(user_id, seq))
+
+    async def _submit(self, chat_id: str, change):
+        batch = self._pending.get(chat_id)
+        if batch is None:
+            batch = self._pending[chat_id] = ChatSummaryBatch()
+        change(batch)
+        if chat_id not in self._writing:
+            self._writing.add(chat_id)
+            asyncio.create_task(self._drain(chat_id))
+        await batch.done
+
+    async def _drain(self, chat_id: str):
+        try:
+            while chat_id in self._pending:
+                batch = self._pending.pop(chat_id)
+                try:
+                    await self._write(chat_id, batch)
+                except Exception as e:
+                    batch.done.set_exception(e)
+                else:
+                    batch.done.set_result(None)
+        finally:
+            self._writing.discard(chat_id)
+
+    async def _write(self, chat_id: str, batch: ChatSummaryBatch):
+        if batch.last is None:
+            await db.chats.update_one({"id": chat_id}, batch.update())
+            return
+        # Another worker may already have written a newer last message
+        result = await db.chats.update_one(
+            {"id": chat_id, "$or": [
+                {"last_message_seq": {"$lt": batch.last["last_message_seq"]}},
+                {"last_message_seq": None},
+            ]},
+            batch.update()
+        )
+        if result.matched_count == 0:
+            await db.chats.update_one({"id": chat_id}, batch.update(with_last=False))
+
+chat_summaries = ChatSummaryWriter()
+
+async def create_chat_message(current_user: User, chat_id: str, message_data: MessageCreate) -> dict:
+    """Store a chat message and emit it to the chat room (REST and Socket.IO)"""
     # Check if user is member
-    chat = await db.chats.find_one({"id": chat_id})
-    if not chat or current_user.id not in chat["members"]:
+    members = await membership_index.chat_members(chat_id)
+    if current_user.id not in members:
         raise HTTPException(status_code=403, detail="Not authorized")
     
+    # 1-1 chats go quiet once either side blocks the other
+    if await block_index.excluded(current_user.id) & members:
+        chat = await db.chats.find_one({"id": chat_id}, {"_id": 0, "is_group": 1})
+        if chat and not chat.get("is_group"):
+            raise HTTPException(status_code=403, detail="Cannot message this user")
+    
     message_id = str(datetime.utcnow().timestamp()).replace(".", "")
     
     message_dict = {
@@ -1294,20 +2416,28 @@ async def send_message(chat_id: str, message_data: MessageCreate, current_user:
         "user_id": current_user.id,
         "username": current_user.username,
         "content": message_data.content,
-        "created_at": datetime.utcnow()
+        "created_at": datetime.utcnow(),
+        "seq": await next_room_seq(chat_id)
     }
     
-    await db.messages.insert_one(message_dict)
+    await message_store.insert("messages", [message_dict])
+    activity_rollups.record("messages", await activity_rollups.container_sector("chats", chat_id))
     
-    # Update chat's last message
-    await db.chats.update_one(
-        {"id": chat_id},
-        {"$set": {"last_message": message_data.content, "last_message_time": datetime.utcnow()}}
-    )
+    # Last message, unread counters and the sender's read watermark
+    await chat_summaries.message_sent({"id": chat_id, "members": list(members)}, message_dict)
     
-    # Emit to socket.io
-    await sio.emit('new_message', message_dict, room=chat_id)
+    # Emit to socket.io (insert_one added an ObjectId, keep the payload JSON-ready)
+    message_emit = {k: v for k, v in message_dict.items() if k != '_id'}
+    message_emit["created_at"] = message_dict["created_at"].isoformat()
+    await emit_sequenced('new_message', message_emit, chat_id)
+    typing_tracker.stop(chat_id, current_user.id)
     
+    return message_dict
+
+@api_router.post("/chats/{chat_id}/messages", response_model=Message)
+@limit_message_sends()
+async def send_message(request: Request, chat_id: str, message_data: MessageCreate, current_user: User = Depends(get_current_user)):
+    message_dict = await create_chat_message(current_user, chat_id, message_data)
     return Message(**message_dict)
 
 # ==================== FRIEND ROUTES ====================
@@ -1395,6 +2525,8 @@ async def handle_friend_request(request_id: str, action_data: FriendRequestActio
             {"id": friend_request["from_user_id"]},
             {"$push": {"friend_ids": current_user.id}}
         )
+        await mark_graph_changed([current_user.id, friend_request["from_user_id"]])
+        friend_graph.invalidate([current_user.id, friend_request["from_user_id"]])
         
         # Update request status
         await db.friend_requests.update_one(
@@ -1441,6 +2573,109 @@ async def get_friends(current_user: User = Depends(get_current_user)):
     friends = await db.users.find({"id": {"$in": friend_ids}}).to_list(1000)
     return [User(**{k: v for k, v in friend.items() if k != 'password'}) for friend in friends]
 
+RELATIONSHIP_BATCH_LIMIT = 100
+
+class RelationshipQuery(BaseModel):
+    user_ids: List[str] = Field(max_length=RELATIONSHIP_BATCH_LIMIT)
+
+class Relationship(BaseModel):
+    user_id: str
+    mutual_friends: int = 0
+    is_friend: bool = False
+    following: bool = False  # You follow them
+    follows_you: bool = False
+    request_sent: bool = False  # Pending friend request from you
+    request_received: bool = False  # Pending friend request to you
+    blocked: bool = False  # You blocked them
+
+class FriendGraphCache:
+    """
+    Friend sets by user for mutual-friend counts, kept in a TTLCache
+    - Misses are loaded together with one $in query
+    - Friendship changes through this worker invalidate both users, other
+      workers see them once the entry is FRIEND_GRAPH_TTL seconds old
+    """
+
+    def __init__(self, ttl: float = 60, max_entries: int = 50000):
+        self.ttl = ttl
+        self.cache = TTLCache(max_entries)  # user_id -> frozenset of friend ids
+        self.stats = self.cache.stats
+
+    async def friends(self, user_ids: List[str]) -> dict:
+        """user_id -> frozenset of friend ids (empty for unknown users)"""
+        found = {}
+        missing = []
+        for user_id in dict.fromkeys(user_ids):
+            friends = self.cache.get(user_id)
+            if friends is TTLCache.MISSING:
+                missing.append(user_id)
+            else:
+                found[user_id] = friends
+        if missing:
+            users = await db.users.find({"id": {"$in": missing}}, {"_id": 0, "id": 1, "friend_ids": 1}).to_list(None)
+            loaded = {user["id"]: frozenset(user.get("friend_ids") or []) for user in users}
+            for user_id in missing:
+                found[user_id] = loaded.get(user_id, frozenset())
+                self.cache.put(user_id, found[user_id], self.ttl)
+        return found
+
+    def invalidate(self, user_ids: List[str]):
+        for user_id in user_ids:
+            self.cache.pop(user_id)
+
+friend_graph = FriendGraphCache(
+    ttl=float(os.environ.get("FRIEND_GRAPH_TTL", "60")),
+    max_entries=int(os.environ.get("FRIEND_GRAPH_CACHE_SIZE", "50000"))
+)
+
+@api_router.post("/users/relationships", response_model=List[Relationship])
+async def get_relationships(query: RelationshipQuery, current_user: User = Depends(get_current_user)):
+    """Mutual friends and relationship flags for up to 100 users, in the order asked"""
+    user_ids = list(dict.fromkeys(query.user_ids))
+    if not user_ids:
+        return []
+    
+    # The caller's own friends come with current_user, fresher than the cache
+    friends, following, followers, requests = await asyncio.gather(
+        friend_graph.friends(user_ids),
+        db.follows.find(
+            {"follower_id": current_user.id, "followee_id": {"$in": user_ids}}, {"_id": 0, "followee_id": 1}
+        ).to_list(None),
+        db.follows.find(
+            {"followee_id": current_user.id, "follower_id": {"$in": user_ids}}, {"_id": 0, "follower_id": 1}
+        ).to_list(None),
+        db.friend_requests.find(
+            {
+                "request_status": "pending",
+                "$or": [
+                    {"from_user_id": current_user.id, "to_user_id": {"$in": user_ids}},
+                    {"to_user_id": current_user.id, "from_user_id": {"$in": user_ids}},
+                ]
+            },
+            {"_id": 0, "from_user_id": 1, "to_user_id": 1}
+        ).to_list(None)
+    )
+    my_friends = set(current_user.friend_ids)
+    following = {edge["followee_id"] for edge in following}
+    followers = {edge["follower_id"] for edge in followers}
+    sent = {request["to_user_id"] for request in requests if request["from_user_id"] == current_user.id}
+    received = {request["from_user_id"] for request in requests if request["to_user_id"] == current_user.id}
+    blocked = set(current_user.blocked_user_ids)
+    
+    return [
+        Relationship(
+            user_id=user_id,
+            mutual_friends=len(my_friends & friends[user_id]) if user_id != current_user.id else 0,
+            is_friend=user_id in my_friends,
+            following=user_id in following,
+            follows_you=user_id in followers,
+            request_sent=user_id in sent,
+            request_received=user_id in received,
+            blocked=user_id in blocked
+        )
+        for user_id in user_ids
+    ]
+
 # ==================== ENHANCED POST ROUTES ====================
 
 @api_router.post("/posts/enhanced", response_model=PostEnhanced)
@@ -1468,11 +2703,7 @@ async def create_enhanced_post(post_data: PostCreateEnhanced, current_user: User
     
     # If posting to a group, verify membership
     if post_data.group_id:
-        group = await db.groups.find_one({"id": post_data.group_id})
-        if not group:
-            raise HTTPException(status_code=404, detail="Group not found")
-        if current_user.id not in group["member_ids"]:
-            raise HTTPException(status_code=403, detail="Not a member of this group")
+        await require_group_member(post_data.group_id, current_user.id)
     
     # Convert location to dict if provided
     location_dict = None
@@ -1507,6 +2738,8 @@ async def create_enhanced_post(post_data: PostCreateEnhanced, current_user: User
     }
     
     await db.posts_enhanced.insert_one(post_dict)
+    await bump_user_stats(current_user.id, posts_count=1)
+    activity_rollups.record("posts", post_data.sector)
     return PostEnhanced(**post_dict)
 
 @api_router.get("/posts/enhanced", response_model=List[PostEnhanced])
@@ -1536,7 +2769,9 @@ async def get_enhanced_posts(skip: int = 0, limit: int = 20, sector: str = "driv
         ]
     }
     
-    posts = await db.posts_enhanced.find(query).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
+    posts = await find_visible(
+        db.posts_enhanced, query, [("created_at", -1)], skip, limit, await block_index.excluded(current_user.id)
+    )
     return [PostEnhanced(**post) for post in posts]
 
 @api_router.post("/posts/{post_id}/vote")
@@ -1621,8 +2856,7 @@ async def vote_post(post_id: str, vote_data: VoteAction, current_user: User = De
     like_count = len(likes)
     
     if dislike_count > 10 and like_count < dislike_count:
-        # Delete the post
-        await db.posts_enhanced.delete_one({"id": post_id})
+        await delete_post_and_comments(post_id)
         raise HTTPException(status_code=404, detail="Post removed due to community feedback")
     
     # Return updated post
@@ -1703,6 +2937,8 @@ async def share_post(post_id: str, current_user: User = Depends(get_current_user
     }
     
     await db.posts_enhanced.insert_one(shared_post)
+    await bump_user_stats(current_user.id, posts_count=1)
+    activity_rollups.record("posts", original_post.get("sector", "drivers"))
     
     # Increment share count on original post
     await db.posts_enhanced.update_one(
@@ -1744,12 +2980,9 @@ async def delete_post(post_id: str, current_user: User = Depends(get_current_use
     if not current_user.is_admin and post["user_id"] != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to delete this post")
     
-    # Delete post from both collections
-    await db.posts.delete_one({"id": post_id})
-    await db.posts_enhanced.delete_one({"id": post_id})
-    
-    # Delete all comments on this post
-    await db.comments.delete_many({"post_id": post_id})
+    # Post and comments from both collections; a concurrent delete already did it
+    if not await delete_post_and_comments(post_id):
+        raise HTTPException(status_code=404, detail="Post not found")
     
     return {"message": "Post deleted successfully"}
 
@@ -1790,29 +3023,134 @@ async def search_posts(q: str, skip: int = 0, limit: int = 20, current_user: Use
         ]
     }
     
-    posts = await db.posts_enhanced.find(search_filter).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
+    posts = await find_visible(
+        db.posts_enhanced, search_filter, [("created_at", -1)], skip, limit, await block_index.excluded(current_user.id)
+    )
     return [PostEnhanced(**post) for post in posts]
 
 @api_router.get("/posts/following", response_model=List[PostEnhanced])
 async def get_following_posts(skip: int = 0, limit: int = 20, sector: str = "drivers", current_user: User = Depends(get_current_user)):
     """Get posts only from users you follow - filtered by sector"""
-    # Get current user's following list
-    user = await db.users.find_one({"id": current_user.id})
-    following_ids = user.get("following_ids", [])
+    # Get current user's following list, blocked users left out
+    excluded = await block_index.excluded(current_user.id)
+    followed = [user_id for user_id in await following_ids(current_user.id) if user_id not in excluded]
     
     # If not following anyone, return empty list
-    if not following_ids:
+    if not followed:
         return []
     
     # Get posts from followed users only - filtered by sector
     posts = await db.posts_enhanced.find(
-        {"user_id": {"$in": following_ids}, "sector": sector}
+        {"user_id": {"$in": followed}, "sector": sector}
     ).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
     
     return [PostEnhanced(**post) for post in posts]
 
 # ==================== GROUP ROUTES ====================
 
+# Memberships live in group_memberships {group_id, user_id, role, joined_at};
+# groups only keep a member_count (see migrate_group_memberships.py)
+GROUP_ROLES = ("admin", "moderator", "member")
+GROUP_MEMBERS_PAGE_SIZE = 50
+
+async def group_role(group_id: str, user_id: str) -> Optional[str]:
+    """Role of a user in a group, None for non-members (covered by the user_id/group_id/role index)"""
+    membership = await db.group_memberships.find_one(
+        {"user_id": user_id, "group_id": group_id}, {"_id": 0, "role": 1}
+    )
+    return membership["role"] if membership else None
+
+async def require_group_member(group_id: str, user_id: str) -> str:
+    """Role of a group member (cached); 404 for unknown groups, 403 for non-members"""
+    role = await membership_index.group_role(group_id, user_id)
+    if role is None:
+        if not await db.groups.find_one({"id": group_id}, {"_id": 1}):
+            raise HTTPException(status_code=404, detail="Group not found")
+        raise HTTPException(status_code=403, detail="Not a member of this group")
+    return role
+
+async def add_group_members(group_id: str, user_ids: List[str], role: str = "member") -> int:
+    """Add users that are not members yet, returns how many were added"""
+    if not user_ids:
+        return 0
+    now = datetime.utcnow()
+    try:
+        result = await db.group_memberships.bulk_write([
+            UpdateOne(
+                {"group_id": group_id, "user_id": user_id},
+                {"$setOnInsert": {"role": role, "joined_at": now}},
+                upsert=True
+            )
+            for user_id in dict.fromkeys(user_ids)
+        ], ordered=False)
+        added = result.upserted_count
+    except BulkWriteError as e:
+        # A concurrent join of the same user hit the unique index
+        added = e.details.get("nUpserted", 0)
+    if added:
+        await db.groups.update_one({"id": group_id}, {"$inc": {"member_count": added}})
+        await mark_graph_changed(user_ids)
+    for user_id in user_ids:
+        membership_index.invalidate("group", group_id, user_id)
+    await group_discovery.joined(group_id, user_ids)
+    return added
+
+async def remove_group_member(group_id: str, user_id: str) -> bool:
+    result = await db.group_memberships.delete_one({"group_id": group_id, "user_id": user_id})
+    membership_index.invalidate("group", group_id, user_id)
+    if result.deleted_count:
+        await db.groups.update_one({"id": group_id}, {"$inc": {"member_count": -1}})
+        await mark_graph_changed([user_id])
+    return bool(result.deleted_count)
+
+async def user_group_roles(user_id: str) -> dict:
+    """group_id -> role of every group a user belongs to"""
+    memberships = await db.group_memberships.find(
+        {"user_id": user_id}, {"_id": 0, "group_id": 1, "role": 1}
+    ).to_list(None)
+    return {membership["group_id"]: membership["role"] for membership in memberships}
+
+class GroupMemberPage(BaseModel):
+    members: List[GroupMember]
+    next_cursor: Optional[str] = None  # Pass back as cursor for the next page
+
+async def list_group_members(group_id: str, cursor: Optional[str], limit: int) -> GroupMemberPage:
+    """
+    One page of members in join order, with their user details
+    - The cursor is "<joined_at>_<membership _id>" of the last membership read, so
+      migrated members sharing a joined_at and members whose user document is
+      gone do not shift later pages
+    """
+    query = {"group_id": group_id}
+    if cursor:
+        joined_at, _, last_id = cursor.rpartition("_")
+        try:
+            joined_at = datetime.fromisoformat(joined_at)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        if not ObjectId.is_valid(last_id):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query["$or"] = [
+            {"joined_at": {"$gt": joined_at}},
+            {"joined_at": joined_at, "_id": {"$gt": ObjectId(last_id)}},
+        ]
+    memberships = await db.group_memberships.find(
+        query, {"user_id": 1, "role": 1, "joined_at": 1}
+    ).sort([("joined_at", 1), ("_id", 1)]).limit(limit).to_list(limit)
+    users = await db.users.find(
+        {"id": {"$in": [membership["user_id"] for membership in memberships]}},
+        {"_id": 0, "id": 1, "username": 1, "full_name": 1, "profile_picture": 1}
+    ).to_list(None)
+    users_by_id = {user["id"]: user for user in users}
+    last = memberships[-1] if len(memberships) == limit else None
+    return GroupMemberPage(
+        members=[
+            GroupMember(**users_by_id[membership["user_id"]], role=membership["role"], joined_at=membership["joined_at"])
+            for membership in memberships if membership["user_id"] in users_by_id
+        ],
+        next_cursor=f"{last['joined_at'].isoformat()}_{last['_id']}" if last else None
+    )
+
 @api_router.post("/groups", response_model=Group)
 async def create_group(group_data: GroupCreate, current_user: User = Depends(get_current_user)):
     group_id = str(datetime.utcnow().timestamp()).replace(".", "")
@@ -1822,26 +3160,47 @@ async def create_group(group_data: GroupCreate, current_user: User = Depends(get
         "name": group_data.name,
         "description": group_data.description,
         "creator_id": current_user.id,
-        "admin_ids": [current_user.id],
-        "moderator_ids": [],
-        "member_ids": [current_user.id],
+        "member_count": 0,
         "requires_approval": group_data.requires_approval,
         "sector": group_data.sector,
         "created_at": datetime.utcnow()
     }
     
     await db.groups.insert_one(group_dict)
-    return Group(**group_dict)
+    await bump_user_stats(current_user.id, groups_created=1)
+    await add_group_members(group_id, [current_user.id], role="admin")
+    return Group(**{**group_dict, "member_count": 1}, my_role="admin")
 
 @api_router.get("/groups", response_model=List[Group])
 async def get_groups(sector: str = "drivers", current_user: User = Depends(get_current_user)):
-    groups = await db.groups.find({"member_ids": current_user.id, "sector": sector}).sort("created_at", -1).to_list(100)
-    return [Group(**group) for group in groups]
+    roles = await user_group_roles(current_user.id)
+    groups = await db.groups.find(
+        {"id": {"$in": list(roles)}, "sector": sector}
+    ).sort("created_at", -1).to_list(100)
+    return [Group(**group, my_role=roles.get(group["id"])) for group in groups]
 
 @api_router.get("/groups/discover", response_model=List[Group])
 async def discover_groups(sector: str = "drivers", current_user: User = Depends(get_current_user)):
-    # Get all groups where user is not a member - filtered by sector
-    groups = await db.groups.find({"member_ids": {"$ne": current_user.id}, "sector": sector}).sort("created_at", -1).to_list(100)
+    roles = await user_group_roles(current_user.id)
+    
+    # Ranked by the discovery job (see GroupDiscovery)
+    recommended = await group_discovery.recommendations(current_user.id, sector)
+    if recommended is not None:
+        # Groups created since the run are not ranked yet, they come first
+        groups = await db.groups.find(
+            {"sector": sector, "id": {"$nin": list(roles)}, "created_at": {"$gte": recommended["computed_at"]}}
+        ).sort("created_at", -1).to_list(DISCOVERY_LIMIT)
+        ranked_ids = [group["id"] for group in recommended["groups"] if group["id"] not in roles]
+        # Live documents, so member counts and renames are current
+        live = {group["id"]: group async for group in db.groups.find({"id": {"$in": ranked_ids}})}
+        listed = {group["id"] for group in groups}
+        groups += [live[group_id] for group_id in ranked_ids if group_id in live and group_id not in listed]
+        return [Group(**group) for group in groups[:DISCOVERY_LIMIT]]
+    
+    # Not ranked yet: newest groups where user is not a member
+    groups = await db.groups.find(
+        {"sector": sector, "id": {"$nin": list(roles)}}
+    ).sort("created_at", -1).to_list(100)
     return [Group(**group) for group in groups]
 
 @api_router.get("/groups/{group_id}")
@@ -1850,29 +3209,35 @@ async def get_group_detail(group_id: str, current_user: User = Depends(get_curre
     if not group:
         raise HTTPException(status_code=404, detail="Group not found")
     
-    # Fetch member details
-    member_ids = group.get("member_ids", [])
-    members = []
-    if member_ids:
-        members_data = await db.users.find(
-            {"id": {"$in": member_ids}},
-            {"_id": 0, "id": 1, "username": 1, "full_name": 1, "profile_picture": 1}
-        ).to_list(None)
-        members = members_data
+    # First page of members, the rest through /groups/{group_id}/members
+    members = await list_group_members(group_id, None, GROUP_MEMBERS_PAGE_SIZE)
     
     # Add members detail to response
-    group_response = Group(**group).dict()
-    group_response["members"] = members
+    group_response = Group(**group, my_role=await group_role(group_id, current_user.id)).dict()
+    group_response["members"] = [member.dict() for member in members.members]
+    group_response["members_next_cursor"] = members.next_cursor
     
     return group_response
 
+@api_router.get("/groups/{group_id}/members", response_model=GroupMemberPage)
+async def get_group_members(
+    group_id: str,
+    cursor: Optional[str] = None,
+    limit: int = GROUP_MEMBERS_PAGE_SIZE,
+    current_user: User = Depends(get_current_user)
+):
+    """Members of a group in join order; pass next_cursor back as cursor for the next page"""
+    if not await db.groups.find_one({"id": group_id}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Group not found")
+    return await list_group_members(group_id, cursor, min(max(limit, 1), 200))
+
 @api_router.post("/groups/{group_id}/join")
 async def join_group(group_id: str, current_user: User = Depends(get_current_user)):
-    group = await db.groups.find_one({"id": group_id})
+    group = await db.groups.find_one({"id": group_id}, {"_id": 0, "requires_approval": 1})
     if not group:
         raise HTTPException(status_code=404, detail="Group not found")
     
-    if current_user.id in group["member_ids"]:
+    if await group_role(group_id, current_user.id):
         raise HTTPException(status_code=400, detail="Already a member")
     
     if group["requires_approval"]:
@@ -1890,19 +3255,12 @@ async def join_group(group_id: str, current_user: User = Depends(get_current_use
         return {"message": "Join request sent"}
     else:
         # Join directly
-        await db.groups.update_one(
-            {"id": group_id},
-            {"$push": {"member_ids": current_user.id}}
-        )
+        await add_group_members(group_id, [current_user.id])
         return {"message": "Joined group successfully"}
 
 @api_router.get("/groups/{group_id}/join-requests", response_model=List[GroupJoinRequest])
 async def get_group_join_requests(group_id: str, current_user: User = Depends(get_current_user)):
-    group = await db.groups.find_one({"id": group_id})
-    if not group:
-        raise HTTPException(status_code=404, detail="Group not found")
-    
-    if current_user.id not in group["admin_ids"]:
+    if await require_group_member(group_id, current_user.id) != "admin":
         raise HTTPException(status_code=403, detail="Not authorized")
     
     requests = await db.group_join_requests.find({
@@ -1921,11 +3279,7 @@ async def handle_join_request(
     if action not in ["approve", "reject"]:
         raise HTTPException(status_code=400, detail="Invalid action")
     
-    group = await db.groups.find_one({"id": group_id})
-    if not group:
-        raise HTTPException(status_code=404, detail="Group not found")
-    
-    if current_user.id not in group["admin_ids"]:
+    if await require_group_member(group_id, current_user.id) != "admin":
         raise HTTPException(status_code=403, detail="Not authorized")
     
     request = await db.group_join_requests.find_one({"id": request_id})
@@ -1934,10 +3288,7 @@ async def handle_join_request(
     
     if action == "approve":
         # Add user to group
-        await db.groups.update_one(
-            {"id": group_id},
-            {"$push": {"member_ids": request["user_id"]}}
-        )
+        await add_group_members(group_id, [request["user_id"]])
         await db.group_join_requests.update_one(
             {"id": request_id},
             {"$set": {"request_status": "approved"}}
@@ -1952,20 +3303,15 @@ async def handle_join_request(
 
 @api_router.delete("/groups/{group_id}/leave")
 async def leave_group(group_id: str, current_user: User = Depends(get_current_user)):
-    group = await db.groups.find_one({"id": group_id})
+    group = await db.groups.find_one({"id": group_id}, {"_id": 0, "creator_id": 1})
     if not group:
         raise HTTPException(status_code=404, detail="Group not found")
     
-    if current_user.id == group["creator_id"]:
+    if current_user.id == group.get("creator_id"):
         raise HTTPException(status_code=400, detail="Creator cannot leave group. Delete the group instead.")
     
-    if current_user.id not in group["member_ids"]:
+    if not await remove_group_member(group_id, current_user.id):
         raise HTTPException(status_code=400, detail="Not a member")
-    
-    await db.groups.update_one(
-        {"id": group_id},
-        {"$pull": {"member_ids": current_user.id, "admin_ids": current_user.id, "moderator_ids": current_user.id}}
-    )
     return {"message": "Left group successfully"}
 
 @api_router.delete("/groups/{group_id}")
@@ -1978,7 +3324,13 @@ async def delete_group(group_id: str, current_user: User = Depends(get_current_u
         raise HTTPException(status_code=403, detail="Only creator can delete group")
     
     # Delete group and all related data
-    await db.groups.delete_one({"id": group_id})
+    result = await db.groups.delete_one({"id": group_id})
+    if not result.deleted_count:
+        raise HTTPException(status_code=404, detail="Group not found")
+    await bump_user_stats(group["creator_id"], groups_created=-1)
+    await db.group_memberships.delete_many({"group_id": group_id})
+    membership_index.invalidate("group", group_id)
+    await group_discovery.removed(group_id)
     await db.group_join_requests.delete_many({"group_id": group_id})
     # Note: We could also delete group posts here if needed
     
@@ -1986,33 +3338,24 @@ async def delete_group(group_id: str, current_user: User = Depends(get_current_u
 
 @api_router.post("/groups/{group_id}/invite")
 async def invite_to_group(group_id: str, invite_data: GroupInvite, current_user: User = Depends(get_current_user)):
-    group = await db.groups.find_one({"id": group_id})
-    if not group:
-        raise HTTPException(status_code=404, detail="Group not found")
-    
-    if current_user.id not in group["admin_ids"] and current_user.id not in group["moderator_ids"]:
+    if await require_group_member(group_id, current_user.id) not in ("admin", "moderator"):
         raise HTTPException(status_code=403, detail="Not authorized")
     
     # Add users directly to group
-    await db.groups.update_one(
-        {"id": group_id},
-        {"$addToSet": {"member_ids": {"$each": invite_data.user_ids}}}
-    )
+    await add_group_members(group_id, invite_data.user_ids)
     
     return {"message": f"Invited {len(invite_data.user_ids)} users to group"}
 
 @api_router.get("/groups/{group_id}/posts", response_model=List[PostEnhanced])
 async def get_group_posts(group_id: str, skip: int = 0, limit: int = 20, current_user: User = Depends(get_current_user)):
-    group = await db.groups.find_one({"id": group_id})
-    if not group:
-        raise HTTPException(status_code=404, detail="Group not found")
-    
     # Check if user is a member
-    if current_user.id not in group["member_ids"]:
-        raise HTTPException(status_code=403, detail="Not a member of this group")
+    await require_group_member(group_id, current_user.id)
     
     # Get posts for this group
-    posts = await db.posts_enhanced.find({"group_id": group_id}).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
+    posts = await find_visible(
+        db.posts_enhanced, {"group_id": group_id}, [("created_at", -1)], skip, limit,
+        await block_index.excluded(current_user.id)
+    )
     return [PostEnhanced(**post) for post in posts]
 
 # ==================== ADMIN ENDPOINTS ====================
@@ -2057,43 +3400,75 @@ async def resolve_report_admin(
     return {"message": f"Report status updated to {status}"}
 
 # Get all users (admin only)
+ADMIN_USERS_PAGE_SIZE = 500
+ADMIN_USERS_CHUNK_SIZE = 100  # Users per aggregation round while streaming a page
+
+async def admin_user_rows(cursor: Optional[ObjectId], limit: int):
+    """Users after a cursor in _id order with their stats, two queries per ADMIN_USERS_CHUNK_SIZE users"""
+    remaining = limit
+    while remaining > 0:
+        chunk_size = min(remaining, ADMIN_USERS_CHUNK_SIZE)
+        pipeline = [{"$match": {"_id": {"$gt": cursor}}}] if cursor else []
+        pipeline += [
+            {"$sort": {"_id": 1}},
+            {"$limit": chunk_size},
+            {"$project": {
+                "id": 1, "username": 1, "full_name": 1, "email": 1, "is_admin": 1, "is_banned": 1,
+                "created_at": 1, "profile_picture": 1, "followers_count": 1, "referral_count": 1,
+                "friends_count": {"$size": {"$ifNull": ["$friend_ids", []]}},
+            }},
+        ]
+        users = await db.users.aggregate(pipeline).to_list(chunk_size)
+        if not users:
+            return
+        stats = await db.user_stats.find(
+            {"_id": {"$in": [user["id"] for user in users]}}, {"posts_count": 1}
+        ).to_list(None)
+        posts = {row["_id"]: row.get("posts_count", 0) for row in stats}
+        for user in users:
+            yield user["_id"], {
+                "id": user["id"],
+                "username": user["username"],
+                "full_name": user.get("full_name", ""),
+                "email": user["email"],
+                "is_admin": user.get("is_admin", False),
+                "is_banned": user.get("is_banned", False),
+                "created_at": user["created_at"].isoformat() if isinstance(user.get("created_at"), datetime) else user.get("created_at"),
+                "profile_picture": user.get("profile_picture"),
+                "stats": {
+                    "posts_count": posts.get(user["id"], 0),
+                    "friends_count": user["friends_count"],
+                    "followers_count": user.get("followers_count", 0),
+                    "referrals_count": user.get("referral_count", 0),
+                }
+            }
+        cursor = users[-1]["_id"]
+        remaining -= len(users)
+        if len(users) < chunk_size:
+            return
+
 @api_router.get("/admin/users")
 async def get_all_users_admin(
-    skip: int = 0,
-    limit: int = 5000,
+    cursor: Optional[str] = None,
+    limit: int = ADMIN_USERS_PAGE_SIZE,
     admin: User = Depends(require_admin)
 ):
-    users = await db.users.find().skip(skip).limit(limit).to_list(length=limit)
-    
-    # Add statistics for each user
-    users_with_stats = []
-    for user in users:
-        # Count posts
-        posts_count = await db.posts_enhanced.count_documents({"user_id": user["id"]})
-        
-        # Count friends, followers, referrals
-        friends_count = len(user.get("friend_ids", []))
-        followers_count = len(user.get("followers_ids", []))
-        referrals_count = await db.users.count_documents({"referred_by": user["id"]})
-        
-        users_with_stats.append({
-            "id": user["id"],
-            "username": user["username"],
-            "full_name": user.get("full_name", ""),
-            "email": user["email"],
-            "is_admin": user.get("is_admin", False),
-            "is_banned": user.get("is_banned", False),
-            "created_at": user["created_at"].isoformat() if isinstance(user.get("created_at"), datetime) else user.get("created_at"),
-            "profile_picture": user.get("profile_picture"),
-            "stats": {
-                "posts_count": posts_count,
-                "friends_count": friends_count,
-                "followers_count": followers_count,
-                "referrals_count": referrals_count,
-            }
-        })
-    
-    return users_with_stats
+    """Users with stats, streamed as {"users": [...], "next_cursor": ...}; pass next_cursor back for the next page"""
+    if cursor and not ObjectId.is_valid(cursor):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    limit = min(max(limit, 1), 1000)
+    
+    async def body():
+        yield b'{"users":['
+        count = 0
+        last_id = None
+        async for last_id, row in admin_user_rows(ObjectId(cursor) if cursor else None, limit):
+            yield (b"," if count else b"") + json.dumps(row, default=str).encode()
+            count += 1
+        next_cursor = str(last_id) if count == limit else None
+        yield b'],"next_cursor":' + json.dumps(next_cursor).encode() + b"}"
+    
+    return StreamingResponse(body(), media_type="application/json")
 
 # Toggle user admin status (admin only)
 @api_router.put("/admin/users/{user_id}/toggle-admin")
@@ -2159,30 +3534,25 @@ async def delete_post_admin(
     post_id: str,
     admin: User = Depends(require_admin)
 ):
-    # Delete from posts_enhanced collection
-    result = await db.posts_enhanced.delete_one({"id": post_id})
-    
-    if result.deleted_count == 0:
+    # Post and all its comments
+    if not await delete_post_and_comments(post_id):
         raise HTTPException(status_code=404, detail="Post not found")
     
-    # Also delete all comments on this post
-    await db.comments.delete_many({"post_id": post_id})
-    
     return {"message": "Post deleted successfully"}
 
 # Get admin statistics (admin only)
 @api_router.get("/admin/stats")
 async def get_admin_stats(admin: User = Depends(require_admin)):
-    total_users = await db.users.count_documents({})
-    total_posts = await db.posts_enhanced.count_documents({})  # Use posts_enhanced
-    total_comments = await db.comments.count_documents({})
-    total_reports = await db.reports.count_documents({})
-    pending_reports = await db.reports.count_documents({"status": "pending"})
-    
-    # Get recent activity (last 7 days)
+    # Totals from collection metadata, recent activity (last 7 days) from the rollups
     seven_days_ago = datetime.utcnow() - timedelta(days=7)
-    recent_users = await db.users.count_documents({"created_at": {"$gte": seven_days_ago}})
-    recent_posts = await db.posts_enhanced.count_documents({"created_at": {"$gte": seven_days_ago}})  # Use posts_enhanced
+    total_users, total_posts, total_comments, total_reports, pending_reports, recent = await asyncio.gather(
+        db.users.estimated_document_count(),
+        db.posts_enhanced.estimated_document_count(),  # Use posts_enhanced
+        db.comments.estimated_document_count(),
+        db.reports.estimated_document_count(),
+        db.reports.count_documents({"status": "pending"}),
+        activity_rollups.totals(seven_days_ago)
+    )
     
     return {
         "total_users": total_users,
@@ -2190,8 +3560,90 @@ async def get_admin_stats(admin: User = Depends(require_admin)):
         "total_comments": total_comments,
         "total_reports": total_reports,
         "pending_reports": pending_reports,
-        "recent_users_7d": recent_users,
-        "recent_posts_7d": recent_posts
+        "recent_users_7d": recent["users"],
+        "recent_posts_7d": recent["posts"]
+    }
+
+@api_router.get("/admin/stats/series")
+async def get_admin_stats_series(
+    granularity: str = "hour",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    sector: Optional[str] = None,
+    admin: User = Depends(require_admin)
+):
+    """Created users, posts, comments, messages and reports per hour or day, all sectors unless one is given"""
+    if granularity not in ACTIVITY_GRANULARITIES:
+        raise HTTPException(status_code=400, detail="Granularity must be hour or day")
+    step = ACTIVITY_GRANULARITIES[granularity]
+    
+    # Aware times are converted to the naive UTC the buckets use
+    if end is None:
+        end = datetime.utcnow()
+    elif end.tzinfo is not None:
+        end = end.astimezone(timezone.utc).replace(tzinfo=None)
+    if start is None:
+        start = end - step * ACTIVITY_SERIES_DEFAULT_POINTS[granularity]
+    elif start.tzinfo is not None:
+        start = start.astimezone(timezone.utc).replace(tzinfo=None)
+    
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    if (end - start) / step > ACTIVITY_SERIES_MAX_POINTS:
+        raise HTTPException(status_code=400, detail=f"At most {ACTIVITY_SERIES_MAX_POINTS} points per series")
+    
+    return {
+        "granularity": granularity,
+        "sector": sector,
+        "points": await activity_rollups.series(granularity, start, end, sector)
+    }
+
+@api_router.get("/admin/activity-rollup-stats")
+async def get_activity_rollup_stats(admin: User = Depends(require_admin)):
+    """Unflushed buckets and flush counters of this worker's activity rollups"""
+    return activity_rollups.get_stats()
+
+@api_router.get("/admin/socket-stats")
+async def get_socket_stats(admin: User = Depends(require_admin)):
+    """Outbound queue depth and slow-consumer counters of this worker's sockets"""
+    return sio.backpressure_stats()
+
+@api_router.get("/admin/message-writer-stats")
+async def get_message_writer_stats(admin: User = Depends(require_admin)):
+    """Queue, batch size and lag of this worker's message write-behind"""
+    return message_writer.get_stats()
+
+@api_router.get("/admin/archives")
+async def get_message_archives(admin: User = Depends(require_admin)):
+    """Retention policies, archiver state and the archive files of this machine"""
+    return {**message_archiver.get_stats(), "archives": await asyncio.to_thread(message_archiver.list_archives)}
+
+@api_router.get("/admin/archives/{collection}/{day}")
+async def read_message_archive(
+    collection: str,
+    day: str,
+    container: Optional[str] = None,
+    offset: int = 0,
+    limit: int = 200,
+    admin: User = Depends(require_admin)
+):
+    """Read archived messages of one day (container: group id or sector)"""
+    if collection not in message_archiver.policies:
+        raise HTTPException(status_code=404, detail="Unknown archive collection")
+    if not ARCHIVE_DAY_PATTERN.match(day):
+        raise HTTPException(status_code=400, detail="Day must be YYYY-MM-DD")
+    if offset > ARCHIVE_MAX_OFFSET:
+        raise HTTPException(status_code=400, detail=f"Offset is limited to {ARCHIVE_MAX_OFFSET}, filter by container")
+    offset = max(offset, 0)
+    limit = min(max(limit, 1), 1000)
+    messages = await asyncio.to_thread(message_archiver.read_archive, collection, day, container, offset, limit)
+    if messages is None:
+        raise HTTPException(status_code=404, detail="No archive for this day")
+    return {
+        "collection": collection,
+        "day": day,
+        "messages": [serialize_chatroom_message(message) for message in messages],
+        "next_offset": offset + len(messages) if len(messages) == limit else None,
     }
 
 @api_router.get("/admin/users/{user_id}/details")
@@ -2201,24 +3653,21 @@ async def get_user_details(user_id: str, admin: User = Depends(require_admin)):
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    # Count posts
-    posts_count = await db.posts_enhanced.count_documents({"user_id": user_id})
-    
-    # Count comments
-    comments_count = await db.comments.count_documents({"user_id": user_id})
+    # Posts, comments and groups created (see USER STATS)
+    stats = await get_user_stats(user_id)
+    posts_count = stats["posts_count"]
+    comments_count = stats["comments_count"]
+    groups_count = stats["groups_created"]
     
     # Count friends
     friends_count = len(user.get("friend_ids", []))
     
-    # Count groups created by user
-    groups_count = await db.groups.count_documents({"creator_id": user_id})
-    
-    # Count referrals (users who have this user as referrer)
-    referrals_count = await db.users.count_documents({"referred_by": user_id})
+    # Referrals (users who have this user as referrer)
+    referrals_count = user.get("referral_count", 0)
     
     # Get follower/following counts
-    followers_count = len(user.get("followers_ids", []))
-    following_count = len(user.get("following_ids", []))
+    followers_count = user.get("followers_count", 0)
+    following_count = user.get("following_count", 0)
     
     return {
         "user": {
@@ -2271,6 +3720,1347 @@ async def update_user_credentials(
     
     return {"message": "User credentials updated successfully"}
 
+# ==================== ROOM SEQUENCES & REPLAY ====================
+
+REPLAY_BUFFER_SIZE = int(os.environ.get("REPLAY_BUFFER_SIZE", "200"))  # Events kept per room
+REPLAY_MAX_ROOMS = int(os.environ.get("REPLAY_MAX_ROOMS", "5000"))  # Least recently used rooms are dropped
+SEQUENCED_EVENTS = {
+    'new_message', 'new_group_message', 'new_chatroom_message',
+    'delete_group_message', 'chatroom_message_deleted',
+}
+
+async def next_room_seq(room: str) -> int:
+    """Next sequence number for a room, shared by every worker"""
+    counter = await db.room_sequences.find_one_and_update(
+        {"_id": room},
+        {"$inc": {"seq": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return counter["seq"]
+
+async def latest_room_seq(room: str) -> int:
+    counter = await db.room_sequences.find_one({"_id": room})
+    return counter["seq"] if counter else 0
+
+class RoomReplayBuffer:
+    """
+    Last sequenced events of each room, replayed to sockets that rejoin with last_seq
+    - Bounded per room and in number of rooms
+    - Events from other workers may arrive out of order, they are kept sorted by seq
+    - Each room remembers the first seq it still covers (where recording started,
+      or just past the last evicted event); seqs after it that were never
+      recorded (failed sends) are holes, not gaps
+    """
+
+    def __init__(self, size: int, max_rooms: int):
+        self.size = size
+        self.max_rooms = max_rooms
+        self._rooms = OrderedDict()  # room -> {"from": first covered seq, "events": deque of (seq, event, payload)}
+
+    def record(self, room: str, event: str, payload):
+        seq = payload.get("seq") if isinstance(payload, dict) else None
+        if room is None or seq is None:
+            return
+        state = self._rooms.get(room)
+        if state is None:
+            state = self._rooms[room] = {"from": seq, "events": deque()}
+            if len(self._rooms) > self.max_rooms:
+                self._rooms.popitem(last=False)
+        else:
+            self._rooms.move_to_end(room)
+        if seq < state["from"]:
+            return  # Older than what the room covers
+        
+        buffer = state["events"]
+        if not buffer or seq > buffer[-1][0]:
+            buffer.append((seq, event, payload))
+        elif all(entry[0] != seq for entry in buffer):
+            entries = sorted([*buffer, (seq, event, payload)], key=lambda entry: entry[0])
+            buffer.clear()
+            buffer.extend(entries)
+        while len(buffer) > self.size:
+            state["from"] = buffer.popleft()[0] + 1
+
+    def since(self, room: str, last_seq: int, latest_seq: int):
+        """Events after last_seq up to latest_seq, or None when the buffer does not cover the gap"""
+        if last_seq >= latest_seq:
+            return []
+        state = self._rooms.get(room)
+        if state is None or state["from"] > last_seq + 1:
+            return None
+        return [entry for entry in state["events"] if last_seq < entry[0] <= latest_seq]
+
+room_replay = RoomReplayBuffer(REPLAY_BUFFER_SIZE, REPLAY_MAX_ROOMS)
+
+async def emit_sequenced(event: str, payload: dict, room: str):
+    """Emit an event carrying a seq and keep it for replay"""
+    room_replay.record(room, event, payload)
+    await sio.emit(event, payload, room=room)
+
+# ==================== MESSAGE STORAGE ====================
+
+# "documents": one document per message (default)
+# "buckets": one document per chat/group/sector and time bucket holding up to
+# MESSAGE_BUCKET_SIZE compact messages, see migrate_message_buckets.py
+MESSAGE_STORAGE = os.environ.get("MESSAGE_STORAGE", "documents").lower()
+MESSAGE_BUCKET_SIZE = int(os.environ.get("MESSAGE_BUCKET_SIZE", "200"))
+MESSAGE_BUCKET_SPAN = timedelta(hours=float(os.environ.get("MESSAGE_BUCKET_SPAN_HOURS", "168")))
+MESSAGE_BUCKET_MAX_BYTES = int(os.environ.get("MESSAGE_BUCKET_MAX_BYTES", str(8 * 1024 * 1024)))  # Documents max out at 16MB
+
+# Message collection -> field holding the chat, group or sector it belongs to
+MESSAGE_CONTAINERS = {
+    "messages": "chat_id",
+    "group_messages": "group_id",
+    "chatroom_messages": "sector",
+}
+# Author fields of group and chatroom messages, read from the users collection in bucket mode
+MESSAGE_AUTHOR_FIELDS = {"full_name": "full_name", "user_profile_picture": "profile_picture"}
+
+def new_message_id() -> str:
+    """Millisecond timestamp id with a random suffix, unique within the same millisecond"""
+    return f"{int(datetime.utcnow().timestamp() * 1000)}-{os.urandom(4).hex()}"
+
+def message_id_time(message_id: str) -> Optional[datetime]:
+    """Creation time encoded in a millisecond timestamp id (see new_message_id), None for other ids"""
+    millis = message_id.split("-", 1)[0]
+    if not (millis.isdigit() and len(millis) == 13):
+        return None
+    return datetime.utcfromtimestamp(int(millis) / 1000)
+
+class DocumentMessageStore:
+    """One MongoDB document per message"""
+
+    async def insert(self, collection: str, docs: List[dict]):
+        await db[collection].insert_many(docs, ordered=False)
+
+    async def upsert(self, collection: str, docs: List[dict]):
+        await db[collection].bulk_write(
+            [ReplaceOne({"id": doc["id"]}, doc, upsert=True) for doc in docs], ordered=False
+        )
+
+    async def find_one(self, collection: str, message_id: str, container: Optional[str] = None) -> Optional[dict]:
+        query = {"id": message_id}
+        if container is not None:
+            query[MESSAGE_CONTAINERS[collection]] = container
+        return await db[collection].find_one(query, {"_id": 0})
+
+    async def delete_one(self, collection: str, message: dict):
+        await db[collection].delete_one({"id": message["id"]})
+
+    async def delete_by_user(self, collection: str, user_id: str):
+        await db[collection].delete_many({"user_id": user_id})
+
+    async def clear(self, collection: str) -> int:
+        result = await db[collection].delete_many({})
+        return result.deleted_count
+
+    async def recent(self, collection: str, container: str, limit: int, since: Optional[datetime] = None) -> List[dict]:
+        """Newest messages of a chat, group or sector, oldest first"""
+        query = {MESSAGE_CONTAINERS[collection]: container}
+        if since is not None:
+            query["created_at"] = {"$gte": since}
+        messages = await db[collection].find(query, {"_id": 0}).sort("created_at", -1).limit(limit).to_list(limit)
+        messages.reverse()
+        return messages
+
+    async def containers_since(self, collection: str, since: datetime) -> List[str]:
+        return await db[collection].distinct(MESSAGE_CONTAINERS[collection], {"created_at": {"$gte": since}})
+
+    async def counts_since(self, collection: str, since: datetime) -> dict:
+        """container -> messages created since a date"""
+        rows = await db[collection].aggregate([
+            {"$match": {"created_at": {"$gte": since}}},
+            {"$group": {"_id": f"${MESSAGE_CONTAINERS[collection]}", "count": {"$sum": 1}}},
+        ]).to_list(None)
+        return {row["_id"]: row["count"] for row in rows}
+
+    async def ensure_indexes(self):
+        await db.messages.create_index([("chat_id", 1), ("seq", 1)])
+
+    def expiry_index(self, collection: str) -> tuple:
+        """Collection and date field that retention indexes and expires on"""
+        return collection, "created_at"
+
+    async def expired(self, collection: str, before: datetime, limit: int) -> tuple:
+        """Oldest messages created before a date, and the keys to delete them with"""
+        docs = await db[collection].find({"created_at": {"$lt": before}}).sort("created_at", 1).limit(limit).to_list(limit)
+        return [{k: v for k, v in doc.items() if k != "_id"} for doc in docs], [doc["_id"] for doc in docs]
+
+    async def delete_expired(self, collection: str, keys: list):
+        await db[collection].delete_many({"_id": {"$in": keys}})
+
+class BucketMessageStore:
+    """
+    Bucket pattern: messages are pushed into '<collection>_buckets' documents
+    {container, start, last_at, count, bytes, messages: [...]}
+    - A bucket takes messages until it holds MESSAGE_BUCKET_SIZE of them, reaches
+      MESSAGE_BUCKET_MAX_BYTES or is older than MESSAGE_BUCKET_SPAN
+    - Stored messages drop the container field and the author's name and picture,
+      which are read back from the users collection
+    - A history page reads one or two buckets through the (container, start) index
+    """
+
+    def __init__(self, size: int, span: timedelta, max_bytes: int):
+        self.size = size
+        self.span = span
+        self.max_bytes = max_bytes
+
+    def _buckets(self, collection: str):
+        return db[f"{collection}_buckets"]
+
+    def _compact(self, collection: str, doc: dict) -> dict:
+        dropped = {"_id", MESSAGE_CONTAINERS[collection]}
+        if collection != "messages":
+            dropped.update(MESSAGE_AUTHOR_FIELDS)
+        return {k: v for k, v in doc.items() if k not in dropped}
+
+    def _append(self, collection: str, doc: dict) -> UpdateOne:
+        message = self._compact(collection, doc)
+        size = len(bson_encode(message))
+        created_at = doc["created_at"]
+        return UpdateOne(
+            {
+                "container": doc[MESSAGE_CONTAINERS[collection]],
+                "start": {"$gt": created_at - self.span, "$lte": created_at},
+                "count": {"$lt": self.size},
+                "bytes": {"$lte": self.max_bytes - size},
+            },
+            {
+                "$push": {"messages": message},
+                "$inc": {"count": 1, "bytes": size},
+                "$max": {"last_at": created_at},
+                "$setOnInsert": {"start": created_at},
+            },
+            upsert=True
+        )
+
+    async def _expand(self, collection: str, buckets: List[dict]) -> List[dict]:
+        field = MESSAGE_CONTAINERS[collection]
+        messages = [
+            {**message, field: bucket["container"]}
+            for bucket in buckets for message in bucket.get("messages", [])
+        ]
+        if collection != "messages" and messages:
+            users = await db.users.find(
+                {"id": {"$in": list({message["user_id"] for message in messages})}},
+                {"_id": 0, "id": 1, **{source: 1 for source in MESSAGE_AUTHOR_FIELDS.values()}}
+            ).to_list(None)
+            authors = {user["id"]: user for user in users}
+            for message in messages:
+                author = authors.get(message["user_id"], {})
+                for field_name, source in MESSAGE_AUTHOR_FIELDS.items():
+                    message[field_name] = author.get(source)
+        return messages
+
+    async def insert(self, collection: str, docs: List[dict]):
+        # Ordered, so each message sees the bucket filled by the previous one
+        await self._buckets(collection).bulk_write([self._append(collection, doc) for doc in docs], ordered=True)
+
+    async def upsert(self, collection: str, docs: List[dict]):
+        """Insert the messages that are not stored yet (spill replays)"""
+        stored = set()
+        async for bucket in self._buckets(collection).find(
+            {"messages.id": {"$in": [doc["id"] for doc in docs]}}, {"messages.id": 1}
+        ):
+            stored.update(message["id"] for message in bucket["messages"])
+        missing = [doc for doc in docs if doc["id"] not in stored]
+        if missing:
+            await self.insert(collection, missing)
+
+    async def find_one(self, collection: str, message_id: str, container: Optional[str] = None) -> Optional[dict]:
+        query = {"messages.id": message_id}
+        if container is not None:
+            query["container"] = container
+        created_at = message_id_time(message_id)
+        if created_at is not None:
+            # Ids are taken just before created_at
+            query["start"] = {"$gt": created_at - self.span, "$lte": created_at + timedelta(seconds=5)}
+        bucket = await self._buckets(collection).find_one(
+            query, {"_id": 0, "container": 1, "messages": {"$elemMatch": {"id": message_id}}}
+        )
+        if not bucket or not bucket.get("messages"):
+            return None
+        return (await self._expand(collection, [bucket]))[0]
+
+    async def delete_one(self, collection: str, message: dict):
+        size = len(bson_encode(self._compact(collection, message)))
+        buckets = self._buckets(collection)
+        container = message[MESSAGE_CONTAINERS[collection]]
+        await buckets.update_one(
+            {"container": container, "messages.id": message["id"]},
+            {"$pull": {"messages": {"id": message["id"]}}, "$inc": {"count": -1, "bytes": -size}}
+        )
+        await buckets.delete_many({"container": container, "count": {"$lte": 0}})
+
+    async def delete_by_user(self, collection: str, user_id: str):
+        buckets = self._buckets(collection)
+        # Each bucket gives back the count and bytes of the messages pulled from it
+        updates = []
+        async for bucket in buckets.find({"messages.user_id": user_id}, {"messages": 1}):
+            removed = [message for message in bucket["messages"] if message.get("user_id") == user_id]
+            updates.append(UpdateOne(
+                {"_id": bucket["_id"], "messages.user_id": user_id},
+                {
+                    "$pull": {"messages": {"user_id": user_id}},
+                    "$inc": {"count": -len(removed), "bytes": -sum(len(bson_encode(message)) for message in removed)},
+                }
+            ))
+        if updates:
+            await buckets.bulk_write(updates, ordered=False)
+        await buckets.delete_many({"count": {"$lte": 0}})
+
+    async def clear(self, collection: str) -> int:
+        buckets = self._buckets(collection)
+        totals = await buckets.aggregate([{"$group": {"_id": None, "count": {"$sum": "$count"}}}]).to_list(1)
+        await buckets.delete_many({})
+        return totals[0]["count"] if totals else 0
+
+    async def recent(self, collection: str, container: str, limit: int, since: Optional[datetime] = None) -> List[dict]:
+        """Newest messages of a chat, group or sector, oldest first"""
+        query = {"container": container}
+        if since is not None:
+            query["start"] = {"$gt": since - self.span}
+            query["last_at"] = {"$gte": since}
+        buckets = []
+        count = 0
+        async for bucket in self._buckets(collection).find(query, {"_id": 0}).sort("start", -1):
+            buckets.append(bucket)
+            count += len(bucket.get("messages", []))
+            if count >= limit:
+                break
+        messages = await self._expand(collection, buckets)
+        if since is not None:
+            messages = [message for message in messages if message["created_at"] >= since]
+        messages.sort(key=lambda message: message["created_at"])
+        return messages[-limit:]
+
+    async def containers_since(self, collection: str, since: datetime) -> List[str]:
+        return await self._buckets(collection).distinct("container", {"last_at": {"$gte": since}})
+
+    async def counts_since(self, collection: str, since: datetime) -> dict:
+        """container -> messages created since a date"""
+        rows = await self._buckets(collection).aggregate([
+            {"$match": {"last_at": {"$gte": since}}},
+            {"$unwind": "$messages"},
+            {"$match": {"messages.created_at": {"$gte": since}}},
+            {"$group": {"_id": "$container", "count": {"$sum": 1}}},
+        ]).to_list(None)
+        return {row["_id"]: row["count"] for row in rows}
+
+    async def ensure_indexes(self):
+        for collection in MESSAGE_CONTAINERS:
+            buckets = self._buckets(collection)
+            await buckets.create_index([("container", 1), ("start", -1)])
+            # Lookups by message id without a container (chatroom deletes)
+            await buckets.create_index([("start", -1)])
+
+    def expiry_index(self, collection: str) -> tuple:
+        """Collection and date field that retention indexes and expires on"""
+        return f"{collection}_buckets", "last_at"
+
+    async def expired(self, collection: str, before: datetime, limit: int) -> tuple:
+        """Messages of the oldest buckets whose last message is before a date, and the bucket keys"""
+        buckets = await self._buckets(collection).find({"last_at": {"$lt": before}}).sort("last_at", 1).limit(
+            max(1, limit // self.size)
+        ).to_list(None)
+        messages = await self._expand(collection, buckets)
+        messages.sort(key=lambda message: message["created_at"])
+        return messages, [bucket["_id"] for bucket in buckets]
+
+    async def delete_expired(self, collection: str, keys: list):
+        await self._buckets(collection).delete_many({"_id": {"$in": keys}})
+
+if MESSAGE_STORAGE == "buckets":
+    message_store = BucketMessageStore(MESSAGE_BUCKET_SIZE, MESSAGE_BUCKET_SPAN, MESSAGE_BUCKET_MAX_BYTES)
+else:
+    message_store = DocumentMessageStore()
+
+# ==================== MESSAGE WRITE-BEHIND ====================
+
+MESSAGE_WRITE_BEHIND = os.environ.get("MESSAGE_WRITE_BEHIND", "false").lower() == "true"
+WRITE_BEHIND_QUEUE_SIZE = int(os.environ.get("WRITE_BEHIND_QUEUE_SIZE", "10000"))  # Senders wait when it is full
+WRITE_BEHIND_BATCH_SIZE = int(os.environ.get("WRITE_BEHIND_BATCH_SIZE", "500"))
+WRITE_BEHIND_INTERVAL = float(os.environ.get("WRITE_BEHIND_INTERVAL", "0.2"))  # Seconds a batch waits to fill up
+WRITE_BEHIND_SPILL_DIR = Path(os.environ.get("WRITE_BEHIND_SPILL_DIR", str(ROOT_DIR / "spill")))
+
+def process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class MessageWriteBehind:
+    """
+    Optional write-behind persistence of chatroom and group messages (MESSAGE_WRITE_BEHIND)
+    - Senders enqueue the message and emit it right away
+    - One background task drains the bounded queue into insert_many batches
+    - Batches MongoDB doesn't take are appended to a local spill file and replayed,
+      as upserts by message id, before the next batch
+    - Spill files of workers that are gone are taken over at startup
+    - Only the message write is deferred: a send still needs MongoDB for its room
+      seq (next_room_seq) and for memberships MembershipIndex doesn't have cached,
+      so sends fail while MongoDB is unreachable
+    """
+
+    def __init__(self, enabled: bool, queue_size: int, batch_size: int, interval: float, spill_dir: Path):
+        self.enabled = enabled
+        self.batch_size = batch_size
+        self.interval = interval
+        self.spill_dir = spill_dir
+        self.spill_path = spill_dir / f"messages-{os.getpid()}.jsonl"
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self._enqueued = 0  # Messages put in the queue so far
+        self._processed = 0  # Messages stored or spilled so far, in queue order
+        self._progress = asyncio.Condition()
+        self.stats = {
+            "batches": 0, "written": 0, "spilled": 0, "replayed": 0,
+            "last_batch_size": 0, "max_batch_size": 0, "last_lag_ms": 0, "max_lag_ms": 0,
+        }
+        self._task = None
+
+    async def save(self, collection: str, doc: dict):
+        """Store a message document, now or in the next batch"""
+        if not self.enabled:
+            await message_store.insert(collection, [doc])
+            return
+        await self.queue.put((collection, doc, asyncio.get_running_loop().time()))
+        self._enqueued += 1
+
+    async def flush(self):
+        """Wait until everything enqueued before the call is stored (or spilled), not for later sends"""
+        if self._task is None:
+            return
+        target = self._enqueued
+        async with self._progress:
+            await self._progress.wait_for(lambda: self._processed >= target)
+
+    def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            await self.flush()
+            self._task.cancel()
+            self._task = None
+
+    async def run(self):
+        self._adopt_spills()
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.interval
+            while len(batch) < self.batch_size:
+                if not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._write(batch)
+            except Exception as e:
+                logger.error(f"Message write-behind batch lost: {e}")
+            finally:
+                self._processed += len(batch)
+                async with self._progress:
+                    self._progress.notify_all()
+
+    async def _write(self, batch: list):
+        by_collection = {}
+        for collection, doc, _ in batch:
+            by_collection.setdefault(collection, []).append(doc)
+        try:
+            if self.spill_path.exists():
+                await self._replay()
+            while by_collection:
+                collection, docs = next(iter(by_collection.items()))
+                await message_store.insert(collection, docs)
+                del by_collection[collection]
+        except PyMongoError as e:
+            logger.error(f"Message write-behind spilling {sum(map(len, by_collection.values()))} message(s): {e}")
+            self._spill(by_collection)
+            return
+
+        lag_ms = int((asyncio.get_running_loop().time() - batch[0][2]) * 1000)
+        self.stats["batches"] += 1
+        self.stats["written"] += len(batch)
+        self.stats["last_batch_size"] = len(batch)
+        self.stats["max_batch_size"] = max(self.stats["max_batch_size"], len(batch))
+        self.stats["last_lag_ms"] = lag_ms
+        self.stats["max_lag_ms"] = max(self.stats["max_lag_ms"], lag_ms)
+
+    def _spill(self, by_collection: dict):
+        self.spill_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.spill_path, "a") as spill:
+            for collection, docs in by_collection.items():
+                for doc in docs:
+                    # insert_many may have set an _id already, replays upsert by id
+                    doc = {k: v for k, v in doc.items() if k != "_id"}
+                    spill.write(json_util.dumps({"collection": collection, "doc": doc}) + "\n")
+                    self.stats["spilled"] += 1
+            spill.flush()
+            os.fsync(spill.fileno())
+
+    async def _replay(self):
+        by_collection = {}
+        with open(self.spill_path) as spill:
+            for line in spill:
+                if line.strip():
+                    entry = json_util.loads(line)
+                    by_collection.setdefault(entry["collection"], []).append(entry["doc"])
+        for collection, docs in by_collection.items():
+            await message_store.upsert(collection, docs)
+        self.spill_path.unlink()
+        self.stats["replayed"] += sum(map(len, by_collection.values()))
+        logger.info(f"Message write-behind replayed {self.stats['replayed']} spilled message(s)")
+
+    def _adopt_spills(self):
+        """Append the spill files of workers that are no longer running to this worker's"""
+        if not self.spill_dir.exists():
+            return
+        for path in self.spill_dir.glob("messages-*.jsonl"):
+            pid = int(path.stem.split("-", 1)[1])
+            if path == self.spill_path or process_alive(pid):
+                continue
+            with open(path) as orphan, open(self.spill_path, "a") as spill:
+                spill.write(orphan.read())
+                spill.flush()
+                os.fsync(spill.fileno())
+            path.unlink()
+
+    def get_stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "queued": self.queue.qsize(),
+            "spill_pending": self.spill_path.exists(),
+            **self.stats,
+        }
+
+message_writer = MessageWriteBehind(
+    enabled=MESSAGE_WRITE_BEHIND,
+    queue_size=WRITE_BEHIND_QUEUE_SIZE,
+    batch_size=WRITE_BEHIND_BATCH_SIZE,
+    interval=WRITE_BEHIND_INTERVAL,
+    spill_dir=WRITE_BEHIND_SPILL_DIR,
+)
+
+# ==================== MESSAGE RETENTION ====================
+
+RETENTION_INTERVAL = float(os.environ.get("RETENTION_INTERVAL", "600"))  # Seconds between archive runs
+RETENTION_BATCH_SIZE = int(os.environ.get("RETENTION_BATCH_SIZE", "1000"))
+ARCHIVE_DIR = Path(os.environ.get("ARCHIVE_DIR", str(ROOT_DIR / "archives")))
+ARCHIVE_DAY_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+ARCHIVE_MAX_OFFSET = int(os.environ.get("ARCHIVE_MAX_OFFSET", "20000"))  # Archived lines a read may skip
+
+async def acquire_lease(name: str, owner: str, seconds: float) -> bool:
+    """Take or renew a named lease, so one worker runs a periodic job"""
+    now = datetime.utcnow()
+    try:
+        await db.job_leases.update_one(
+            {"_id": name, "$or": [{"until": {"$lt": now}}, {"owner": owner}]},
+            {"$set": {"owner": owner, "until": now + timedelta(seconds=seconds)}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        return False
+    return True
+
+class RetentionPolicy:
+    """
+    How long a message collection is kept (0 hours = forever)
+    - "archive": expired messages are exported to the archive, then deleted
+    - "ttl": a TTL index lets MongoDB delete them, nothing is archived
+    """
+
+    def __init__(self, collection: str, hours: float, mode: str):
+        if mode not in ("archive", "ttl"):
+            raise ValueError(f"Unknown retention mode for {collection}: {mode}")
+        self.collection = collection
+        self.hours = hours
+        self.mode = mode
+
+    @property
+    def enabled(self) -> bool:
+        return self.hours > 0
+
+    @property
+    def max_age(self) -> timedelta:
+        return timedelta(hours=self.hours)
+
+    def as_dict(self) -> dict:
+        return {"collection": self.collection, "hours": self.hours, "mode": self.mode}
+
+def retention_policy(collection: str, prefix: str, default_hours: str) -> RetentionPolicy:
+    return RetentionPolicy(
+        collection,
+        float(os.environ.get(f"{prefix}_RETENTION_HOURS", default_hours)),
+        os.environ.get(f"{prefix}_RETENTION_MODE", "archive").lower()
+    )
+
+RETENTION_POLICIES = {
+    policy.collection: policy for policy in [
+        retention_policy("chatroom_messages", "CHATROOM", "0"),
+        retention_policy("group_messages", "GROUP", "0"),
+    ]
+}
+
+class MessageArchiver:
+    """
+    Applies the retention policies of the message collections
+    - "ttl" policies only get their TTL index
+    - "archive" policies are run every RETENTION_INTERVAL seconds by the worker
+      holding the collection's lease: expired messages are appended to
+      ARCHIVE_DIR/<collection>/<day>/<container>.ndjson.gz, by creation day and
+      chat, group or sector, then deleted
+    - Reading a container only opens its own file; ARCHIVE_MAX_OFFSET bounds how
+      far into a day a read may skip
+    - Archives are local files of the machine that wrote them
+    """
+
+    def __init__(self, policies: dict, archive_dir: Path, interval: float, batch_size: int):
+        self.policies = policies
+        self.archive_dir = archive_dir
+        self.interval = interval
+        self.batch_size = batch_size
+        self.owner = f"{os.uname().nodename}:{os.getpid()}"
+        self.stats = {"runs": 0, "archived": 0, "last_run_at": None, "last_error": None}
+        self._task = None
+
+    async def ensure_indexes(self):
+        """Index the expiry field; a TTL index only where MongoDB does the deleting"""
+        for policy in self.policies.values():
+            collection_name, field = message_store.expiry_index(policy.collection)
+            collection = db[collection_name]
+            ttl_seconds = int(policy.max_age.total_seconds()) if policy.enabled and policy.mode == "ttl" else None
+            for name, index in (await collection.index_information()).items():
+                if index["key"] != [(field, 1)]:
+                    continue
+                if index.get("expireAfterSeconds") == ttl_seconds:
+                    break
+                if ttl_seconds is not None and "expireAfterSeconds" in index:
+                    await db.command({"collMod": collection_name, "index": {"name": name, "expireAfterSeconds": ttl_seconds}})
+                    break
+                # A TTL index would delete messages before they are archived
+                await collection.drop_index(name)
+            else:
+                if ttl_seconds is not None:
+                    await collection.create_index(field, expireAfterSeconds=ttl_seconds)
+                else:
+                    await collection.create_index(field)
+
+    def start(self):
+        if self._task is None and any(p.enabled and p.mode == "archive" for p in self.policies.values()):
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def run(self):
+        while True:
+            for policy in self.policies.values():
+                if not (policy.enabled and policy.mode == "archive"):
+                    continue
+                try:
+                    if await acquire_lease(f"retention:{policy.collection}", self.owner, self.interval * 2):
+                        await self.archive(policy)
+                except Exception as e:
+                    self.stats["last_error"] = str(e)
+                    logger.error(f"Archiving {policy.collection} failed: {e}")
+            self.stats["runs"] += 1
+            self.stats["last_run_at"] = datetime.utcnow().isoformat()
+            await asyncio.sleep(self.interval)
+
+    async def archive(self, policy: RetentionPolicy) -> int:
+        """Export and delete everything older than the policy allows"""
+        before = datetime.utcnow() - policy.max_age
+        archived = 0
+        while True:
+            messages, keys = await message_store.expired(policy.collection, before, self.batch_size)
+            if not keys:
+                break
+            # Exported first; a crash before the delete archives the batch again next run
+            await asyncio.to_thread(self._export, policy.collection, messages)
+            await message_store.delete_expired(policy.collection, keys)
+            archived += len(messages)
+            self.stats["archived"] += len(messages)
+        if archived:
+            logger.info(f"Archived {archived} message(s) of {policy.collection}")
+        return archived
+
+    def _container_file(self, collection: str, day: str, container: str) -> Path:
+        # Dots are escaped too, so no container maps to "." or ".."
+        name = quote(str(container), safe="").replace(".", "%2E")
+        return self.archive_dir / collection / day / f"{name}.ndjson.gz"
+
+    def _export(self, collection: str, messages: List[dict]):
+        field = MESSAGE_CONTAINERS[collection]
+        by_file = {}
+        for message in messages:
+            path = self._container_file(collection, message["created_at"].strftime("%Y-%m-%d"), message[field])
+            by_file.setdefault(path, []).append(message)
+        for path, file_messages in by_file.items():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Each export appends a gzip member, readers see one stream
+            with open(path, "ab") as raw:
+                with gzip.GzipFile(fileobj=raw, mode="ab") as archive:
+                    for message in file_messages:
+                        archive.write((json_util.dumps(message) + "\n").encode())
+                raw.flush()
+                os.fsync(raw.fileno())
+
+    def list_archives(self) -> List[dict]:
+        archives = []
+        for collection in self.policies:
+            directory = self.archive_dir / collection
+            if not directory.exists():
+                continue
+            for path in sorted(directory.iterdir()):
+                if not (path.is_dir() and ARCHIVE_DAY_PATTERN.match(path.name)):
+                    continue
+                files = list(path.glob("*.ndjson.gz"))
+                archives.append({
+                    "collection": collection,
+                    "day": path.name,
+                    "containers": len(files),
+                    "bytes": sum(file.stat().st_size for file in files),
+                })
+        return archives
+
+    def read_archive(self, collection: str, day: str, container: Optional[str], offset: int, limit: int) -> Optional[List[dict]]:
+        """Messages of one archived day, optionally of a single group or sector; None if there is no archive"""
+        directory = self.archive_dir / collection / day
+        if not directory.is_dir():
+            return None
+        if container is not None:
+            paths = [self._container_file(collection, day, container)]
+        else:
+            paths = sorted(directory.glob("*.ndjson.gz"))
+        messages = []
+        skipped = 0
+        for path in paths:
+            if not path.exists():
+                continue
+            with gzip.open(path, "rt") as archive:
+                for line in archive:
+                    if not line.strip():
+                        continue
+                    if skipped < offset:
+                        skipped += 1
+                        continue
+                    messages.append(json_util.loads(line))
+                    if len(messages) >= limit:
+                        return messages
+        return messages
+
+    def get_stats(self) -> dict:
+        return {
+            "policies": [policy.as_dict() for policy in self.policies.values()],
+            "running": self._task is not None,
+            **self.stats,
+        }
+
+message_archiver = MessageArchiver(
+    policies=RETENTION_POLICIES,
+    archive_dir=ARCHIVE_DIR,
+    interval=RETENTION_INTERVAL,
+    batch_size=RETENTION_BATCH_SIZE,
+)
+
+# ==================== GROUP DISCOVERY ====================
+
+DISCOVERY_INTERVAL = float(os.environ.get("DISCOVERY_INTERVAL", "900"))  # Seconds between ranking runs
+DISCOVERY_ACTIVITY_DAYS = float(os.environ.get("DISCOVERY_ACTIVITY_DAYS", "7"))
+DISCOVERY_LIMIT = 100  # Groups kept per user and sector, like the old newest-first list
+DISCOVERY_WEIGHTS = {
+    "friends": 3.0,    # per friend in the group
+    "following": 1.5,  # per followed user in the group (friends count once)
+    "activity": 1.0,   # log of messages and posts in the activity window
+    "size": 0.5,       # log of the member count
+}
+
+class GroupDiscovery:
+    """
+    Ranks the groups of each sector for every user, the worker holding the
+    lease reruns it every DISCOVERY_INTERVAL seconds
+    - Score: friends and followed users in the group (overlap of the user's
+      contacts with the group's members, through a user -> groups index),
+      messages and posts of the last DISCOVERY_ACTIVITY_DAYS days, size
+    - group_recommendations keeps one document per user and sector with the
+      ranked group ids; joined and deleted groups are pulled out right away
+    - Discovery serves the live group documents in that order, after the
+      groups created since the run (see discover_groups)
+    """
+
+    def __init__(self, interval: float, activity_days: float, limit: int, weights: dict):
+        self.interval = interval
+        self.activity_window = timedelta(days=activity_days)
+        self.limit = limit
+        self.weights = weights
+        self.owner = f"{os.uname().nodename}:{os.getpid()}"
+        self.stats = {"runs": 0, "users": 0, "last_run_at": None, "last_duration": None, "last_error": None}
+        self._task = None
+
+    async def ensure_indexes(self):
+        # Joins pull the group from the user's lists, deletes from everyone's
+        await db.group_recommendations.create_index("user_id")
+        await db.group_recommendations.create_index("groups.id")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def run(self):
+        while True:
+            try:
+                if await acquire_lease("group_discovery", self.owner, self.interval * 2):
+                    await self.compute()
+            except Exception as e:
+                self.stats["last_error"] = str(e)
+                logger.error(f"Group discovery failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def recommendations(self, user_id: str, sector: str) -> Optional[dict]:
+        """{"groups": [{id, score}], "computed_at"} of a user in a sector, None before the first run covered the user"""
+        return await db.group_recommendations.find_one(
+            {"_id": f"{user_id}:{sector}"}, {"_id": 0, "groups": 1, "computed_at": 1}
+        )
+
+    async def joined(self, group_id: str, user_ids: List[str]):
+        await db.group_recommendations.update_many(
+            {"user_id": {"$in": user_ids}, "groups.id": group_id},
+            {"$pull": {"groups": {"id": group_id}}}
+        )
+
+    async def removed(self, group_id: str):
+        await db.group_recommendations.update_many(
+            {"groups.id": group_id}, {"$pull": {"groups": {"id": group_id}}}
+        )
+
+    async def _activity(self, since: datetime) -> dict:
+        """group_id -> messages and posts since a date"""
+        activity = await message_store.counts_since("group_messages", since)
+        async for row in db.posts_enhanced.aggregate([
+            {"$match": {"group_id": {"$ne": None}, "created_at": {"$gte": since}}},
+            {"$group": {"_id": "$group_id", "count": {"$sum": 1}}},
+        ]):
+            activity[row["_id"]] = activity.get(row["_id"], 0) + row["count"]
+        return activity
+
+    async def compute(self) -> int:
+        """Rank every sector's groups for every user, returns how many lists were written"""
+        started_at = datetime.utcnow()
+        started = asyncio.get_running_loop().time()
+        activity = await self._activity(started_at - self.activity_window)
+
+        groups = {}
+        async for group in db.groups.find({}, {"_id": 0}):
+            group.pop("member_ids", None)
+            group["score"] = (
+                self.weights["activity"] * math.log1p(activity.get(group["id"], 0))
+                + self.weights["size"] * math.log1p(group.get("member_count", 0))
+            )
+            groups[group["id"]] = group
+        by_sector = {}
+        for group in sorted(groups.values(), key=lambda group: group["score"], reverse=True):
+            by_sector.setdefault(group.get("sector", "drivers"), []).append(group)
+
+        # Sparse user x group incidence, as user -> set of groups
+        groups_of = {}
+        async for membership in db.group_memberships.find({}, {"_id": 0, "user_id": 1, "group_id": 1}):
+            if membership["group_id"] in groups:
+                groups_of.setdefault(membership["user_id"], set()).add(membership["group_id"])
+
+        following_of = {}
+        async for edge in db.follows.find({}, {"_id": 0, "follower_id": 1, "followee_id": 1}):
+            following_of.setdefault(edge["follower_id"], set()).add(edge["followee_id"])
+
+        written = 0
+        writes = []
+        async for user in db.users.find({}, {"_id": 0, "id": 1, "sectors": 1, "friend_ids": 1}):
+            own = groups_of.get(user["id"], set())
+            friends = set(user.get("friend_ids") or [])
+            following = following_of.get(user["id"], set()) - friends
+            overlap = {}
+            for contacts, weight in ((friends, self.weights["friends"]), (following, self.weights["following"])):
+                for contact in contacts:
+                    for group_id in groups_of.get(contact, ()):
+                        overlap[group_id] = overlap.get(group_id, 0) + weight
+            for sector in user.get("sectors") or ["drivers"]:
+                ranked = by_sector.get(sector, [])
+                # Without overlap the order is the sector's, only the top can make the cut
+                candidates = {group["id"]: group for group in ranked[:self.limit + len(own)]}
+                candidates.update(
+                    (group_id, groups[group_id]) for group_id in overlap
+                    if groups[group_id].get("sector", "drivers") == sector
+                )
+                scored = sorted(
+                    (
+                        (group["score"] + overlap.get(group_id, 0), group)
+                        for group_id, group in candidates.items() if group_id not in own
+                    ),
+                    key=lambda item: (item[0], item[1].get("created_at") or started_at),
+                    reverse=True
+                )[:self.limit]
+                writes.append(ReplaceOne(
+                    {"_id": f"{user['id']}:{sector}"},
+                    {
+                        "user_id": user["id"],
+                        "sector": sector,
+                        "groups": [{"id": group["id"], "score": round(score, 3)} for score, group in scored],
+                        "computed_at": started_at,
+                    },
+                    upsert=True
+                ))
+            if len(writes) >= 500:
+                await db.group_recommendations.bulk_write(writes, ordered=False)
+                written += len(writes)
+                writes = []
+        if writes:
+            await db.group_recommendations.bulk_write(writes, ordered=False)
+            written += len(writes)
+        # Deleted users and sectors they left
+        await db.group_recommendations.delete_many({"computed_at": {"$lt": started_at}})
+
+        self.stats["runs"] += 1
+        self.stats["users"] = written
+        self.stats["last_run_at"] = started_at.isoformat()
+        self.stats["last_duration"] = round(asyncio.get_running_loop().time() - started, 3)
+        return written
+
+group_discovery = GroupDiscovery(DISCOVERY_INTERVAL, DISCOVERY_ACTIVITY_DAYS, DISCOVERY_LIMIT, DISCOVERY_WEIGHTS)
+
+# ==================== FRIEND SUGGESTIONS ====================
+
+SUGGESTION_INTERVAL = float(os.environ.get("SUGGESTION_INTERVAL", "900"))  # Seconds between incremental runs
+SUGGESTION_FULL_INTERVAL = float(os.environ.get("SUGGESTION_FULL_INTERVAL", "86400"))  # Seconds between full runs
+SUGGESTION_LIMIT = 50  # Suggestions kept per user and sector
+SUGGESTION_MAX_GROUP_SIZE = 500  # Bigger groups say little about who knows whom
+SUGGESTION_WEIGHTS = {
+    "mutual_friends": 3.0,  # per friend in common
+    "shared_groups": 1.0,   # per group in common (of the sector)
+    "follows_you": 2.0,
+    "you_follow": 1.0,
+    "referral": 2.0,        # one invited the other
+}
+
+async def mark_graph_changed(user_ids: List[str]):
+    """Flag users whose friends, follows, groups or blocks changed, for the next incremental run"""
+    if user_ids:
+        await db.users.update_many({"id": {"$in": list(user_ids)}}, {"$set": {"graph_changed_at": datetime.utcnow()}})
+
+class FriendSuggestions:
+    """
+    People you may know, per user and sector, computed by the worker holding
+    the lease
+    - The social graph is loaded as sparse adjacency sets (friends, follows,
+      referrals, members of groups up to SUGGESTION_MAX_GROUP_SIZE)
+    - Candidates are friends of friends and co-members of the user's groups in
+      the sector, scored by mutual friends, shared groups, follows and
+      referrals; friends and blocked users (either way) are left out
+    - Every SUGGESTION_FULL_INTERVAL seconds all users are scored; in between,
+      runs only rescore users flagged by mark_graph_changed and their friends
+      and co-members, loading just the part of the graph their scores read
+    - Building the adjacency sets and scoring run in a thread
+    - user_suggestions keeps the top SUGGESTION_LIMIT per user and sector
+    """
+
+    def __init__(self, interval: float, full_interval: float, limit: int, max_group_size: int, weights: dict):
+        self.interval = interval
+        self.full_interval = full_interval
+        self.limit = limit
+        self.max_group_size = max_group_size
+        self.weights = weights
+        self.owner = f"{os.uname().nodename}:{os.getpid()}"
+        self.last_run_at = None
+        self.last_full_run_at = None
+        self.stats = {"runs": 0, "full_runs": 0, "users": 0, "last_run_at": None, "last_duration": None, "last_error": None}
+        self._task = None
+
+    async def ensure_indexes(self):
+        await db.user_suggestions.create_index("user_id")
+        # Incremental runs start from the flagged users
+        await db.users.create_index("graph_changed_at", sparse=True)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def run(self):
+        while True:
+            try:
+                if await acquire_lease("friend_suggestions", self.owner, self.interval * 2):
+                    now = datetime.utcnow()
+                    full = (
+                        self.last_full_run_at is None
+                        or (now - self.last_full_run_at).total_seconds() >= self.full_interval
+                    )
+                    await self.compute(since=None if full else self.last_run_at)
+                else:
+                    # Another worker ran it, start over with a full run when the lease comes back
+                    self.last_full_run_at = None
+            except Exception as e:
+                self.stats["last_error"] = str(e)
+                logger.error(f"Friend suggestions failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def suggestions(self, user_id: str, sector: str) -> List[dict]:
+        stored = await db.user_suggestions.find_one({"_id": f"{user_id}:{sector}"}, {"_id": 0, "suggestions": 1})
+        return stored["suggestions"] if stored else []
+
+    async def _load_users(self, query: dict) -> List[dict]:
+        return await db.users.find(query, {
+            "_id": 0, "id": 1, "sectors": 1, "friend_ids": 1, "blocked_user_ids": 1, "invited_by": 1
+        }).to_list(None)
+
+    async def _small_groups(self, query: dict) -> List[dict]:
+        return await db.groups.find(
+            {**query, "member_count": {"$lte": self.max_group_size}}, {"_id": 0, "id": 1, "sector": 1}
+        ).to_list(None)
+
+    async def _affected(self, since: datetime) -> set:
+        """Users flagged since a date and everyone whose candidates go through them"""
+        changed = await db.users.find(
+            {"graph_changed_at": {"$gte": since}}, {"_id": 0, "id": 1, "friend_ids": 1}
+        ).to_list(None)
+        affected = {user["id"] for user in changed}
+        for user in changed:
+            affected.update(user.get("friend_ids") or [])
+        group_ids = await db.group_memberships.distinct("group_id", {"user_id": {"$in": [user["id"] for user in changed]}})
+        groups = await self._small_groups({"id": {"$in": group_ids}})
+        if groups:
+            affected.update(await db.group_memberships.distinct(
+                "user_id", {"group_id": {"$in": [group["id"] for group in groups]}}
+            ))
+        return affected
+
+    async def _load_graph(self, scope: Optional[set] = None) -> dict:
+        """
+        Documents the scores read: all of them, or with a scope only those of the
+        scoped users, their friends, friends of friends, co-members, follows and
+        referrals
+        """
+        if scope is None:
+            return {
+                "users": await self._load_users({}),
+                "groups": await self._small_groups({}),
+                "memberships": await db.group_memberships.find({}, {"_id": 0, "user_id": 1, "group_id": 1}).to_list(None),
+                "follows": await db.follows.find({}, {"_id": 0, "follower_id": 1, "followee_id": 1}).to_list(None),
+            }
+        scope = list(scope)
+        users = await self._load_users({"$or": [{"id": {"$in": scope}}, {"invited_by": {"$in": scope}}]})
+        group_ids = await db.group_memberships.distinct("group_id", {"user_id": {"$in": scope}})
+        groups = await self._small_groups({"id": {"$in": group_ids}})
+        memberships = await db.group_memberships.find(
+            {"group_id": {"$in": [group["id"] for group in groups]}}, {"_id": 0, "user_id": 1, "group_id": 1}
+        ).to_list(None)
+        follows = await db.follows.find(
+            {"$or": [{"follower_id": {"$in": scope}}, {"followee_id": {"$in": scope}}]},
+            {"_id": 0, "follower_id": 1, "followee_id": 1}
+        ).to_list(None)
+
+        # Friends, inviters, co-members and follows, then the friends of the friends
+        loaded = {user["id"] for user in users}
+        scoped = [user for user in users if user["id"] in set(scope)]
+        hop = {membership["user_id"] for membership in memberships}
+        hop.update(user_id for edge in follows for user_id in (edge["follower_id"], edge["followee_id"]))
+        for user in scoped:
+            hop.update(user.get("friend_ids") or [])
+            if user.get("invited_by"):
+                hop.add(user["invited_by"])
+        friends = await self._load_users({"id": {"$in": list(hop - loaded)}})
+        users += friends
+        loaded.update(user["id"] for user in friends)
+        friend_ids = {friend_id for user in scoped for friend_id in user.get("friend_ids") or []}
+        second = {
+            candidate for user in users if user["id"] in friend_ids for candidate in user.get("friend_ids") or []
+        }
+        users += await self._load_users({"id": {"$in": list(second - loaded)}})
+        return {"users": users, "groups": groups, "memberships": memberships, "follows": follows}
+
+    def _build_graph(self, documents: dict) -> dict:
+        """Sparse adjacency sets of the loaded documents (run in a thread)"""
+        users = {user["id"]: user for user in documents["users"]}
+        friends = {user_id: set(user.get("friend_ids") or []) for user_id, user in users.items()}
+        blocked = {user_id: set(user.get("blocked_user_ids") or []) for user_id, user in users.items()}
+
+        sectors = {group["id"]: group.get("sector", "drivers") for group in documents["groups"]}
+        members = {}
+        groups_of = {}
+        for membership in documents["memberships"]:
+            if membership["group_id"] in sectors:
+                members.setdefault(membership["group_id"], set()).add(membership["user_id"])
+                groups_of.setdefault(membership["user_id"], set()).add(membership["group_id"])
+
+        following = {}
+        followers = {}
+        for edge in documents["follows"]:
+            following.setdefault(edge["follower_id"], set()).add(edge["followee_id"])
+            followers.setdefault(edge["followee_id"], set()).add(edge["follower_id"])
+
+        referrals = {}
+        for user_id, user in users.items():
+            if user.get("invited_by") in users:
+                referrals.setdefault(user_id, set()).add(user["invited_by"])
+                referrals.setdefault(user["invited_by"], set()).add(user_id)
+
+        return {
+            "users": users, "friends": friends, "blocked": blocked, "sectors": sectors, "members": members,
+            "groups_of": groups_of, "following": following, "followers": followers, "referrals": referrals,
+        }
+
+    def _score(self, graph: dict, user_id: str, sector: str) -> List[dict]:
+        friends = graph["friends"].get(user_id, set())
+        mutual = {}
+        for friend_id in friends:
+            for candidate in graph["friends"].get(friend_id, ()):
+                mutual[candidate] = mutual.get(candidate, 0) + 1
+        shared = {}
+        for group_id in graph["groups_of"].get(user_id, ()):
+            if graph["sectors"][group_id] != sector:
+                continue
+            for candidate in graph["members"][group_id]:
+                shared[candidate] = shared.get(candidate, 0) + 1
+        follows_you = graph["followers"].get(user_id, set())
+        you_follow = graph["following"].get(user_id, set())
+        referrals = graph["referrals"].get(user_id, set())
+
+        blocked = graph["blocked"].get(user_id, set())
+        suggestions = []
+        for candidate in set(mutual) | set(shared) | follows_you | you_follow | referrals:
+            other = graph["users"].get(candidate)
+            if (
+                other is None or candidate == user_id or candidate in friends or candidate in blocked
+                or user_id in graph["blocked"].get(candidate, ())
+                or sector not in (other.get("sectors") or ["drivers"])
+            ):
+                continue
+            score = (
+                self.weights["mutual_friends"] * mutual.get(candidate, 0)
+                + self.weights["shared_groups"] * shared.get(candidate, 0)
+                + self.weights["follows_you"] * (candidate in follows_you)
+                + self.weights["you_follow"] * (candidate in you_follow)
+                + self.weights["referral"] * (candidate in referrals)
+            )
+            suggestions.append({
+                "id": candidate,
+                "score": round(score, 3),
+                "mutual_friends": mutual.get(candidate, 0),
+                "shared_groups": shared.get(candidate, 0),
+            })
+        return heapq.nlargest(self.limit, suggestions, key=lambda suggestion: (suggestion["score"], suggestion["id"]))
+
+    def _score_users(self, graph: dict, user_ids: List[str], computed_at: datetime) -> List[ReplaceOne]:
+        """Suggestion lists of some users, in every sector they are in (run in a thread)"""
+        return [
+            ReplaceOne(
+                {"_id": f"{user_id}:{sector}"},
+                {
+                    "user_id": user_id,
+                    "sector": sector,
+                    "suggestions": self._score(graph, user_id, sector),
+                    "computed_at": computed_at,
+                },
+                upsert=True
+            )
+            for user_id in user_ids for sector in graph["users"][user_id].get("sectors") or ["drivers"]
+        ]
+
+    async def compute(self, since: Optional[datetime] = None) -> int:
+        """Score everyone (since=None) or the users affected by changes since a date, returns lists written"""
+        started_at = datetime.utcnow()
+        started = asyncio.get_running_loop().time()
+        scope = None if since is None else await self._affected(since)
+        # Building and scoring the graph is CPU work, kept off the event loop
+        graph = await asyncio.to_thread(self._build_graph, await self._load_graph(scope))
+        user_ids = [user_id for user_id in graph["users"] if scope is None or user_id in scope]
+
+        written = 0
+        for start in range(0, len(user_ids), 500):
+            writes = await asyncio.to_thread(self._score_users, graph, user_ids[start:start + 500], started_at)
+            if writes:
+                await db.user_suggestions.bulk_write(writes, ordered=False)
+                written += len(writes)
+        # Deleted users and sectors they left
+        stale = {"computed_at": {"$lt": started_at}}
+        if since is not None:
+            stale["user_id"] = {"$in": list(user_ids)}
+        await db.user_suggestions.delete_many(stale)
+
+        self.last_run_at = started_at
+        if since is None:
+            self.last_full_run_at = started_at
+            self.stats["full_runs"] += 1
+        self.stats["runs"] += 1
+        self.stats["users"] = len(user_ids)
+        self.stats["last_run_at"] = started_at.isoformat()
+        self.stats["last_duration"] = round(asyncio.get_running_loop().time() - started, 3)
+        return written
+
+friend_suggestions = FriendSuggestions(
+    SUGGESTION_INTERVAL, SUGGESTION_FULL_INTERVAL, SUGGESTION_LIMIT, SUGGESTION_MAX_GROUP_SIZE, SUGGESTION_WEIGHTS
+)
+
+# ==================== CHATROOM CACHE ====================
+
+CHATROOM_HISTORY_LIMIT = 200  # Max messages returned by /chatroom/messages
+CHATROOM_HISTORY_WINDOW = timedelta(hours=24)  # Only the last 24 hours are shown
+# Other workers' sends/deletes don't reach this process' buffers, so with a
+# pub/sub client manager the buffers are reloaded once they are this old
+CHATROOM_CACHE_MAX_AGE = float(os.environ.get(
+    "CHATROOM_CACHE_MAX_AGE", "2" if socketio_manager is not None else "0"
+))
+
+def serialize_chatroom_message(message: dict) -> dict:
+    """Convert a stored chatroom message into its JSON-ready API shape"""
+    msg = {k: v for k, v in message.items() if k != '_id'}
+    if isinstance(msg.get("created_at"), datetime):
+        msg["created_at"] = msg["created_at"].isoformat()
+    return msg
+
+class ChatroomCache:
+    """
+    In-memory ring buffer of recent chatroom messages per sector
+    - Filled at startup and lazily (single-flight) on a cache miss
+    - Appended on send, trimmed on delete/clear
+    - Keeps the serialized JSON response until the sector changes
+    """
+
+    def __init__(self, maxlen: int = CHATROOM_HISTORY_LIMIT, max_age: float = 0):
+        self.maxlen = maxlen
+        self.max_age = max_age  # Seconds before a buffer is reloaded, 0 = never
+        self._buffers = {}  # sector -> deque of (created_at, message)
+        self._loaded_at = {}  # sector -> loop time of the last refill
+        self._payloads = {}  # sector -> pre-serialized JSON body
+        self._pending = {}  # sector -> changes seen while a refill query is running
+        self._locks = {}  # sector -> asyncio.Lock for single-flight refill
+
+    def _expire(self, sector: str):
+        """Drop messages that fell out of the 24 hour window"""
+        buffer = self._buffers[sector]
+        cutoff = datetime.utcnow() - CHATROOM_HISTORY_WINDOW
+        while buffer and buffer[0][0] < cutoff:
+            buffer.popleft()
+            self._payloads.pop(sector, None)
+
+    def _apply(self, sector: str, change: tuple):
+        buffer = self._buffers[sector]
+        action, value = change
+        if action == "append":
+            buffer.append(value)
+        elif action == "remove":
+            kept = [entry for entry in buffer if entry[1].get("id") != value]
+            if len(kept) != len(buffer):
+                self._buffers[sector] = deque(kept, maxlen=self.maxlen)
+        elif action == "clear":
+            buffer.clear()
+        self._payloads.pop(sector, None)
+
+    def _record(self, sector: str, change: tuple):
+        if sector in self._pending:
+            self._pending[sector].append(change)
+        if sector in self._buffers:
+            self._apply(sector, change)
+
+    async def _load(self, sector: str):
+        cutoff = datetime.utcnow() - CHATROOM_HISTORY_WINDOW
+        messages = await message_store.recent("chatroom_messages", sector, self.maxlen, since=cutoff)
+        return deque(
+            ((msg["created_at"], serialize_chatroom_message(msg)) for msg in messages),
+            maxlen=self.maxlen
+        )
+
+    async def refill(self, sector: str):
+        """Load a sector from MongoDB; concurrent callers share one query"""
+        lock = self._locks.setdefault(sector, asyncio.Lock())
+        async with lock:
+            if sector in self._buffers:
+                return
+            self._pending[sector] = []
+            try:
+                buffer = await self._load(sector)
+                self._buffers[sector] = buffer
+                self._loaded_at[sector] = asyncio.get_running_loop().time()
+                # Replay sends/deletes that raced with the query, minus sends it already returned
+                loaded = {entry[1].get("id") for entry in buffer}
+                for change in self._pending[sector]:
+                    if change[0] != "append" or change[1][1].get("id") not in loaded:
+                        self._apply(sector, change)
+            finally:
+                self._pending.pop(sector, None)
+
+    async def warm_up(self):
+        """Fill the buffers of every sector that had chat activity recently"""
+        cutoff = datetime.utcnow() - CHATROOM_HISTORY_WINDOW
+        sectors = await message_store.containers_since("chatroom_messages", cutoff)
+        for sector in sectors:
+            if sector:
+                await self.refill(sector)
+
+    async def get_payload(self, sector: str, excluded: frozenset = frozenset()) -> str:
+        """Return the JSON body for GET /chatroom/messages, without messages of excluded users"""
+        if self.max_age and sector in self._buffers:
+            age = asyncio.get_running_loop().time() - self._loaded_at.get(sector, 0)
+            if age > self.max_age and not self._locks[sector].locked():
+                self._buffers.pop(sector, None)
+                self._payloads.pop(sector, None)
+        if sector not in self._buffers:
+            await self.refill(sector)
+        self._expire(sector)
+        if excluded:
+            return json.dumps(
+                [msg for _, msg in self._buffers[sector] if msg.get("user_id") not in excluded], default=str
+            )
+        payload = self._payloads.get(sector)
+        if payload is None:
+            payload = json.dumps([msg for _, msg in self._buffers[sector]], default=str)
+            self._payloads[sector] = payload
+        return payload
+
+    def find(self, sector: str, message_id: str) -> Optional[dict]:
+        """A buffered message of a sector, None when it isn't buffered"""
+        for _, message in reversed(self._buffers.get(sector, ())):
+            if message.get("id") == message_id:
+                return message
+        return None
+
+    def append(self, sector: str, message: dict):
+        """Add a freshly stored message"""
+        self._record(sector, ("append", (message["created_at"], serialize_chatroom_message(message))))
+
+    def remove(self, message_id: str, sector: Optional[str] = None):
+        """Drop a deleted message from the buffer of its sector"""
+        sectors = [sector] if sector else set(self._buffers) | set(self._pending)
+        for s in sectors:
+            self._record(s, ("remove", message_id))
+
+    def clear(self):
+        """Empty every sector (chatroom cleared or database reset)"""
+        for sector in set(self._buffers) | set(self._pending):
+            self._record(sector, ("clear", None))
+
+chatroom_cache = ChatroomCache(max_age=CHATROOM_CACHE_MAX_AGE)
+
 # ==================== PUBLIC CHAT ROOM ====================
 
 @api_router.get("/chatroom/messages")
@@ -2279,35 +5069,72 @@ async def get_chatroom_messages(
     current_user: User = Depends(get_current_user)
 ):
     """Get latest public chat messages - max 200 OR last 24 hours, filtered by sector"""
-    twenty_four_hours_ago = datetime.utcnow() - timedelta(hours=24)
-    
-    # Get messages from last 24 hours OR max 200 messages, filtered by sector
-    messages = await db.chatroom_messages.find(
-        {
-            "created_at": {"$gte": twenty_four_hours_ago},
-            "sector": sector
-        },
-        {"_id": 0}
-    ).sort("created_at", -1).limit(200).to_list(200)
-    
-    messages.reverse()  # Oldest first
-    
-    # Convert datetime to ISO string
-    for msg in messages:
-        if isinstance(msg.get("created_at"), datetime):
-            msg["created_at"] = msg["created_at"].isoformat()
-    
-    return messages
+    validate_sector(sector)
+    # Served from the in-memory ring buffer, already serialized unless the user blocks someone
+    payload = await chatroom_cache.get_payload(sector, await block_index.excluded(current_user.id))
+    return Response(content=payload, media_type="application/json")
+
+@api_router.get("/chatroom/messages/{message_id}")
+async def get_chatroom_message(message_id: str, sector: str = "drivers", current_user: User = Depends(get_current_user)):
+    """One message in full, for clients that got a reference-only copy over the socket"""
+    validate_sector(sector)
+    message = chatroom_cache.find(sector, message_id)
+    if message is None:
+        await message_writer.flush()
+        message = await message_store.find_one("chatroom_messages", message_id, sector)
+        if message is None:
+            raise HTTPException(status_code=404, detail="Message not found")
+        message = serialize_chatroom_message(message)
+    return message
 
 @api_router.get("/chatroom/status")
-async def get_chatroom_status(current_user: User = Depends(get_current_user)):
-    """Check if chatroom is enabled or disabled"""
+async def get_chatroom_status(sector: str = "drivers", current_user: User = Depends(get_current_user)):
+    """Check if chatroom is enabled or disabled, with the sector's online count"""
+    online_count = chatroom_online_count(sector)
     status = await db.chatroom_status.find_one({"id": "chatroom"})
     if not status:
         # Create default status
         await db.chatroom_status.insert_one({"id": "chatroom", "enabled": True})
-        return {"enabled": True}
-    return {"enabled": status.get("enabled", True)}
+        return {"enabled": True, "online_count": online_count}
+    return {"enabled": status.get("enabled", True), "online_count": online_count}
+
+@api_router.get("/presence")
+async def get_presence(
+    sector: str = "drivers",
+    group_id: Optional[str] = None,
+    chat_id: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """Online counts served from the in-memory presence tracker"""
+    result = {
+        "sector": sector,
+        "online_count": presence_tracker.online_count(f'sector:{sector}'),
+        "chatroom_online_count": chatroom_online_count(sector),
+    }
+    if group_id:
+        if not await membership_index.is_member("group", group_id, current_user.id):
+            raise HTTPException(status_code=403, detail="Not a member of this group")
+        result["group_online_count"] = presence_tracker.online_count(f'group_{group_id}')
+    if chat_id:
+        if not await membership_index.is_member("chat", chat_id, current_user.id):
+            raise HTTPException(status_code=403, detail="Not authorized")
+        result["chat_online_count"] = presence_tracker.online_count(chat_id)
+    return result
+
+CHATROOM_STATUS_TTL = 5  # Seconds sends rely on the cached enabled flag
+_chatroom_status = {"enabled": True, "expires_at": 0.0}
+
+async def chatroom_enabled() -> bool:
+    """Cached enabled flag of the chatroom, the last known value is kept while MongoDB fails"""
+    now = asyncio.get_running_loop().time()
+    if now >= _chatroom_status["expires_at"]:
+        try:
+            status = await db.chatroom_status.find_one({"id": "chatroom"})
+            _chatroom_status["enabled"] = status.get("enabled", True) if status else True
+        except PyMongoError as e:
+            logger.warning(f"Chatroom status read failed, using the last known value: {e}")
+        _chatroom_status["expires_at"] = now + CHATROOM_STATUS_TTL
+    return _chatroom_status["enabled"]
 
 class ChatMessageCreate(BaseModel):
     content: Optional[str] = None
@@ -2316,17 +5143,12 @@ class ChatMessageCreate(BaseModel):
     message_type: str = "text"  # "text" or "audio"
     sector: str = "drivers"  # Which sector the message belongs to
 
-@api_router.post("/chatroom/messages")
-@limiter.limit("60/minute")  # Max 60 chat messages per minute (1 per second average)
-async def send_chatroom_message(
-    request: Request,
-    message_data: ChatMessageCreate,
-    current_user: User = Depends(get_current_user)
-):
-    """Send a message (text or audio) to public chat room"""
+async def create_chatroom_message(current_user: User, message_data: ChatMessageCreate) -> dict:
+    """Validate, store and broadcast a chatroom message (REST and Socket.IO)"""
+    validate_sector(message_data.sector)
+    
     # Check if chat is enabled
-    status = await db.chatroom_status.find_one({"id": "chatroom"})
-    if status and not status.get("enabled", True):
+    if not await chatroom_enabled():
         raise HTTPException(status_code=403, detail="Chat is currently disabled by admin")
     
     # Sanitize and validate based on message type
@@ -2348,7 +5170,7 @@ async def send_chatroom_message(
     else:
         raise HTTPException(status_code=400, detail="Invalid message type")
     
-    message_id = str(int(datetime.utcnow().timestamp() * 1000))
+    message_id = new_message_id()
     now = datetime.utcnow()
     
     message_db = {
@@ -2362,10 +5184,13 @@ async def send_chatroom_message(
         "duration": message_data.duration,
         "message_type": message_data.message_type,
         "sector": message_data.sector,
-        "created_at": now
+        "created_at": now,
+        "seq": await next_room_seq(chatroom_room(message_data.sector))
     }
     
-    await db.chatroom_messages.insert_one(message_db)
+    await message_writer.save("chatroom_messages", message_db)
+    chatroom_cache.append(message_data.sector, message_db)
+    activity_rollups.record("messages", message_data.sector)
     
     # Prepare message for Socket.IO (with ISO string datetime)
     message_emit = {
@@ -2378,14 +5203,25 @@ async def send_chatroom_message(
         "audio": message_data.audio,
         "duration": message_data.duration,
         "message_type": message_data.message_type,
-        "created_at": now.isoformat()
+        "created_at": now.isoformat(),
+        "seq": message_db["seq"]
     }
     
-    # Emit to all connected clients via Socket.IO
-    await sio.emit('new_chatroom_message', message_emit, room='chatroom')
+    # Emit to the clients of this sector via Socket.IO
+    await emit_sequenced('new_chatroom_message', message_emit, chatroom_room(message_data.sector))
     
     return message_emit
 
+@api_router.post("/chatroom/messages")
+@limit_message_sends()  # Max 60 messages per minute and user (1 per second average)
+async def send_chatroom_message(
+    request: Request,
+    message_data: ChatMessageCreate,
+    current_user: User = Depends(get_current_user)
+):
+    """Send a message (text or audio) to public chat room"""
+    return await create_chatroom_message(current_user, message_data)
+
 # ==================== GROUP CHAT ====================
 
 @api_router.get("/groups/{group_id}/messages")
@@ -2394,21 +5230,10 @@ async def get_group_messages(
     current_user: User = Depends(get_current_user)
 ):
     """Get group chat messages - only for group members"""
-    # Verify user is a member
-    group = await db.groups.find_one({"id": group_id})
-    if not group:
-        raise HTTPException(status_code=404, detail="Group not found")
-    
-    if current_user.id not in group["member_ids"]:
-        raise HTTPException(status_code=403, detail="Not a member of this group")
+    await require_group_member(group_id, current_user.id)
     
-    # Get last 200 messages
-    messages = await db.group_messages.find(
-        {"group_id": group_id},
-        {"_id": 0}
-    ).sort("created_at", -1).limit(200).to_list(200)
-    
-    messages.reverse()  # Oldest first
+    # Get last 200 messages, oldest first
+    messages = await message_store.recent("group_messages", group_id, 200)
     
     # Convert datetime to ISO string
     for msg in messages:
@@ -2417,22 +5242,19 @@ async def get_group_messages(
     
     return messages
 
-@api_router.post("/groups/{group_id}/messages")
-@limiter.limit("60/minute")  # Max 60 group messages per minute
-async def send_group_message(
-    request: Request,
-    group_id: str,
-    message: GroupMessageCreate,
-    current_user: User = Depends(get_current_user)
-):
-    """Send a message (text or audio) to group chat"""
-    # Verify user is a member
-    group = await db.groups.find_one({"id": group_id})
-    if not group:
-        raise HTTPException(status_code=404, detail="Group not found")
-    
-    if current_user.id not in group["member_ids"]:
-        raise HTTPException(status_code=403, detail="Not a member of this group")
+@api_router.get("/groups/{group_id}/messages/{message_id}")
+async def get_group_message(group_id: str, message_id: str, current_user: User = Depends(get_current_user)):
+    """One message in full, for clients that got a reference-only copy over the socket"""
+    await require_group_member(group_id, current_user.id)
+    await message_writer.flush()
+    message = await message_store.find_one("group_messages", message_id, group_id)
+    if message is None:
+        raise HTTPException(status_code=404, detail="Message not found")
+    return serialize_chatroom_message(message)
+
+async def create_group_message(current_user: User, group_id: str, message: GroupMessageCreate) -> dict:
+    """Validate, store and broadcast a group chat message (REST and Socket.IO)"""
+    await require_group_member(group_id, current_user.id)
     
     # Sanitize and validate based on message type
     content = None
@@ -2453,7 +5275,7 @@ async def send_group_message(
     else:
         raise HTTPException(status_code=400, detail="Invalid message type")
     
-    message_id = str(int(datetime.utcnow().timestamp() * 1000))
+    message_id = new_message_id()
     now = datetime.utcnow()
     
     message_db = {
@@ -2467,10 +5289,12 @@ async def send_group_message(
         "audio": audio,
         "duration": message.duration,
         "message_type": message.message_type,
-        "created_at": now
+        "created_at": now,
+        "seq": await next_room_seq(f'group_{group_id}')
     }
     
-    await db.group_messages.insert_one(message_db)
+    await message_writer.save("group_messages", message_db)
+    activity_rollups.record("messages", await activity_rollups.container_sector("groups", group_id))
     
     # Prepare message for Socket.IO (with ISO string datetime)
     message_emit = {
@@ -2484,14 +5308,27 @@ async def send_group_message(
         "audio": message.audio,
         "duration": message.duration,
         "message_type": message.message_type,
-        "created_at": now.isoformat()
+        "created_at": now.isoformat(),
+        "seq": message_db["seq"]
     }
     
     # Emit to group room via Socket.IO
-    await sio.emit('new_group_message', message_emit, room=f'group_{group_id}')
+    await emit_sequenced('new_group_message', message_emit, f'group_{group_id}')
+    typing_tracker.stop(f'group_{group_id}', current_user.id)
     
     return message_emit
 
+@api_router.post("/groups/{group_id}/messages")
+@limit_message_sends()  # Max 60 messages per minute and user
+async def send_group_message(
+    request: Request,
+    group_id: str,
+    message: GroupMessageCreate,
+    current_user: User = Depends(get_current_user)
+):
+    """Send a message (text or audio) to group chat"""
+    return await create_group_message(current_user, group_id, message)
+
 @api_router.delete("/groups/{group_id}/messages/{message_id}")
 async def delete_group_message(
     group_id: str,
@@ -2499,7 +5336,8 @@ async def delete_group_message(
     current_user: User = Depends(get_current_user)
 ):
     """Delete own message from group chat"""
-    message = await db.group_messages.find_one({"id": message_id, "group_id": group_id})
+    await message_writer.flush()
+    message = await message_store.find_one("group_messages", message_id, group_id)
     
     if not message:
         raise HTTPException(status_code=404, detail="Message not found")
@@ -2508,10 +5346,11 @@ async def delete_group_message(
     if message["user_id"] != current_user.id and not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    await db.group_messages.delete_one({"id": message_id})
+    await message_store.delete_one("group_messages", message)
     
     # Notify via Socket.IO
-    await sio.emit('delete_group_message', {"message_id": message_id}, room=f'group_{group_id}')
+    room = f'group_{group_id}'
+    await emit_sequenced('delete_group_message', {"message_id": message_id, "seq": await next_room_seq(room)}, room)
     
     return {"message": "Message deleted"}
 
@@ -2520,6 +5359,8 @@ async def delete_group_message(
 async def reset_database(request: Request, admin: User = Depends(require_admin)):
     """DANGER: Reset entire database except admin users"""
     try:
+        await message_writer.flush()
+        
         # Delete all non-admin users
         result = await db.users.delete_many({"is_admin": {"$ne": True}})
         users_deleted = result.deleted_count
@@ -2529,9 +5370,18 @@ async def reset_database(request: Request, admin: User = Depends(require_admin))
         await db.posts_enhanced.delete_many({})
         await db.comments.delete_many({})
         await db.groups.delete_many({})
-        await db.group_messages.delete_many({})
-        await db.chatroom_messages.delete_many({})
+        await db.group_memberships.delete_many({})
+        await db.group_recommendations.delete_many({})
+        await db.user_suggestions.delete_many({})
+        await db.user_stats.delete_many({})
+        await db.activity_rollups.delete_many({})
+        await message_store.clear("group_messages")
+        await message_store.clear("chatroom_messages")
+        chatroom_cache.clear()
         await db.friend_requests.delete_many({})
+        await db.follows.delete_many({})
+        # The admins kept lose every follow edge with the rest
+        await db.users.update_many({}, {"$set": {"followers_count": 0, "following_count": 0}})
         await db.chats.delete_many({})
         await db.chat_messages.delete_many({})
         await db.reports.delete_many({})
@@ -2559,7 +5409,8 @@ async def delete_chatroom_message(
     current_user: User = Depends(get_current_user)
 ):
     """Delete own message from chatroom"""
-    message = await db.chatroom_messages.find_one({"id": message_id})
+    await message_writer.flush()
+    message = await message_store.find_one("chatroom_messages", message_id)
     
     if not message:
         raise HTTPException(status_code=404, detail="Message not found")
@@ -2568,22 +5419,26 @@ async def delete_chatroom_message(
     if message["user_id"] != current_user.id and not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Not authorized to delete this message")
     
-    await db.chatroom_messages.delete_one({"id": message_id})
+    await message_store.delete_one("chatroom_messages", message)
+    chatroom_cache.remove(message_id, message.get("sector"))
     
-    # Notify all clients
-    await sio.emit('chatroom_message_deleted', {"message_id": message_id}, room='chatroom')
+    # Notify clients of the message's sector
+    room = chatroom_room(message.get("sector", "drivers"))
+    await emit_sequenced('chatroom_message_deleted', {"message_id": message_id, "seq": await next_room_seq(room)}, room)
     
     return {"message": "Message deleted"}
 
 @api_router.delete("/admin/chatroom/clear")
 async def clear_chatroom(admin: User = Depends(require_admin)):
     """Clear all chatroom messages (admin only)"""
-    result = await db.chatroom_messages.delete_many({})
+    await message_writer.flush()
+    deleted_count = await message_store.clear("chatroom_messages")
+    chatroom_cache.clear()
     
     # Notify all clients
     await sio.emit('chatroom_cleared', {}, room='chatroom')
     
-    return {"message": f"Cleared {result.deleted_count} messages"}
+    return {"message": f"Cleared {deleted_count} messages"}
 
 @api_router.post("/admin/chatroom/toggle")
 async def toggle_chatroom(
@@ -2596,6 +5451,7 @@ async def toggle_chatroom(
         {"$set": {"enabled": enabled}},
         upsert=True
     )
+    _chatroom_status["expires_at"] = 0.0  # Other workers pick it up within CHATROOM_STATUS_TTL
     
     # Notify all clients
     await sio.emit('chatroom_status_changed', {"enabled": enabled}, room='chatroom')
@@ -2698,67 +5554,603 @@ async def get_notification_preferences(
 
 # ==================== SOCKET.IO ====================
 
+class SocketSessionRegistry:
+    """
+    Server-side registry of the authenticated sockets of this process
+    - sid -> user, sectors and joined rooms
+    - user_id -> sids, to reach a user's sockets without a room lookup
+    """
+
+    def __init__(self):
+        self.sessions = {}  # sid -> {"user": User, "sectors": set, "rooms": set}
+        self.user_sids = {}  # user_id -> set of sids
+
+    def add(self, sid: str, user: User):
+        self.sessions[sid] = {"user": user, "sectors": set(user.sectors), "rooms": set()}
+        self.user_sids.setdefault(user.id, set()).add(sid)
+
+    def remove(self, sid: str) -> Optional[dict]:
+        session = self.sessions.pop(sid, None)
+        if session:
+            sids = self.user_sids.get(session["user"].id, set())
+            sids.discard(sid)
+            if not sids:
+                self.user_sids.pop(session["user"].id, None)
+        return session
+
+    def get_user(self, sid: str) -> Optional[User]:
+        session = self.sessions.get(sid)
+        return session["user"] if session else None
+
+    async def refresh_user(self, sid: str) -> User:
+        """
+        Reload a socket's user like get_current_user does for each REST request,
+        so bans and name/avatar changes apply to the next send
+        """
+        session = self.sessions.get(sid)
+        if session is None:
+            raise HTTPException(status_code=401, detail="Not authenticated")
+        user = await db.users.find_one({"id": session["user"].id})
+        if user is None:
+            raise HTTPException(status_code=401, detail="User not found")
+        if user.get("is_banned"):
+            raise HTTPException(status_code=403, detail="Account banned")
+        session["user"] = User(**user)
+        return session["user"]
+
+    def joined(self, sid: str, room: str, sector: Optional[str] = None):
+        session = self.sessions.get(sid)
+        if session:
+            session["rooms"].add(room)
+            if sector:
+                session["sectors"].add(sector)
+
+    def left(self, sid: str, room: str):
+        session = self.sessions.get(sid)
+        if session:
+            session["rooms"].discard(room)
+
+    def sids_for_user(self, user_id: str) -> set:
+        return self.user_sids.get(user_id, set())
+
+socket_sessions = SocketSessionRegistry()
+
+class MembershipIndex:
+    """
+    Cached memberships that authorize the chat hot paths (message sends and
+    reads, room joins) without a MongoDB round-trip
+    - Groups: (group_id, user_id) -> role, None for non-members
+    - Chats: chat_id -> member ids (direct chats are two users)
+    - Entries expire after MEMBERSHIP_CACHE_TTL seconds, non-members after
+      MEMBERSHIP_NEGATIVE_TTL; changes made through this worker invalidate right
+      away, other workers see them once their entries expire
+    - At most MEMBERSHIP_CACHE_SIZE entries in a TTLCache
+    """
+
+    def __init__(self, ttl: float = 60, negative_ttl: float = 5, max_entries: int = 100000):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.cache = TTLCache(max_entries)  # ("group", group_id, user_id) -> role, ("chat", chat_id) -> member ids
+        self.stats = self.cache.stats
+
+    def _put(self, key: tuple, value, found: bool):
+        self.cache.put(key, value, self.ttl if found else self.negative_ttl)
+
+    async def group_role(self, group_id: str, user_id: str) -> Optional[str]:
+        key = ("group", group_id, user_id)
+        role = self.cache.get(key)
+        if role is TTLCache.MISSING:
+            role = await group_role(group_id, user_id)
+            self._put(key, role, role is not None)
+        return role
+
+    async def chat_members(self, chat_id: str) -> frozenset:
+        key = ("chat", chat_id)
+        members = self.cache.get(key)
+        if members is TTLCache.MISSING:
+            chat = await db.chats.find_one({"id": chat_id}, {"_id": 0, "members": 1})
+            members = frozenset(chat.get("members", [])) if chat else frozenset()
+            self._put(key, members, bool(members))
+        return members
+
+    async def is_member(self, kind: str, container_id: str, user_id: str) -> bool:
+        if kind == "group":
+            return await self.group_role(container_id, user_id) is not None
+        return user_id in await self.chat_members(container_id)
+
+    def invalidate(self, kind: str, container_id: str, user_id: Optional[str] = None):
+        """Forget a chat, a group membership, or every cached membership of a group"""
+        if kind == "chat":
+            self.cache.pop(("chat", container_id))
+        elif user_id is not None:
+            self.cache.pop(("group", container_id, user_id))
+        else:
+            self.cache.pop_where(lambda key: key[:2] == ("group", container_id))
+
+membership_index = MembershipIndex(
+    ttl=float(os.environ.get("MEMBERSHIP_CACHE_TTL", "60")),
+    negative_ttl=float(os.environ.get("MEMBERSHIP_NEGATIVE_TTL", "5")),
+    max_entries=int(os.environ.get("MEMBERSHIP_CACHE_SIZE", "100000"))
+)
+
+class PresenceTracker:
+    """
+    In-memory presence driven by socket connect/disconnect, room joins and heartbeats
+    - Online-user sets per scope: 'sector:{sector}', and every joined room
+      ('chatroom:{sector}', 'group_{id}', chat ids)
+    - Joins/leaves only mark scopes dirty; every PRESENCE_TICK seconds one
+      batched 'presence_update' diff is emitted per changed room
+    - Clients that send 'presence_heartbeat' go offline once they stop sending
+      for PRESENCE_TIMEOUT seconds, even if the socket stays open
+    - With a pub/sub client manager each worker shares a snapshot of its sets
+      in MongoDB and merges the others' into its view on every tick
+    """
+
+    def __init__(self, tick: float = 2, timeout: float = 90):
+        self.tick_interval = tick
+        self.timeout = timeout
+        self.scopes = {}  # scope -> {user_id: set of sids}
+        self.heartbeats = {}  # sid -> loop time of the last heartbeat
+        self.away = set()  # sids whose heartbeats stopped
+        self._remote = {}  # scope -> set of user ids online on other workers
+        self._published = {}  # scope -> user ids in the last published diff
+        self._dirty = set()
+        self.host_id = getattr(socketio_manager, 'host_id', None)
+
+    def enter(self, scope: str, user_id: str, sid: str):
+        if sid in self.away:
+            return
+        users = self.scopes.setdefault(scope, {})
+        if user_id not in users:
+            self._dirty.add(scope)
+        users.setdefault(user_id, set()).add(sid)
+
+    def leave(self, scope: str, user_id: str, sid: str):
+        users = self.scopes.get(scope)
+        if not users or user_id not in users:
+            return
+        users[user_id].discard(sid)
+        if not users[user_id]:
+            del users[user_id]
+            self._dirty.add(scope)
+        if not users:
+            del self.scopes[scope]
+
+    def connected(self, sid: str, user: User):
+        for sector in user.sectors:
+            self.enter(f'sector:{sector}', user.id, sid)
+
+    def disconnected(self, sid: str, session: Optional[dict]):
+        if session:
+            for scope in self._scopes_of(session):
+                self.leave(scope, session["user"].id, sid)
+        self.heartbeats.pop(sid, None)
+        self.away.discard(sid)
+
+    def heartbeat(self, sid: str):
+        self.heartbeats[sid] = asyncio.get_running_loop().time()
+        if sid in self.away:
+            # Back from the background - restore its scopes
+            self.away.discard(sid)
+            session = socket_sessions.sessions.get(sid)
+            if session:
+                for scope in self._scopes_of(session):
+                    self.enter(scope, session["user"].id, sid)
+
+    def _scopes_of(self, session: dict) -> set:
+        return {f'sector:{s}' for s in session["user"].sectors} | session["rooms"]
+
+    def _expire(self):
+        cutoff = asyncio.get_running_loop().time() - self.timeout
+        for sid, last_seen in list(self.heartbeats.items()):
+            if last_seen < cutoff and sid not in self.away:
+                session = socket_sessions.sessions.get(sid)
+                if session:
+                    for scope in self._scopes_of(session):
+                        self.leave(scope, session["user"].id, sid)
+                self.away.add(sid)
+
+    def online_users(self, scope: str) -> set:
+        return set(self.scopes.get(scope, {})) | self._remote.get(scope, set())
+
+    def online_count(self, scope: str) -> int:
+        return len(self.online_users(scope))
+
+    async def _sync_cluster(self):
+        """Share this worker's sets and merge the other workers' snapshots"""
+        await db.presence_snapshots.update_one(
+            {"host_id": self.host_id},
+            {"$set": {
+                "scopes": {scope: list(users) for scope, users in self.scopes.items()},
+                "updated_at": datetime.utcnow()
+            }},
+            upsert=True
+        )
+        fresh_since = datetime.utcnow() - timedelta(seconds=self.tick_interval * 3)
+        snapshots = await db.presence_snapshots.find(
+            {"host_id": {"$ne": self.host_id}, "updated_at": {"$gte": fresh_since}},
+            {"_id": 0, "scopes": 1}
+        ).to_list(None)
+        remote = {}
+        for snapshot in snapshots:
+            for scope, users in snapshot.get("scopes", {}).items():
+                remote.setdefault(scope, set()).update(users)
+        for scope in set(remote) | set(self._remote):
+            if remote.get(scope, set()) != self._remote.get(scope, set()):
+                self._dirty.add(scope)
+        self._remote = remote
+
+    async def tick(self):
+        self._expire()
+        if self.host_id is not None:
+            await self._sync_cluster()
+        dirty, self._dirty = self._dirty, set()
+        for scope in dirty:
+            online = self.online_users(scope)
+            previous = self._published.get(scope, set())
+            if online == previous:
+                continue
+            if online:
+                self._published[scope] = online
+            else:
+                self._published.pop(scope, None)
+            if scope.startswith('sector:'):
+                continue  # Counts only, there is no socket room to notify
+            # Every worker publishes the merged view to its own sockets only
+            await sio.emit('presence_update', {
+                'room': scope,
+                'online_count': len(online),
+                'joined': sorted(online - previous),
+                'left': sorted(previous - online),
+            }, room=scope, ignore_queue=True)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.tick_interval)
+            try:
+                await self.tick()
+            except Exception as e:
+                logging.error(f"Presence tick failed: {e}")
+
+presence_tracker = PresenceTracker(
+    tick=float(os.environ.get("PRESENCE_TICK", "2")),
+    timeout=float(os.environ.get("PRESENCE_TIMEOUT", "90"))
+)
+
+class TypingAggregator:
+    """
+    Typing indicators of group and chat rooms, broadcast in coalesced updates
+    - typing_start/typing_stop only change this worker's per-room typing sets
+    - At most one 'typing_update' per room every TYPING_INTERVAL, listing who is
+      typing and who stopped since the last update
+    - Typers that don't repeat typing_start within TYPING_TIMEOUT are stopped;
+      rooms with typers are re-announced every TYPING_TIMEOUT / 2, so clients can
+      expire users on their own when an update is lost
+    """
+
+    def __init__(self, interval: float = 1, timeout: float = 6):
+        self.interval = interval
+        self.timeout = timeout
+        self.rooms = {}  # room -> {user_id: {"username": str, "sid": str, "expires_at": float}}
+        self._targets = {}  # room -> (payload key, id) of the typing_update event
+        self._stopped = {}  # room -> user ids stopped since the last update
+        self._announced = {}  # room -> loop time of the last update
+        self._dirty = set()
+
+    def _now(self) -> float:
+        return asyncio.get_running_loop().time()
+
+    def start(self, room: str, target: tuple, sid: str, user: User):
+        typers = self.rooms.setdefault(room, {})
+        self._targets[room] = target
+        if user.id not in typers:
+            self._dirty.add(room)
+            self._stopped.get(room, set()).discard(user.id)
+        typers[user.id] = {"username": user.username, "sid": sid, "expires_at": self._now() + self.timeout}
+
+    def stop(self, room: str, user_id: str):
+        typers = self.rooms.get(room)
+        if typers and typers.pop(user_id, None):
+            self._stopped.setdefault(room, set()).add(user_id)
+            self._dirty.add(room)
+            if not typers:
+                self.rooms.pop(room, None)
+
+    def disconnected(self, sid: str, session: Optional[dict]):
+        if session is None:
+            return
+        for room in list(session["rooms"]):
+            typer = self.rooms.get(room, {}).get(session["user"].id)
+            if typer and typer["sid"] == sid:
+                self.stop(room, session["user"].id)
+
+    def _expire(self, now: float):
+        for room, typers in list(self.rooms.items()):
+            for user_id, typer in list(typers.items()):
+                if typer["expires_at"] < now:
+                    self.stop(room, user_id)
+
+    async def tick(self):
+        now = self._now()
+        self._expire(now)
+        for room in self.rooms:
+            if now - self._announced.get(room, 0) >= self.timeout / 2:
+                self._dirty.add(room)
+        dirty, self._dirty = self._dirty, set()
+        for room in dirty:
+            typers = self.rooms.get(room, {})
+            stopped = self._stopped.pop(room, set())
+            key, target_id = self._targets[room]
+            if typers:
+                self._announced[room] = now
+            else:
+                self._targets.pop(room, None)
+                self._announced.pop(room, None)
+            await sio.emit('typing_update', {
+                key: target_id,
+                'typing': [{'user_id': user_id, 'username': typer['username']} for user_id, typer in typers.items()],
+                'stopped': sorted(stopped),
+            }, room=room)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.tick()
+            except Exception as e:
+                logging.error(f"Typing tick failed: {e}")
+
+typing_tracker = TypingAggregator(
+    interval=float(os.environ.get("TYPING_INTERVAL", "1")),
+    timeout=float(os.environ.get("TYPING_TIMEOUT", "6"))
+)
+
+def user_room(user_id: str) -> str:
+    return f'user:{user_id}'
+
+async def emit_to_user(event: str, data, user_id: str):
+    """Emit to every socket of a user"""
+    if socketio_manager is None:
+        for sid in list(socket_sessions.sids_for_user(user_id)):
+            await sio.emit(event, data, to=sid)
+    else:
+        # Other workers' sockets are only reachable through the shared manager
+        await sio.emit(event, data, room=user_room(user_id))
+
 @sio.event
-async def connect(sid, environ):
-    print(f"Client connected: {sid}")
+async def connect(sid, environ, auth=None):
+    # Authenticate once per connection so socket events don't need a token each
+    token = auth.get('token') if isinstance(auth, dict) else None
+    if not token:
+        raise socketio.exceptions.ConnectionRefusedError('Authentication required')
+    try:
+        user = await authenticate_token(token)
+    except HTTPException as e:
+        raise socketio.exceptions.ConnectionRefusedError(e.detail)
+    
+    if auth.get('compact'):
+        sio.set_compact(sid)
+    socket_sessions.add(sid, user)
+    presence_tracker.connected(sid, user)
+    await sio.enter_room(sid, user_room(user.id))
+    print(f"Client connected: {sid} (user {user.username})")
+
+# Chatroom messages are broadcast per sector ('chatroom:{sector}'); every chatroom
+# client also sits in the 'chatroom' room for admin-wide events (clear, toggle)
+def chatroom_room(sector: str) -> str:
+    return f'chatroom:{sector}'
+
+def chatroom_online_count(sector: str) -> int:
+    """Number of distinct users connected to a sector's chatroom"""
+    return presence_tracker.online_count(chatroom_room(sector))
+
+async def join_room(sid: str, room: str, sector: Optional[str] = None):
+    """Enter a socket.io room and record it in the session registry and presence"""
+    await sio.enter_room(sid, room)
+    socket_sessions.joined(sid, room, sector=sector)
+    user = socket_sessions.get_user(sid)
+    if user:
+        presence_tracker.enter(room, user.id, sid)
+
+async def leave_room(sid: str, room: str):
+    await sio.leave_room(sid, room)
+    socket_sessions.left(sid, room)
+    user = socket_sessions.get_user(sid)
+    if user:
+        presence_tracker.leave(room, user.id, sid)
+        typing_tracker.stop(room, user.id)
+
+async def remove_from_chatroom(sid) -> Optional[str]:
+    """Take a client out of its sector's chatroom, returns the sector it left"""
+    session = socket_sessions.sessions.get(sid)
+    rooms = [room for room in session["rooms"] if room.startswith('chatroom:')] if session else []
+    for room in rooms:
+        await leave_room(sid, room)
+    if rooms:
+        await sio.leave_room(sid, 'chatroom')
+        return rooms[0].split(':', 1)[1]
+    return None
+
+async def replay_missed(sid: str, room: str, last_seq) -> dict:
+    """
+    Send a rejoining client the events it missed after last_seq
+    - Replayed in order from the room's replay buffer
+    - Gaps the buffer no longer covers get a 'replay_gap' event, the client refetches over REST
+    """
+    try:
+        last_seq = int(last_seq)
+    except (TypeError, ValueError):
+        return {}
+    latest_seq = await latest_room_seq(room)
+    events = room_replay.since(room, last_seq, latest_seq)
+    if events is None:
+        await sio.emit('replay_gap', {"room": room, "last_seq": last_seq, "latest_seq": latest_seq}, to=sid)
+        return {"latest_seq": latest_seq, "replayed": 0, "gap": True}
+    for _, event, payload in events:
+        await sio.emit(event, payload, to=sid)
+    return {"latest_seq": latest_seq, "replayed": len(events), "gap": False}
 
 @sio.event
 async def disconnect(sid):
     print(f"Client disconnected: {sid}")
+    session = socket_sessions.remove(sid)
+    presence_tracker.disconnected(sid, session)
+    typing_tracker.disconnected(sid, session)
+
+@sio.event
+async def presence_heartbeat(sid, data=None):
+    """Keep the client online while the app is in the foreground"""
+    presence_tracker.heartbeat(sid)
 
 @sio.event
 async def join_chatroom(sid, data):
-    """Join the public chat room"""
-    sio.enter_room(sid, 'chatroom')
-    user_id = data.get('user_id')
-    username = data.get('username')
-    print(f"User {username} ({sid}) joined chatroom")
+    """Join the public chat room of a sector, replaying what was missed after last_seq"""
+    user = socket_sessions.get_user(sid)
+    if user is None:
+        return {"ok": False, "error": "Not authenticated"}
+    sector = (data or {}).get('sector') or 'drivers'
     
-    # Notify others
-    await sio.emit('user_joined', {'username': username, 'user_id': user_id}, room='chatroom', skip_sid=sid)
+    # Switching sectors leaves the previous sector's room
+    await remove_from_chatroom(sid)
+    
+    await sio.enter_room(sid, 'chatroom')
+    await join_room(sid, chatroom_room(sector), sector=sector)
+    print(f"User {user.username} ({sid}) joined chatroom {sector}")
+    
+    replay = await replay_missed(sid, chatroom_room(sector), data.get('last_seq')) if data else {}
+    
+    # Others are told in the next batched presence_update
+    return {"ok": True, "online_count": chatroom_online_count(sector), **replay}
 
 @sio.event
-async def leave_chatroom(sid):
+async def leave_chatroom(sid, data=None):
     """Leave the public chat room"""
-    sio.leave_room(sid, 'chatroom')
-    print(f"Client {sid} left chatroom")
+    sector = await remove_from_chatroom(sid)
+    print(f"Client {sid} left chatroom {sector}")
 
 @sio.event
 async def join_group_chat(sid, data):
-    """Join a group chat room"""
-    group_id = data.get('group_id')
-    user_id = data.get('user_id')
-    username = data.get('username')
+    """Join a group chat room - members only, replays what was missed after last_seq"""
+    user = socket_sessions.get_user(sid)
+    if user is None:
+        return {"ok": False, "error": "Not authenticated"}
+    group_id = (data or {}).get('group_id')
+    if not group_id or not await membership_index.is_member("group", group_id, user.id):
+        return {"ok": False, "error": "Not a member of this group"}
     
     room_name = f'group_{group_id}'
-    sio.enter_room(sid, room_name)
-    print(f"User {username} ({sid}) joined group chat {group_id}")
+    await join_room(sid, room_name)
+    print(f"User {user.username} ({sid}) joined group chat {group_id}")
+    
+    replay = await replay_missed(sid, room_name, data.get('last_seq'))
     
-    # Notify others in the group
-    await sio.emit('user_joined_group', {'username': username, 'user_id': user_id}, room=room_name, skip_sid=sid)
+    # Others are told in the next batched presence_update
+    return {"ok": True, "online_count": presence_tracker.online_count(room_name), **replay}
 
 @sio.event
 async def leave_group_chat(sid, data):
     """Leave a group chat room"""
-    group_id = data.get('group_id')
-    room_name = f'group_{group_id}'
-    sio.leave_room(sid, room_name)
+    group_id = (data or {}).get('group_id')
+    await leave_room(sid, f'group_{group_id}')
     print(f"Client {sid} left group chat {group_id}")
 
 @sio.event
 async def join_chat(sid, data):
-    chat_id = data.get('chat_id')
-    if chat_id:
-        sio.enter_room(sid, chat_id)
-        print(f"Client {sid} joined chat {chat_id}")
+    """Join a direct/group chat room - members only, replays what was missed after last_seq"""
+    user = socket_sessions.get_user(sid)
+    if user is None:
+        return {"ok": False, "error": "Not authenticated"}
+    chat_id = (data or {}).get('chat_id')
+    if not chat_id or not await membership_index.is_member("chat", chat_id, user.id):
+        return {"ok": False, "error": "Not authorized"}
+    await join_room(sid, chat_id)
+    print(f"Client {sid} joined chat {chat_id}")
+    replay = await replay_missed(sid, chat_id, data.get('last_seq'))
+    return {"ok": True, "online_count": presence_tracker.online_count(chat_id), **replay}
 
 @sio.event
 async def leave_chat(sid, data):
-    chat_id = data.get('chat_id')
+    chat_id = (data or {}).get('chat_id')
     if chat_id:
-        sio.leave_room(sid, chat_id)
+        await leave_room(sid, chat_id)
         print(f"Client {sid} left chat {chat_id}")
 
+def typing_room(sid: str, data) -> Optional[tuple]:
+    """Room and typing_update target of a typing event, only for rooms the socket has joined"""
+    data = data or {}
+    if data.get('group_id'):
+        room, target = f"group_{data['group_id']}", ('group_id', data['group_id'])
+    elif data.get('chat_id'):
+        room, target = data['chat_id'], ('chat_id', data['chat_id'])
+    else:
+        return None
+    session = socket_sessions.sessions.get(sid)
+    if session is None or room not in session["rooms"]:
+        return None
+    return room, target
+
+@sio.event
+async def typing_start(sid, data):
+    """The user is typing in a joined group or chat: {"group_id"} or {"chat_id"}, repeat every few seconds"""
+    found = typing_room(sid, data)
+    user = socket_sessions.get_user(sid)
+    if found is None or user is None:
+        return {"ok": False, "error": "Not in this room"}
+    typing_tracker.start(found[0], found[1], sid, user)
+    return {"ok": True}
+
+@sio.event
+async def typing_stop(sid, data):
+    found = typing_room(sid, data)
+    user = socket_sessions.get_user(sid)
+    if found is not None and user is not None:
+        typing_tracker.stop(found[0], user.id)
+
+# Same budget as the REST send endpoints (limit_message_sends)
+SOCKET_MESSAGE_RATE_LIMIT = parse_rate_limit(MESSAGE_RATE_LIMIT)
+
+@sio.on('send_message')
+async def socket_send_message(sid, data):
+    """
+    Send a chat, group or chatroom message over the socket
+    - data: {"type": "chat" | "group" | "chatroom", "chat_id"/"group_id", ...message fields}
+    - Goes through the same validation/storage as the REST endpoints
+    - Ack: {"ok": True, "id": ..., "created_at": ...} or {"ok": False, "status": ..., "error": ...}
+    """
+    try:
+        user = await socket_sessions.refresh_user(sid)
+    except HTTPException as e:
+        return {"ok": False, "status": e.status_code, "error": e.detail}
+    
+    # The limiter storage is synchronous (a network call with Redis), keep it off the event loop
+    allowed = await asyncio.to_thread(
+        limiter.limiter.hit, SOCKET_MESSAGE_RATE_LIMIT, user_rate_limit_key(user.id), MESSAGE_RATE_LIMIT_SCOPE
+    )
+    if not allowed:
+        return {"ok": False, "status": 429, "error": "Rate limit exceeded"}
+    
+    data = data or {}
+    message_type = data.get('type')
+    try:
+        if message_type == 'chat':
+            chat_id = data.get('chat_id')
+            message = await create_chat_message(user, chat_id, MessageCreate(chat_id=chat_id, content=data.get('content') or ""))
+            created_at = message["created_at"].isoformat()
+        elif message_type == 'group':
+            message = await create_group_message(user, data.get('group_id'), GroupMessageCreate(**data))
+            created_at = message["created_at"]
+        elif message_type == 'chatroom':
+            message = await create_chatroom_message(user, ChatMessageCreate(**data))
+            created_at = message["created_at"]
+        else:
+            return {"ok": False, "status": 400, "error": "Invalid message type"}
+    except HTTPException as e:
+        return {"ok": False, "status": e.status_code, "error": e.detail}
+    except ValidationError as e:
+        return {"ok": False, "status": 422, "error": str(e)}
+    
+    return {"ok": True, "id": message["id"], "created_at": created_at}
+
 # Include the router in the main app
 app.include_router(api_router)
 
@@ -2794,6 +6186,159 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def start_presence_tracker():
+    if presence_tracker.host_id is not None:
+        # Snapshots of workers that are gone (host ids change on every restart)
+        try:
+            await db.presence_snapshots.delete_many({"updated_at": {"$lt": datetime.utcnow() - timedelta(hours=1)}})
+        except Exception as e:
+            logger.error(f"Presence snapshot cleanup failed: {e}")
+    sio.start_background_task(presence_tracker.run)
+
+@app.on_event("startup")
+async def start_typing_tracker():
+    sio.start_background_task(typing_tracker.run)
+
+@app.on_event("startup")
+async def ensure_chat_indexes():
+    try:
+        # Inbox query of get_chats, then the message lookups by chat
+        await db.chats.create_index([("members", 1), ("sector", 1), ("last_message_time", -1)])
+        await message_store.ensure_indexes()
+        # Fails while duplicate 1-1 chats exist, run migrate_direct_chat_pairs.py
+        await db.chats.create_index(
+            "pair_key", unique=True, partialFilterExpression={"pair_key": {"$exists": True}}
+        )
+    except Exception as e:
+        logger.error(f"Chat index creation failed: {e}")
+
+@app.on_event("startup")
+async def ensure_group_indexes():
+    try:
+        # Unique membership, membership checks covered by the index, member pages, discovery
+        await db.group_memberships.create_index([("group_id", 1), ("user_id", 1)], unique=True)
+        await db.group_memberships.create_index([("user_id", 1), ("group_id", 1), ("role", 1)])
+        await db.group_memberships.create_index([("group_id", 1), ("joined_at", 1), ("_id", 1)])
+        await db.groups.create_index([("sector", 1), ("created_at", -1)])
+        if await db.groups.find_one({"member_ids": {"$exists": True}}, {"_id": 1}):
+            logger.warning("Groups with embedded member_ids found, run migrate_group_memberships.py")
+    except Exception as e:
+        logger.error(f"Group index creation failed: {e}")
+
+@app.on_event("startup")
+async def ensure_user_stat_indexes():
+    try:
+        # Per-user counts of the stats reconciliation and account deletion
+        await db.posts_enhanced.create_index("user_id")
+        await db.users.create_index("invited_by")
+    except Exception as e:
+        logger.error(f"User stat index creation failed: {e}")
+
+@app.on_event("startup")
+async def ensure_block_indexes():
+    try:
+        # Who blocked a user, for the other half of BlockIndex
+        await db.users.create_index("blocked_user_ids")
+    except Exception as e:
+        logger.error(f"Block index creation failed: {e}")
+
+@app.on_event("startup")
+async def ensure_follow_indexes():
+    try:
+        # Unique edge (also "does A follow B" and following ids), then both list directions
+        await db.follows.create_index([("follower_id", 1), ("followee_id", 1)], unique=True)
+        await db.follows.create_index([("followee_id", 1), ("_id", -1)])
+        await db.follows.create_index([("follower_id", 1), ("_id", -1)])
+        if await db.users.find_one({"following_ids": {"$exists": True}}, {"_id": 1}):
+            logger.warning("Users with embedded following_ids found, run migrate_follows.py")
+    except Exception as e:
+        logger.error(f"Follow index creation failed: {e}")
+
+@app.on_event("startup")
+async def ensure_friend_request_indexes():
+    try:
+        # Pending requests between a user and others, from either side
+        await db.friend_requests.create_index([("from_user_id", 1), ("request_status", 1), ("to_user_id", 1)])
+        await db.friend_requests.create_index([("to_user_id", 1), ("request_status", 1), ("from_user_id", 1)])
+    except Exception as e:
+        logger.error(f"Friend request index creation failed: {e}")
+
+@app.on_event("startup")
+async def warm_chatroom_cache():
+    try:
+        await chatroom_cache.warm_up()
+    except Exception as e:
+        logger.error(f"Chatroom cache warm-up failed: {e}")
+
+@app.on_event("startup")
+async def start_message_writer():
+    message_writer.start()
+
+@app.on_event("startup")
+async def start_message_archiver():
+    try:
+        await message_archiver.ensure_indexes()
+    except Exception as e:
+        logger.error(f"Retention index creation failed: {e}")
+    message_archiver.start()
+
+@app.on_event("startup")
+async def start_group_discovery():
+    try:
+        await group_discovery.ensure_indexes()
+    except Exception as e:
+        logger.error(f"Group discovery index creation failed: {e}")
+    group_discovery.start()
+
+@app.on_event("startup")
+async def start_friend_suggestions():
+    try:
+        await friend_suggestions.ensure_indexes()
+    except Exception as e:
+        logger.error(f"Friend suggestion index creation failed: {e}")
+    friend_suggestions.start()
+
+@app.on_event("startup")
+async def start_user_stats_reconciler():
+    user_stats_reconciler.start()
+
+@app.on_event("startup")
+async def start_activity_rollups():
+    try:
+        await activity_rollups.ensure_indexes()
+        # Pending report count of the admin dashboard
+        await db.reports.create_index("status")
+    except Exception as e:
+        logger.error(f"Activity rollup index creation failed: {e}")
+    activity_rollups.start()
+
+@app.on_event("shutdown")
+async def flush_activity_rollups():
+    # Before the MongoDB client closes
+    await activity_rollups.stop()
+
+@app.on_event("shutdown")
+async def stop_user_stats_reconciler():
+    await user_stats_reconciler.stop()
+
+@app.on_event("shutdown")
+async def stop_friend_suggestions():
+    await friend_suggestions.stop()
+
+@app.on_event("shutdown")
+async def stop_group_discovery():
+    await group_discovery.stop()
+
+@app.on_event("shutdown")
+async def stop_message_archiver():
+    await message_archiver.stop()
+
+@app.on_event("shutdown")
+async def flush_message_writer():
+    # Before the MongoDB client closes
+    await message_writer.stop()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
@@ -383,13 +383,20 @@ class DriversChatAPITester:
         else:
             self.log_test("Admin - Stats", False, "Stats endpoint failed")
         
-        # Test GET /api/admin/users
+        # Test GET /api/admin/users (one page, {"users": [...], "next_cursor": ...})
         response = self.make_request("GET", "/admin/users", token=self.admin_token)
         if response and response.status_code == 200:
             data = response.json()
-            if isinstance(data, list):
-                self.log_test("Admin - Users", True, f"Users endpoint working, returned {len(data)} users")
-                success_count += 1
+            if isinstance(data, dict) and isinstance(data.get("users"), list) and "next_cursor" in data:
+                next_page_ok = True
+                if data["next_cursor"]:
+                    next_page = self.make_request("GET", f"/admin/users?cursor={data['next_cursor']}", token=self.admin_token)
+                    next_page_ok = bool(next_page and next_page.status_code == 200 and isinstance(next_page.json().get("users"), list))
+                if next_page_ok:
+                    self.log_test("Admin - Users", True, f"Users endpoint working, returned {len(data['users'])} users")
+                    success_count += 1
+                else:
+                    self.log_test("Admin - Users", False, "Next users page failed")
             else:
                 self.log_test("Admin - Users", False, f"Invalid users response format: {type(data)}")
         else:
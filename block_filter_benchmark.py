@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Block Filter Benchmark
+
+Seeds a scratch database with a public feed and readers with growing block
+lists, then reports per block list size:
+- ms per feed page with the blocks as a $nin in the query ("before" of a
+  naive filter) and with find_visible's post-filter
+- ms to build the exclusion set (BlockIndex miss) and to serve it cached
+
+Reads backend/.env like the server and needs MongoDB; the scratch database
+(<DB_NAME>_block_bench) is dropped at the end.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+
+import server  # noqa: E402
+
+BLOCK_LIST_SIZES = [0, 100, 1000, 5000]
+
+def log_test(message, status="INFO"):
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    print(f"[{timestamp}] [{status}] {message}")
+
+async def seed(db, authors, posts, readers):
+    """authors users writing posts, readers users that block the first N authors"""
+    await db.users.insert_many([
+        {"id": f"author{i}", "username": f"author{i}", "blocked_user_ids": []} for i in range(authors)
+    ])
+    now = datetime.utcnow()
+    batch = []
+    for i in range(posts):
+        batch.append({
+            "id": f"post{i}",
+            "user_id": f"author{random.randrange(authors)}",
+            "content": "Road closed near the airport, take the coast road",
+            "privacy": {"level": "public", "specific_user_ids": []},
+            "sector": "drivers",
+            "created_at": now - timedelta(seconds=i),
+        })
+        if len(batch) == 5000:
+            await db.posts_enhanced.insert_many(batch)
+            batch = []
+    if batch:
+        await db.posts_enhanced.insert_many(batch)
+    await db.users.insert_many([
+        {"id": f"reader{size}", "username": f"reader{size}", "blocked_user_ids": [f"author{i}" for i in range(size)]}
+        for size in readers
+    ])
+    await db.posts_enhanced.create_index([("sector", 1), ("created_at", -1)])
+    await db.users.create_index("id")
+    await db.users.create_index("blocked_user_ids")
+
+async def timed(coro_factory, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        await coro_factory()
+    return (time.perf_counter() - start) / repeat * 1000
+
+async def run_size(db, size, page, pages, repeat):
+    reader = f"reader{size}"
+    index = server.BlockIndex(ttl=3600)
+
+    async def build():
+        index.invalidate([reader])
+        return await index.excluded(reader)
+
+    build_ms = await timed(build, repeat)
+    cached_ms = await timed(lambda: index.excluded(reader), repeat)
+    excluded = await index.excluded(reader)
+
+    query = {"sector": "drivers"}
+    sort = [("created_at", -1)]
+    results = {}
+    for label, skip in (("first page", 0), (f"page {pages}", page * (pages - 1))):
+        nin_ms = await timed(lambda: db.posts_enhanced.find(
+            {**query, "user_id": {"$nin": list(excluded)}} if excluded else query
+        ).sort(sort).skip(skip).limit(page).to_list(page), repeat)
+        visible_ms = await timed(lambda: server.find_visible(db.posts_enhanced, query, sort, skip, page, excluded), repeat)
+        rows = await server.find_visible(db.posts_enhanced, query, sort, skip, page, excluded)
+        results[label] = (nin_ms, visible_ms, len(rows))
+    return {"size": size, "build_ms": build_ms, "cached_ms": cached_ms, "pages": results}
+
+async def main():
+    parser = argparse.ArgumentParser(description="Compare block list filtering strategies")
+    parser.add_argument("--authors", type=int, default=10000)
+    parser.add_argument("--posts", type=int, default=100000)
+    parser.add_argument("--page", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=10, help="Deepest page measured")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    sizes = [size for size in BLOCK_LIST_SIZES if size <= args.authors]
+    db = server.client[f"{os.environ['DB_NAME']}_block_bench"]
+    server.db = db
+
+    log_test("=" * 60)
+    log_test(f"BLOCK FILTER BENCHMARK ({args.posts} posts by {args.authors} authors, page size {args.page})")
+    log_test("=" * 60)
+
+    try:
+        await seed(db, args.authors, args.posts, sizes)
+        log_test(f"{'blocks':>8}{'page':>12}{'$nin ms':>12}{'post-filter ms':>16}{'rows':>6}{'build ms':>10}{'cached ms':>11}")
+        for size in sizes:
+            result = await run_size(db, size, args.page, args.pages, args.repeat)
+            for label, (nin_ms, visible_ms, rows) in result["pages"].items():
+                log_test(
+                    f"{size:>8}{label:>12}{nin_ms:>12.2f}{visible_ms:>16.2f}{rows:>6}"
+                    f"{result['build_ms']:>10.2f}{result['cached_ms']:>11.4f}"
+                )
+    finally:
+        await server.client.drop_database(db.name)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
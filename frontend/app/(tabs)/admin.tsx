@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import {
   View,
   Text,
@@ -76,6 +76,8 @@ export default function AdminScreen() {
 
   const [stats, setStats] = useState<Stats | null>(null);
   const [users, setUsers] = useState<User[]>([]);
+  const [usersCursor, setUsersCursor] = useState<string | null>(null);  // next_cursor of the last page
+  const loadingMoreUsers = useRef(false);
   const [userSearch, setUserSearch] = useState('');
   const [filteredUsers, setFilteredUsers] = useState<User[]>([]);
   const [sortBy, setSortBy] = useState<'followers' | 'referrals' | 'posts' | 'friends' | 'recent'>('recent');
@@ -166,15 +168,19 @@ export default function AdminScreen() {
     }
   };
 
-  const loadUsers = async (t: string) => {
+  // One page of up to 500 users; the next one is loaded when the list is scrolled
+  // to its end (see onUsersScroll). Sorting and search apply to the pages loaded.
+  const loadUsers = async (t: string, cursor: string | null = null) => {
     try {
       console.log('Loading users with token:', t ? 'exists' : 'missing');
       console.log('API URL:', API_URL);
       const response = await axios.get(`${API_URL}/api/admin/users`, {
         headers: { Authorization: `Bearer ${t}` },
+        params: cursor ? { cursor } : {},
       });
-      console.log('Users loaded:', response.data.length);
-      setUsers(response.data);
+      console.log('Users loaded:', response.data.users.length);
+      setUsers((previous) => (cursor ? [...previous, ...response.data.users] : response.data.users));
+      setUsersCursor(response.data.next_cursor);
     } catch (error: any) {
       console.error('Failed to load users:', error.response?.status, error.response?.data);
       if (error.response?.status === 403) {
@@ -183,6 +189,16 @@ export default function AdminScreen() {
     }
   };
 
+  const onUsersScroll = ({ nativeEvent }: any) => {
+    const { layoutMeasurement, contentOffset, contentSize } = nativeEvent;
+    if (!token || !usersCursor || loadingMoreUsers.current) return;
+    if (layoutMeasurement.height + contentOffset.y < contentSize.height - 300) return;
+    loadingMoreUsers.current = true;
+    loadUsers(token, usersCursor).finally(() => {
+      loadingMoreUsers.current = false;
+    });
+  };
+
   const loadPosts = async (t: string) => {
     try {
       console.log('Loading posts...');
@@ -419,6 +435,8 @@ export default function AdminScreen() {
       <ScrollView
         style={styles.listContainer}
         refreshControl={<RefreshControl refreshing={refreshing} onRefresh={onRefresh} />}
+        onScroll={onUsersScroll}
+        scrollEventThrottle={200}
       >
         {filteredUsers.map((user) => (
           <TouchableOpacity
@@ -23,7 +23,16 @@ interface ChatMessage {
   audio?: string;
   duration?: number;
   message_type: 'text' | 'audio';
-  created_at: string;
+  created_at: string | number;  // Epoch milliseconds on compact sockets
+  seq?: number;
+  omitted?: string[];  // Large fields left out for a lagging connection
+}
+
+interface UserCard {
+  user_id: string;
+  username: string;
+  full_name: string;
+  user_profile_picture?: string;
 }
 
 export default function ChatRoomScreen() {
@@ -41,16 +50,19 @@ export default function ChatRoomScreen() {
   const [showVoiceRecorder, setShowVoiceRecorder] = useState(false);
   
   const socketRef = useRef<Socket | null>(null);
+  const lastSeqRef = useRef<number | null>(null);  // Newest room event seen, replayed from on reconnect
+  const userCardsRef = useRef<Record<string, UserCard>>({});  // Sender details, sent once per sender
   const flatListRef = useRef<FlatList>(null);
 
   useEffect(() => {
+    lastSeqRef.current = null;
     loadMessages();
     checkChatStatus();
     connectSocket();
     
     return () => {
       if (socketRef.current) {
-        socketRef.current.emit('leave_chatroom');
+        socketRef.current.emit('leave_chatroom', { sector: currentSector });
         socketRef.current.disconnect();
       }
     };
@@ -64,6 +76,7 @@ export default function ChatRoomScreen() {
         params: { sector: currentSector },
       });
       setMessages(response.data);
+      trackSeq(...response.data.map((m: ChatMessage) => m.seq ?? 0));
       if (showLoading) setLoading(false);
     } catch (error: any) {
       console.error('Load messages error:', error);
@@ -71,6 +84,24 @@ export default function ChatRoomScreen() {
     }
   };
 
+  // Full copy of one message that arrived reference-only (see 'omitted')
+  const loadFullMessage = async (messageId: string) => {
+    try {
+      const response = await axios.get(`${API_URL}/api/chatroom/messages/${messageId}`, {
+        headers: { Authorization: `Bearer ${token}` },
+        params: { sector: currentSector },
+      });
+      setMessages((prev) => prev.map(m => m.id === messageId ? { ...m, ...response.data, omitted: undefined } : m));
+    } catch (error: any) {
+      console.error('Load message error:', error);
+    }
+  };
+
+  const trackSeq = (...seqs: number[]) => {
+    const seq = Math.max(0, ...seqs);
+    if (seq > (lastSeqRef.current ?? 0)) lastSeqRef.current = seq;
+  };
+
   const onRefresh = async () => {
     setRefreshing(true);
     await loadMessages(false);
@@ -97,7 +128,10 @@ export default function ChatRoomScreen() {
     try {
       socketRef.current = io(socketUrl, {
         path: '/socket.io/',  // Socket.IO default path
-        transports: ['websocket', 'polling'], // Try websocket first
+        // Sockets are authenticated once in the handshake; compact events
+        // leave sender details out, they arrive once as 'user_card'
+        auth: { token, compact: true },
+        transports: ['websocket'], // Multi-worker servers refuse long-polling (see backend/run_server.py)
         reconnection: true,
         reconnectionDelay: 1000,
         reconnectionAttempts: 5,
@@ -111,6 +145,9 @@ export default function ChatRoomScreen() {
           socketRef.current?.emit('join_chatroom', {
             user_id: user.id,
             username: user.username,
+            sector: currentSector,
+            // After a reconnect only the missed messages are sent again
+            ...(lastSeqRef.current !== null && { last_seq: lastSeqRef.current }),
           });
           console.log('Joined chatroom');
         }
@@ -129,8 +166,15 @@ export default function ChatRoomScreen() {
       // Continue without real-time updates
     }
 
-    socketRef.current.on('new_chatroom_message', (message: ChatMessage) => {
+    socketRef.current.on('user_card', (card: UserCard) => {
+      userCardsRef.current[card.user_id] = card;
+    });
+
+    socketRef.current.on('new_chatroom_message', (compactMessage: ChatMessage) => {
+      const card = userCardsRef.current[compactMessage.user_id];
+      const message = { ...card, ...compactMessage };
       console.log('New message received via Socket.IO:', message);
+      if (message.seq) trackSeq(message.seq);
       setMessages((prev) => {
         const exists = prev.some(m => m.id === message.id);
         if (exists) {
@@ -140,13 +184,23 @@ export default function ChatRoomScreen() {
         console.log('Adding new message to state');
         return [...prev, message];
       });
+      // Reference-only copy: audio is downloaded when played, anything else right away
+      if (message.omitted?.some(field => field !== 'audio')) {
+        loadFullMessage(message.id);
+      }
       setTimeout(() => flatListRef.current?.scrollToEnd({ animated: true }), 100);
     });
 
-    socketRef.current.on('chatroom_message_deleted', (data: { message_id: string }) => {
+    socketRef.current.on('chatroom_message_deleted', (data: { message_id: string; seq?: number }) => {
+      if (data.seq) trackSeq(data.seq);
       setMessages((prev) => prev.filter(m => m.id !== data.message_id));
     });
 
+    // Too much was missed to replay over the socket
+    socketRef.current.on('replay_gap', () => {
+      loadMessages(false);
+    });
+
     socketRef.current.on('chatroom_cleared', () => {
       setMessages([]);
     });
@@ -317,7 +371,7 @@ export default function ChatRoomScreen() {
     }
   };
 
-  const formatTime = (dateString: string) => {
+  const formatTime = (dateString: string | number) => {
     const date = new Date(dateString);
     const now = new Date();
     const diff = now.getTime() - date.getTime();
@@ -346,7 +400,12 @@ export default function ChatRoomScreen() {
         <View style={[styles.messageBubble, isOwnMessage ? styles.ownBubble : styles.otherBubble]}>
           {!isOwnMessage && <Text style={styles.username}>{item.full_name || item.username}</Text>}
           
-          {item.message_type === 'audio' && item.audio ? (
+          {item.message_type === 'audio' && item.omitted?.includes('audio') ? (
+            <TouchableOpacity onPress={() => loadFullMessage(item.id)} style={styles.audioPlaceholder}>
+              <Ionicons name="download-outline" size={20} color={isOwnMessage ? '#fff' : '#007AFF'} />
+              <Text style={[styles.messageText, isOwnMessage && styles.ownMessageText]}> {item.duration || 0}s</Text>
+            </TouchableOpacity>
+          ) : item.message_type === 'audio' && item.audio ? (
             <AudioPlayer 
               audioUri={item.audio} 
               duration={item.duration || 0}
@@ -485,6 +544,7 @@ const styles = StyleSheet.create({
   otherBubble: { backgroundColor: '#fff', borderBottomLeftRadius: 4, shadowColor: '#000', shadowOffset: { width: 0, height: 1 }, shadowOpacity: 0.1, shadowRadius: 2, elevation: 2 },
   username: { fontSize: 12, fontWeight: '600', color: '#007AFF', marginBottom: 4 },
   messageText: { fontSize: 16, color: '#333', lineHeight: 20 },
+  audioPlaceholder: { flexDirection: 'row', alignItems: 'center', paddingVertical: 4 },
   ownMessageText: { color: '#fff' },
   messageFooter: { flexDirection: 'row', alignItems: 'center', justifyContent: 'space-between', marginTop: 4 },
   timeText: { fontSize: 10, color: '#999' },
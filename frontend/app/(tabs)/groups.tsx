@@ -29,7 +29,8 @@ interface Group {
   name: string;
   description?: string;
   creator_id: string;
-  member_ids: string[];
+  member_count: number;
+  my_role?: 'admin' | 'moderator' | 'member' | null;
   requires_approval: boolean;
   created_at: string;
 }
@@ -168,7 +169,7 @@ export default function GroupsScreen() {
             <View style={styles.groupMeta}>
               <Ionicons name="people-outline" size={14} color="#666" />
               <Text style={styles.groupMetaText}>
-                {group.member_ids.length} {t('members')}
+                {group.member_count} {t('members')}
               </Text>
               {group.requires_approval && (
                 <>
@@ -55,6 +55,8 @@ export default function ChatScreen() {
     try {
       const response = await api.get(`/api/chats/${id}/messages`);
       setMessages(response.data);
+      // Everything loaded is now read
+      await api.post(`/api/chats/${id}/read`);
     } catch (error) {
       console.error('Load messages error:', error);
     }
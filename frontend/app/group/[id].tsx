@@ -23,8 +23,10 @@ interface Group {
   name: string;
   description?: string;
   creator_id: string;
-  member_ids: string[];
-  members?: Member[];  // Full member details from backend
+  member_count: number;
+  my_role?: 'admin' | 'moderator' | 'member' | null;  // null when not a member
+  members?: Member[];  // First page of members, more from /groups/{id}/members
+  members_next_cursor?: string | null;  // Cursor of the next members page, null after the last
   requires_approval: boolean;
   created_at: string;
 }
@@ -64,6 +66,7 @@ interface Member {
   username: string;
   full_name: string;
   profile_picture?: string;
+  role: 'admin' | 'moderator' | 'member';
 }
 
 type TabType = 'posts' | 'members' | 'requests' | 'chat';
@@ -126,6 +129,23 @@ export default function GroupDetailScreen() {
     }
   };
 
+  const loadMoreMembers = async () => {
+    if (!group) return;
+    try {
+      const response = await axios.get(`${API_URL}/api/groups/${id}/members`, {
+        params: { cursor: group.members_next_cursor },
+        headers: { Authorization: `Bearer ${token}` },
+      });
+      setGroup({
+        ...group,
+        members: [...(group.members || []), ...response.data.members],
+        members_next_cursor: response.data.next_cursor,
+      });
+    } catch (error: any) {
+      Alert.alert(t('error'), error.response?.data?.detail || error.message);
+    }
+  };
+
   const loadPosts = async () => {
     try {
       const response = await axios.get(`${API_URL}/api/groups/${id}/posts`, {
@@ -451,7 +471,7 @@ export default function GroupDetailScreen() {
   };
 
   const renderMembers = () => {
-    if (!group || group.member_ids.length === 0) {
+    if (!group || group.member_count === 0) {
       return (
         <View style={styles.emptyContainer}>
           <Ionicons name="people-outline" size={64} color="#ccc" />
@@ -465,7 +485,7 @@ export default function GroupDetailScreen() {
     return (
       <View style={styles.membersList}>
         <Text style={styles.membersCount}>
-          {group.member_ids.length} {t('members')}
+          {group.member_count} {t('members')}
         </Text>
         {members.map((member) => (
           <TouchableOpacity 
@@ -494,6 +514,11 @@ export default function GroupDetailScreen() {
             )}
           </TouchableOpacity>
         ))}
+        {!!group.members_next_cursor && (
+          <TouchableOpacity style={styles.moreMembersButton} onPress={loadMoreMembers}>
+            <Text style={styles.moreMembersText}>{t('showMoreMembers')}</Text>
+          </TouchableOpacity>
+        )}
       </View>
     );
   };
@@ -554,7 +579,7 @@ export default function GroupDetailScreen() {
   if (!group) return null;
 
   const isCreator = group.creator_id === user?.id;
-  const isMember = group.member_ids.includes(user?.id || '');
+  const isMember = !!group.my_role;
 
   return (
     <SafeAreaView style={styles.container} edges={['top']}>
@@ -578,7 +603,7 @@ export default function GroupDetailScreen() {
           )}
           
           <View style={styles.groupMeta}>
-            <Text style={styles.metaText}>{group.member_ids.length} {t('members')}</Text>
+            <Text style={styles.metaText}>{group.member_count} {t('members')}</Text>
             <Text style={styles.metaDot}>•</Text>
             <Ionicons name={group.requires_approval ? 'lock-closed' : 'lock-open'} size={12} color="#666" />
             <Text style={styles.metaText}>
@@ -921,6 +946,8 @@ const styles = StyleSheet.create({
   content: { flex: 1 },
   membersList: { backgroundColor: '#fff', padding: 16, marginTop: 8, marginHorizontal: 16, borderRadius: 8 },
   membersCount: { fontSize: 16, fontWeight: '600', color: '#333', marginBottom: 12 },
+  moreMembersButton: { paddingVertical: 12, alignItems: 'center' },
+  moreMembersText: { fontSize: 14, color: '#007AFF', fontWeight: '600' },
   memberItem: { flexDirection: 'row', alignItems: 'center', paddingVertical: 12, paddingHorizontal: 16, backgroundColor: '#fff', borderBottomWidth: 1, borderBottomColor: '#f0f0f0' },
   memberAvatar: { width: 48, height: 48, borderRadius: 24 },
   memberAvatarPlaceholder: { backgroundColor: '#007AFF', justifyContent: 'center', alignItems: 'center' },
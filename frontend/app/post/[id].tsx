@@ -51,9 +51,8 @@ export default function PostDetailScreen() {
   const loadFollowing = async () => {
     try {
       if (!user?.id) return;
-      const response = await api.get(`/api/users/${user.id}/following`);
-      const ids = response.data.map((u: any) => u.id);
-      setFollowingIds(ids);
+      const response = await api.get('/api/users/me/following/ids');
+      setFollowingIds(response.data);
     } catch (error) {
       console.error('Load following error:', error);
     }
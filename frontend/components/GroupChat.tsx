@@ -22,9 +22,28 @@ interface ChatMessage {
   audio?: string;
   duration?: number;
   message_type: 'text' | 'audio';
-  created_at: string;
+  created_at: string | number;  // Epoch milliseconds on compact sockets
+  seq?: number;
+  omitted?: string[];  // Large fields left out for a lagging connection
 }
 
+interface UserCard {
+  user_id: string;
+  username: string;
+  full_name: string;
+  user_profile_picture?: string;
+}
+
+interface TypingUpdate {
+  group_id: string;
+  typing: { user_id: string; username: string }[];
+  stopped: string[];
+}
+
+// typing_start is repeated while typing; the server drops typers after 6 seconds
+const TYPING_REPEAT_MS = 3000;
+const TYPING_EXPIRE_MS = 6000;
+
 interface GroupChatProps {
   groupId: string;
 }
@@ -41,11 +60,16 @@ export default function GroupChat({ groupId }: GroupChatProps) {
   const [sending, setSending] = useState(false);
   const [chatEnabled, setChatEnabled] = useState(true);
   const [showVoiceRecorder, setShowVoiceRecorder] = useState(false);
+  const [typingUsers, setTypingUsers] = useState<Record<string, { username: string; expiresAt: number }>>({});
   
   const socketRef = useRef<Socket | null>(null);
+  const lastSeqRef = useRef<number | null>(null);  // Newest room event seen, replayed from on reconnect
+  const userCardsRef = useRef<Record<string, UserCard>>({});  // Sender details, sent once per sender
   const flatListRef = useRef<FlatList>(null);
+  const typingSentAtRef = useRef(0);  // Last typing_start sent, 0 when not typing
 
   useEffect(() => {
+    lastSeqRef.current = null;
     loadMessages();
     connectSocket();
     
@@ -57,6 +81,18 @@ export default function GroupChat({ groupId }: GroupChatProps) {
     };
   }, [groupId]);
 
+  // Drop typers whose updates stopped arriving
+  useEffect(() => {
+    const timer = setInterval(() => {
+      setTypingUsers((prev) => {
+        const now = Date.now();
+        const active = Object.entries(prev).filter(([, typer]) => typer.expiresAt > now);
+        return active.length === Object.keys(prev).length ? prev : Object.fromEntries(active);
+      });
+    }, 1000);
+    return () => clearInterval(timer);
+  }, []);
+
   const loadMessages = async (showLoading = true) => {
     if (showLoading) setLoading(true);
     try {
@@ -64,6 +100,7 @@ export default function GroupChat({ groupId }: GroupChatProps) {
         headers: { Authorization: `Bearer ${token}` },
       });
       setMessages(response.data);
+      trackSeq(...response.data.map((m: ChatMessage) => m.seq ?? 0));
       if (showLoading) setLoading(false);
     } catch (error: any) {
       console.error('Load messages error:', error);
@@ -71,6 +108,23 @@ export default function GroupChat({ groupId }: GroupChatProps) {
     }
   };
 
+  // Full copy of one message that arrived reference-only (see 'omitted')
+  const loadFullMessage = async (messageId: string) => {
+    try {
+      const response = await axios.get(`${API_URL}/api/groups/${groupId}/messages/${messageId}`, {
+        headers: { Authorization: `Bearer ${token}` },
+      });
+      setMessages((prev) => prev.map(m => m.id === messageId ? { ...m, ...response.data, omitted: undefined } : m));
+    } catch (error: any) {
+      console.error('Load message error:', error);
+    }
+  };
+
+  const trackSeq = (...seqs: number[]) => {
+    const seq = Math.max(0, ...seqs);
+    if (seq > (lastSeqRef.current ?? 0)) lastSeqRef.current = seq;
+  };
+
   const onRefresh = async () => {
     setRefreshing(true);
     await loadMessages(false);
@@ -85,7 +139,10 @@ export default function GroupChat({ groupId }: GroupChatProps) {
     try {
       socketRef.current = io(socketUrl, {
         path: '/socket.io/',  // Socket.IO default path
-        transports: ['websocket', 'polling'], // Try websocket first
+        // Sockets are authenticated once in the handshake; compact events
+        // leave sender details out, they arrive once as 'user_card'
+        auth: { token, compact: true },
+        transports: ['websocket'], // Multi-worker servers refuse long-polling (see backend/run_server.py)
         reconnection: true,
         reconnectionDelay: 1000,
         reconnectionAttempts: 5,
@@ -100,6 +157,8 @@ export default function GroupChat({ groupId }: GroupChatProps) {
             group_id: groupId,
             user_id: user.id,
             username: user.username,
+            // After a reconnect only the missed messages are sent again
+            ...(lastSeqRef.current !== null && { last_seq: lastSeqRef.current }),
           });
           console.log('Joined group chat');
         }
@@ -118,8 +177,15 @@ export default function GroupChat({ groupId }: GroupChatProps) {
       // Continue without real-time updates
     }
 
-    socketRef.current.on('new_group_message', (message: ChatMessage) => {
+    socketRef.current.on('user_card', (card: UserCard) => {
+      userCardsRef.current[card.user_id] = card;
+    });
+
+    socketRef.current.on('new_group_message', (compactMessage: ChatMessage) => {
+      const card = userCardsRef.current[compactMessage.user_id];
+      const message = { ...card, ...compactMessage };
       console.log('New message received via Socket.IO:', message);
+      if (message.seq) trackSeq(message.seq);
       setMessages((prev) => {
         const exists = prev.some(m => m.id === message.id);
         if (exists) {
@@ -129,13 +195,37 @@ export default function GroupChat({ groupId }: GroupChatProps) {
         console.log('Adding new message to state');
         return [...prev, message];
       });
+      // Reference-only copy: audio is downloaded when played, anything else right away
+      if (message.omitted?.some(field => field !== 'audio')) {
+        loadFullMessage(message.id);
+      }
       setTimeout(() => flatListRef.current?.scrollToEnd({ animated: true }), 100);
     });
 
+    // Coalesced by the server: at most one update per interval for the whole group
+    socketRef.current.on('typing_update', (update: TypingUpdate) => {
+      if (update.group_id !== groupId) return;
+      setTypingUsers((prev) => {
+        const next = { ...prev };
+        update.stopped.forEach((userId) => delete next[userId]);
+        update.typing.forEach((typer) => {
+          if (typer.user_id !== user?.id) {
+            next[typer.user_id] = { username: typer.username, expiresAt: Date.now() + TYPING_EXPIRE_MS };
+          }
+        });
+        return next;
+      });
+    });
+
     socketRef.current.on('group_message_deleted', (data: { message_id: string }) => {
       setMessages((prev) => prev.filter(m => m.id !== data.message_id));
     });
 
+    // Too much was missed to replay over the socket
+    socketRef.current.on('replay_gap', () => {
+      loadMessages(false);
+    });
+
     socketRef.current.on('group_chat_cleared', () => {
       setMessages([]);
     });
@@ -148,12 +238,37 @@ export default function GroupChat({ groupId }: GroupChatProps) {
     });
   };
 
+  const handleChangeText = (text: string) => {
+    setNewMessage(text);
+    const now = Date.now();
+    if (!text.trim()) {
+      stopTyping();
+    } else if (now - typingSentAtRef.current > TYPING_REPEAT_MS) {
+      typingSentAtRef.current = now;
+      socketRef.current?.emit('typing_start', { group_id: groupId });
+    }
+  };
+
+  const stopTyping = () => {
+    if (typingSentAtRef.current) {
+      typingSentAtRef.current = 0;
+      socketRef.current?.emit('typing_stop', { group_id: groupId });
+    }
+  };
+
+  const typingText = () => {
+    const names = Object.values(typingUsers).map((typer) => typer.username);
+    if (names.length === 0) return null;
+    return `${names.join(', ')} ${t(names.length === 1 ? 'isTyping' : 'areTyping')}`;
+  };
+
   const handleSendMessage = async () => {
     if (!newMessage.trim() || sending) return;
 
     setSending(true);
     const messageContent = newMessage.trim();
     setNewMessage(''); // Clear input immediately
+    typingSentAtRef.current = 0;  // The server stops typing when the message arrives
     
     try {
       console.log('Sending message:', messageContent);
@@ -249,7 +364,7 @@ export default function GroupChat({ groupId }: GroupChatProps) {
     ]);
   };
 
-  const formatTime = (dateString: string) => {
+  const formatTime = (dateString: string | number) => {
     const date = new Date(dateString);
     const now = new Date();
     const diff = now.getTime() - date.getTime();
@@ -278,7 +393,12 @@ export default function GroupChat({ groupId }: GroupChatProps) {
         <View style={[styles.messageBubble, isOwnMessage ? styles.ownBubble : styles.otherBubble]}>
           {!isOwnMessage && <Text style={styles.username}>{item.full_name || item.username}</Text>}
           
-          {item.message_type === 'audio' && item.audio ? (
+          {item.message_type === 'audio' && item.omitted?.includes('audio') ? (
+            <TouchableOpacity onPress={() => loadFullMessage(item.id)} style={styles.audioPlaceholder}>
+              <Ionicons name="download-outline" size={20} color={isOwnMessage ? '#fff' : '#007AFF'} />
+              <Text style={[styles.messageText, isOwnMessage && styles.ownMessageText]}> {item.duration || 0}s</Text>
+            </TouchableOpacity>
+          ) : item.message_type === 'audio' && item.audio ? (
             <AudioPlayer 
               audioUri={item.audio} 
               duration={item.duration || 0}
@@ -353,6 +473,8 @@ export default function GroupChat({ groupId }: GroupChatProps) {
           }
         />
 
+        {typingText() && <Text style={styles.typingText}>{typingText()}</Text>}
+
         <View style={styles.inputContainer}>
             <TouchableOpacity
               style={styles.voiceButton}
@@ -366,7 +488,8 @@ export default function GroupChat({ groupId }: GroupChatProps) {
               style={[styles.input, !chatEnabled && styles.inputDisabled]}
               placeholder={chatEnabled ? t('typeMessage') : t('chatDisabled')}
               value={newMessage}
-              onChangeText={setNewMessage}
+              onChangeText={handleChangeText}
+              onBlur={stopTyping}
               multiline
               maxLength={500}
               editable={chatEnabled}
@@ -413,11 +536,13 @@ const styles = StyleSheet.create({
   otherBubble: { backgroundColor: '#fff', borderBottomLeftRadius: 4, shadowColor: '#000', shadowOffset: { width: 0, height: 1 }, shadowOpacity: 0.1, shadowRadius: 2, elevation: 2 },
   username: { fontSize: 12, fontWeight: '600', color: '#007AFF', marginBottom: 4 },
   messageText: { fontSize: 16, color: '#333', lineHeight: 20 },
+  audioPlaceholder: { flexDirection: 'row', alignItems: 'center', paddingVertical: 4 },
   ownMessageText: { color: '#fff' },
   messageFooter: { flexDirection: 'row', alignItems: 'center', justifyContent: 'space-between', marginTop: 4 },
   timeText: { fontSize: 10, color: '#999' },
   ownTimeText: { color: 'rgba(255, 255, 255, 0.7)' },
   deleteButton: { marginLeft: 8 },
+  typingText: { fontSize: 12, color: '#666', fontStyle: 'italic', paddingHorizontal: 16, paddingBottom: 4 },
   inputContainer: { flexDirection: 'row', padding: 12, backgroundColor: '#fff', borderTopWidth: 1, borderTopColor: '#e0e0e0', alignItems: 'flex-end' },
   voiceButton: { width: 40, height: 40, borderRadius: 20, backgroundColor: '#f5f5f5', justifyContent: 'center', alignItems: 'center', marginRight: 8 },
   input: { flex: 1, backgroundColor: '#f5f5f5', borderRadius: 20, paddingHorizontal: 16, paddingVertical: 10, fontSize: 16, maxHeight: 100, marginRight: 8 },
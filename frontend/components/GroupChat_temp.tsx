@@ -87,7 +87,7 @@ export default function ChatRoomScreen() {
     try {
       socketRef.current = io(socketUrl, {
         path: '/socket.io/',  // Socket.IO default path
-        transports: ['websocket', 'polling'], // Try websocket first
+        transports: ['websocket'], // Multi-worker servers refuse long-polling (see backend/run_server.py)
         reconnection: true,
         reconnectionDelay: 1000,
         reconnectionAttempts: 5,
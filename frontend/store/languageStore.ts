@@ -527,6 +527,7 @@ export const translations = {
     publicGroup: 'Public - Anyone can join',
     privateGroup: 'Private - Requires approval',
     members: 'Members',
+    showMoreMembers: 'Show more members',
     creator: 'Creator',
     joinGroup: 'Join Group',
     leaveGroup: 'Leave Group',
@@ -557,6 +558,8 @@ export const translations = {
     publicChat: 'Public Chat',
     everyoneCanSee: 'Everyone can see and send messages',
     typeMessage: 'Type a message...',
+    isTyping: 'is typing...',
+    areTyping: 'are typing...',
     send: 'Send',
     noChatMessages: 'No messages yet. Start the conversation!',
     justNow: 'Just now',
@@ -1064,6 +1067,7 @@ export const translations = {
     publicGroup: 'Herkese Açık - Herkes katılabilir',
     privateGroup: 'Özel - Onay gerektirir',
     members: 'Üyeler',
+    showMoreMembers: 'Daha fazla üye göster',
     creator: 'Kurucu',
     joinGroup: 'Gruba Katıl',
     leaveGroup: 'Gruptan Ayrıl',
@@ -1094,6 +1098,8 @@ export const translations = {
     publicChat: 'Genel Sohbet',
     everyoneCanSee: 'Herkes mesajları görebilir ve gönderebilir',
     typeMessage: 'Bir mesaj yazın...',
+    isTyping: 'yazıyor...',
+    areTyping: 'yazıyor...',
     send: 'Gönder',
     noChatMessages: 'Henüz mesaj yok. Konuşmayı başlat!',
     justNow: 'Az önce',
@@ -1601,6 +1607,7 @@ export const translations = {
     publicGroup: 'Público - Cualquiera puede unirse',
     privateGroup: 'Privado - Requiere aprobación',
     members: 'Miembros',
+    showMoreMembers: 'Mostrar más miembros',
     creator: 'Creador',
     joinGroup: 'Unirse al Grupo',
     leaveGroup: 'Salir del Grupo',
@@ -1631,6 +1638,8 @@ export const translations = {
     publicChat: 'Chat Público',
     everyoneCanSee: 'Todos pueden ver y enviar mensajes',
     typeMessage: 'Escribe un mensaje...',
+    isTyping: 'está escribiendo...',
+    areTyping: 'están escribiendo...',
     send: 'Enviar',
     noChatMessages: 'Aún no hay mensajes. ¡Inicia la conversación!',
     justNow: 'Ahora mismo',
@@ -48,9 +48,8 @@ export const useNotificationStore = create<NotificationState>((set) => ({
   loadUnreadMessageCount: async () => {
     try {
       const response = await api.get('/api/chats');
-      // For now, we'll just count total chats
-      // In future, we can add unread_count to each chat
-      set({ unreadMessageCount: response.data.length > 0 ? response.data.length : 0 });
+      const unread = response.data.reduce((total: number, chat: any) => total + (chat.unread_count || 0), 0);
+      set({ unreadMessageCount: unread });
     } catch (error) {
       console.error('Load unread messages count error:', error);
     }
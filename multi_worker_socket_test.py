@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Multi-Worker Socket.IO Delivery Test
+
+Starts two backend workers on separate ports sharing the MongoDB client
+manager, connects a Socket.IO client to worker 1 and sends messages through
+the REST API of worker 0. Every emit must reach the client on the other worker.
+
+Requires MongoDB and backend/.env (MONGO_URL, DB_NAME, SECRET_KEY).
+"""
+
+import os
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import requests
+import socketio
+
+BACKEND_DIR = Path(__file__).parent / "backend"
+BASE_PORT = int(os.environ.get("MULTI_WORKER_TEST_PORT", "8101"))
+MANAGER = os.environ.get("MULTI_WORKER_TEST_MANAGER", "mongo")
+WORKER_URLS = [f"http://127.0.0.1:{BASE_PORT}", f"http://127.0.0.1:{BASE_PORT + 1}"]
+TIMEOUT = 10
+
+def log_test(message, status="INFO"):
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    print(f"[{timestamp}] [{status}] {message}")
+
+def start_workers():
+    """Launch 2 workers on consecutive ports through run_server.py"""
+    process = subprocess.Popen(
+        [
+            sys.executable, "run_server.py",
+            "--workers", "2",
+            "--port", str(BASE_PORT),
+            "--host", "127.0.0.1",
+            "--manager", MANAGER,
+            "--port-per-worker",
+        ],
+        cwd=BACKEND_DIR,
+    )
+    deadline = time.time() + 30
+    for url in WORKER_URLS:
+        while True:
+            try:
+                requests.get(f"{url}/api/privacy-policy", timeout=1)
+                break
+            except requests.RequestException:
+                if time.time() > deadline:
+                    process.terminate()
+                    raise RuntimeError(f"Worker at {url} did not start")
+                time.sleep(0.5)
+    # Give the pub/sub listeners a moment to attach
+    time.sleep(2)
+    return process
+
+def register_user(base_url, prefix):
+    timestamp = str(int(time.time() * 1000))
+    response = requests.post(f"{base_url}/api/auth/register", json={
+        "username": f"{prefix}_{timestamp}",
+        "email": f"{prefix}_{timestamp}@test.com",
+        "password": "TestPass123!",
+        "full_name": f"{prefix} multi worker",
+        "current_sector": "drivers"
+    }, timeout=TIMEOUT)
+    response.raise_for_status()
+    data = response.json()
+    return data["access_token"], data["user"]
+
+def connect_client(base_url, token, events):
+    """Connect a polling client and record the given events"""
+    received = {event: threading.Event() for event in events}
+    payloads = {}
+    client = socketio.Client()
+
+    for event in events:
+        def handler(data, event=event):
+            payloads[event] = data
+            received[event].set()
+        client.on(event, handler)
+
+    client.connect(base_url, transports=["polling"], auth={"token": token}, wait_timeout=TIMEOUT)
+    return client, received, payloads
+
+def test_cross_process_delivery():
+    results = {}
+    sender_url, receiver_url = WORKER_URLS
+
+    token_a, user_a = register_user(sender_url, "mw_sender")
+    token_b, user_b = register_user(sender_url, "mw_receiver")
+    headers_a = {"Authorization": f"Bearer {token_a}"}
+
+    # Direct chat between the two users, created on worker 0
+    response = requests.post(f"{sender_url}/api/chats", json={"user_id": user_b["id"]}, headers=headers_a, timeout=TIMEOUT)
+    response.raise_for_status()
+    chat_id = response.json()["id"]
+
+    client, received, payloads = connect_client(
+        receiver_url, token_b, ["new_message", "new_chatroom_message"]
+    )
+    try:
+        client.emit("join_chat", {"chat_id": chat_id, "user_id": user_b["id"]})
+        client.emit("join_chatroom", {"user_id": user_b["id"], "username": user_b["username"], "sector": "drivers"})
+        time.sleep(1)
+
+        # Direct message sent on worker 0, listened to on worker 1
+        log_test("Testing direct message delivery across workers...")
+        requests.post(
+            f"{sender_url}/api/chats/{chat_id}/messages",
+            json={"chat_id": chat_id, "content": "hello from worker 0"},
+            headers=headers_a, timeout=TIMEOUT
+        ).raise_for_status()
+        ok = received["new_message"].wait(TIMEOUT) and payloads["new_message"]["chat_id"] == chat_id
+        log_test("✅ new_message delivered across workers" if ok else "❌ new_message not delivered across workers")
+        results["cross_process_new_message"] = {"success": bool(ok)}
+
+        # Chatroom message sent on worker 0, listened to on worker 1
+        log_test("Testing chatroom message delivery across workers...")
+        requests.post(
+            f"{sender_url}/api/chatroom/messages",
+            json={"content": "chatroom hello from worker 0", "sector": "drivers"},
+            headers=headers_a, timeout=TIMEOUT
+        ).raise_for_status()
+        ok = received["new_chatroom_message"].wait(TIMEOUT)
+        log_test("✅ new_chatroom_message delivered across workers" if ok else "❌ new_chatroom_message not delivered across workers")
+        results["cross_process_chatroom_message"] = {"success": bool(ok)}
+    finally:
+        client.disconnect()
+
+    return results
+
+def main():
+    log_test("=" * 60)
+    log_test(f"MULTI-WORKER SOCKET.IO TEST (manager: {MANAGER})")
+    log_test("=" * 60)
+
+    process = start_workers()
+    try:
+        results = test_cross_process_delivery()
+    finally:
+        process.terminate()
+        process.wait(TIMEOUT)
+
+    passed = sum(1 for result in results.values() if result.get("success", False))
+    for test_name, result in results.items():
+        status = "✅ PASS" if result.get("success", False) else "❌ FAIL"
+        log_test(f"{test_name}: {status}")
+    log_test(f"TOTAL: {passed}/{len(results)} tests passed")
+    return 0 if passed == len(results) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Socket.IO Wire Format Benchmark
+
+Broadcasts a chatroom message to in-process connections of the backend's
+Socket.IO server and reports, per wire format:
+- bytes per message on the wire, raw and after permessage-deflate
+- CPU time per broadcast to all recipients
+
+"before" is the previous setup (JSON, full payload, per-packet logging on),
+the other rows are what clients can negotiate now.
+
+Reads backend/.env like the server; no MongoDB connection is made.
+"""
+
+import argparse
+import asyncio
+import base64
+import logging
+import os
+import sys
+import time
+import zlib
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+
+import engineio  # noqa: E402
+import server  # noqa: E402
+
+FORMATS = [
+    # name, msgpack, compact, packet logging
+    ("before: json + logging", False, False, True),
+    ("json", False, False, False),
+    ("json compact", False, True, False),
+    ("msgpack", True, False, False),
+    ("msgpack compact", True, True, False),
+]
+
+def log_test(message, status="INFO"):
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    print(f"[{timestamp}] [{status}] {message}")
+
+def sample_messages(count, picture_bytes):
+    """Chatroom messages as emitted by create_chatroom_message, from 10 senders"""
+    pictures = [
+        "data:image/jpeg;base64," + base64.b64encode(os.urandom(picture_bytes)).decode()
+        for _ in range(10)
+    ]
+    return [{
+        "id": str(1700000000000 + i),
+        "user_id": f"user{i % 10}",
+        "username": f"driver_{i % 10}",
+        "full_name": f"Driver Number {i % 10}",
+        "user_profile_picture": pictures[i % 10],
+        "content": f"Traffic is slow on the ring road near exit {i}, take the bypass",
+        "audio": None,
+        "duration": None,
+        "message_type": "text",
+        "created_at": datetime.utcnow().isoformat(),
+        "seq": i + 1,
+    } for i in range(count)]
+
+def packet_logger(enabled):
+    if not enabled:
+        return False
+    logger = logging.getLogger("socket_wire_benchmark")
+    logger.handlers = [logging.StreamHandler(open(os.devnull, "w"))]
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    return logger
+
+async def run_format(name, use_msgpack, compact, logging_on, messages, recipients):
+    logger = packet_logger(logging_on)
+    sio = server.BackpressureServer(async_mode="asgi", logger=logger, engineio_logger=logger)
+    sockets = []
+    for index in range(recipients):
+        eio_sid = f"bench{index}"
+        socket = engineio.async_socket.AsyncSocket(sio.eio, eio_sid)
+        socket.connected = True
+        sio.eio.sockets[eio_sid] = socket
+        sio.wire_profiles[eio_sid] = {"msgpack": use_msgpack, "compact": compact, "cards": {}}
+        sid = await sio.manager.connect(eio_sid, "/")
+        await sio.enter_room(sid, "chatroom:drivers")
+        sockets.append(socket)
+
+    # One recipient's stream, compressed the way permessage-deflate does (shared window)
+    deflate = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+    raw_bytes = deflated_bytes = 0
+    cpu = 0.0
+    for message in messages:
+        start = time.process_time()
+        await sio.emit("new_chatroom_message", message, room="chatroom:drivers")
+        cpu += time.process_time() - start
+        for index, socket in enumerate(sockets):
+            while not socket.queue.empty():
+                pkt = socket.queue.get_nowait()
+                socket.queue.task_done()
+                if index == 0:
+                    data = pkt.data.encode() if isinstance(pkt.data, str) else pkt.data
+                    raw_bytes += len(data)
+                    deflated_bytes += len(deflate.compress(data) + deflate.flush(zlib.Z_SYNC_FLUSH))
+
+    return {
+        "name": name,
+        "bytes": raw_bytes / len(messages),
+        "deflated": deflated_bytes / len(messages),
+        "cpu_ms": cpu / len(messages) * 1000,
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description="Compare Socket.IO wire formats")
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--recipients", type=int, default=200)
+    parser.add_argument("--picture-bytes", type=int, default=6000, help="Profile picture size before base64")
+    args = parser.parse_args()
+
+    log_test("=" * 60)
+    log_test(f"SOCKET.IO WIRE FORMAT BENCHMARK ({args.messages} messages x {args.recipients} recipients)")
+    log_test("=" * 60)
+
+    messages = sample_messages(args.messages, args.picture_bytes)
+    results = [
+        await run_format(name, use_msgpack, compact, logging_on, messages, args.recipients)
+        for name, use_msgpack, compact, logging_on in FORMATS
+    ]
+
+    baseline = results[0]
+    log_test(f"{'format':<24}{'bytes/msg':>12}{'deflated':>12}{'cpu ms/broadcast':>20}")
+    for result in results:
+        log_test(
+            f"{result['name']:<24}{result['bytes']:>12.0f}{result['deflated']:>12.0f}"
+            f"{result['cpu_ms']:>14.2f} ({result['cpu_ms'] / baseline['cpu_ms']:.0%})"
+        )
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pytest
+
+# server.py reads these at import; Motor only connects on the first query
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "drivers_chat_test")
+os.environ.setdefault("SECRET_KEY", "test-secret")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+import server  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def db(monkeypatch):
+    """In-memory database swapped in for server.db"""
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    database = mongomock_motor.AsyncMongoMockClient()["drivers_chat_test"]
+    monkeypatch.setattr(server, "db", database)
+    return database
@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+
+from server import ChatSummaryWriter
+
+pytestmark = pytest.mark.anyio
+
+CHAT = {"id": "chat1", "members": ["alice", "bob", "carol"]}
+
+
+def message(seq, user_id="alice"):
+    return {"content": f"m{seq}", "created_at": seq, "user_id": user_id, "username": user_id, "seq": seq}
+
+
+class GatedWriter(ChatSummaryWriter):
+    """Holds every write until released, recording the batches it was given"""
+
+    def __init__(self):
+        super().__init__()
+        self.batches = []
+        self.release = asyncio.Event()
+
+    async def _write(self, chat_id, batch):
+        self.batches.append(batch)
+        await self.release.wait()
+        await super()._write(chat_id, batch)
+
+
+async def chat_doc(db):
+    return await db.chats.find_one({"id": CHAT["id"]}, {"_id": 0})
+
+
+async def test_changes_during_a_write_merge_into_one_update(db):
+    await db.chats.insert_one({"id": CHAT["id"]})
+    writer = GatedWriter()
+
+    first = asyncio.create_task(writer.message_sent(CHAT, message(1)))
+    await asyncio.sleep(0)
+    rest = [asyncio.create_task(writer.message_sent(CHAT, message(seq))) for seq in range(2, 6)]
+    rest.append(asyncio.create_task(writer.mark_read(CHAT["id"], "carol", 3)))
+    await asyncio.sleep(0)
+    writer.release.set()
+    await asyncio.gather(first, *rest)
+
+    assert len(writer.batches) == 2
+    chat = await chat_doc(db)
+    assert chat["last_message"] == "m5"
+    assert chat["last_message_seq"] == 5
+    assert chat["unread_counts"] == {"alice": 0, "bob": 5, "carol": 0}
+    assert chat["read_seq"] == {"alice": 5, "carol": 3}
+
+
+async def test_mark_read_resets_unread_and_keeps_highest_watermark(db):
+    await db.chats.insert_one({"id": CHAT["id"]})
+    writer = ChatSummaryWriter()
+    for seq in (1, 2, 3):
+        await writer.message_sent(CHAT, message(seq))
+
+    await writer.mark_read(CHAT["id"], "bob", 3)
+    await writer.mark_read(CHAT["id"], "bob", 2)
+
+    chat = await chat_doc(db)
+    assert chat["unread_counts"]["bob"] == 0
+    assert chat["unread_counts"]["carol"] == 3
+    assert chat["read_seq"]["bob"] == 3
+
+
+async def test_older_message_does_not_replace_last_message(db):
+    await db.chats.insert_one({"id": CHAT["id"], "last_message": "m10", "last_message_seq": 10})
+    writer = ChatSummaryWriter()
+
+    await writer.message_sent(CHAT, message(7, user_id="bob"))
+
+    chat = await chat_doc(db)
+    assert chat["last_message"] == "m10"
+    assert chat["last_message_seq"] == 10
+    assert chat["unread_counts"] == {"bob": 0, "alice": 1, "carol": 1}
+
+
+async def test_failed_write_reaches_every_waiter(db):
+    class FailingWriter(GatedWriter):
+        async def _write(self, chat_id, batch):
+            self.batches.append(batch)
+            await self.release.wait()
+            raise RuntimeError("write failed")
+
+    writer = FailingWriter()
+    first = asyncio.create_task(writer.message_sent(CHAT, message(1)))
+    await asyncio.sleep(0)
+    second = asyncio.create_task(writer.message_sent(CHAT, message(2)))
+    await asyncio.sleep(0)
+    writer.release.set()
+    results = await asyncio.gather(first, second, return_exceptions=True)
+
+    assert [str(result) for result in results] == ["write failed", "write failed"]
+    assert len(writer.batches) == 2
+    assert CHAT["id"] not in writer._writing
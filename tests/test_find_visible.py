@@ -0,0 +1,60 @@
+import pytest
+
+from server import find_visible
+
+pytestmark = pytest.mark.anyio
+
+SORT = [("created_at", -1)]
+
+
+@pytest.fixture
+async def posts(db):
+    # Every third post is by the blocked user, newest first by created_at
+    await db.posts_enhanced.insert_many([
+        {"id": f"p{i}", "user_id": "blocked" if i % 3 == 0 else "friend", "created_at": 100 - i}
+        for i in range(30)
+    ])
+    return db.posts_enhanced
+
+
+async def page_ids(posts, skip, limit, excluded=frozenset({"blocked"})):
+    docs = await find_visible(posts, {}, SORT, skip, limit, excluded)
+    return [doc["id"] for doc in docs]
+
+
+async def test_pages_are_full_and_skip_excluded_authors(posts):
+    ids = await page_ids(posts, 0, 5)
+
+    assert ids == ["p1", "p2", "p4", "p5", "p7"]
+
+
+async def test_pages_do_not_overlap_across_skip(posts):
+    pages = [await page_ids(posts, skip, 4) for skip in range(0, 20, 4)]
+    seen = [post_id for page in pages for post_id in page]
+
+    assert all(len(page) == 4 for page in pages)
+    assert len(seen) == len(set(seen)) == 20
+    assert seen == [f"p{i}" for i in range(30) if i % 3][:20]
+
+
+async def test_window_grows_past_long_runs_of_excluded_posts(db):
+    await db.posts_enhanced.insert_many(
+        [{"id": f"b{i}", "user_id": "blocked", "created_at": 100 - i} for i in range(20)]
+        + [{"id": f"f{i}", "user_id": "friend", "created_at": 50 - i} for i in range(3)]
+    )
+
+    ids = await page_ids(db.posts_enhanced, 0, 2)
+
+    assert ids == ["f0", "f1"]
+
+
+async def test_last_page_is_short(posts):
+    ids = await page_ids(posts, 18, 5)
+
+    assert ids == ["p28", "p29"]
+
+
+async def test_no_exclusions_is_a_plain_page(posts):
+    ids = await page_ids(posts, 3, 3, excluded=frozenset())
+
+    assert ids == ["p3", "p4", "p5"]
@@ -0,0 +1,84 @@
+from server import RoomReplayBuffer
+
+
+def record(buffer, room, *seqs):
+    for seq in seqs:
+        buffer.record(room, "new_message", {"seq": seq})
+
+
+def seqs(events):
+    return [seq for seq, _, _ in events]
+
+
+def test_replays_events_after_last_seq():
+    buffer = RoomReplayBuffer(size=10, max_rooms=10)
+    record(buffer, "chat", 1, 2, 3, 4)
+
+    assert seqs(buffer.since("chat", 2, 4)) == [3, 4]
+    assert seqs(buffer.since("chat", 0, 3)) == [1, 2, 3]
+
+
+def test_up_to_date_client_gets_nothing():
+    buffer = RoomReplayBuffer(size=10, max_rooms=10)
+    record(buffer, "chat", 1, 2)
+
+    assert buffer.since("chat", 2, 2) == []
+    assert buffer.since("unknown", 5, 5) == []
+
+
+def test_out_of_order_events_are_kept_sorted_once():
+    buffer = RoomReplayBuffer(size=10, max_rooms=10)
+    record(buffer, "chat", 1, 3, 2, 3)
+
+    assert seqs(buffer.since("chat", 0, 3)) == [1, 2, 3]
+
+
+def test_gap_before_recording_started_is_not_covered():
+    buffer = RoomReplayBuffer(size=10, max_rooms=10)
+    record(buffer, "chat", 5, 6)
+
+    assert buffer.since("chat", 3, 6) is None
+    assert seqs(buffer.since("chat", 4, 6)) == [5, 6]
+    assert buffer.since("unknown", 1, 6) is None
+
+
+def test_evicted_events_are_not_covered():
+    buffer = RoomReplayBuffer(size=3, max_rooms=10)
+    record(buffer, "chat", 1, 2, 3, 4, 5)
+
+    assert buffer.since("chat", 1, 5) is None
+    assert seqs(buffer.since("chat", 2, 5)) == [3, 4, 5]
+
+
+def test_events_older_than_coverage_are_dropped():
+    buffer = RoomReplayBuffer(size=2, max_rooms=10)
+    record(buffer, "chat", 3, 4, 5, 1)
+
+    assert seqs(buffer.since("chat", 3, 5)) == [4, 5]
+
+
+def test_holes_from_failed_sends_are_not_gaps():
+    buffer = RoomReplayBuffer(size=10, max_rooms=10)
+    record(buffer, "chat", 1, 2, 4, 5)  # seq 3 was allocated but never sent
+
+    assert seqs(buffer.since("chat", 1, 5)) == [2, 4, 5]
+
+
+def test_least_recently_used_room_is_dropped():
+    buffer = RoomReplayBuffer(size=10, max_rooms=2)
+    record(buffer, "a", 1)
+    record(buffer, "b", 1)
+    record(buffer, "a", 2)
+    record(buffer, "c", 1)
+
+    assert buffer.since("b", 0, 1) is None
+    assert seqs(buffer.since("a", 0, 2)) == [1, 2]
+
+
+def test_unsequenced_payloads_are_ignored():
+    buffer = RoomReplayBuffer(size=10, max_rooms=10)
+    buffer.record("chat", "typing", {"user_id": "u1"})
+    buffer.record("chat", "typing", "not a dict")
+    buffer.record(None, "new_message", {"seq": 1})
+
+    assert buffer.since("chat", 0, 1) is None
@@ -0,0 +1,66 @@
+import pytest
+
+from server import UserStatsReconciler, bump_user_stats, delete_post_and_comments, get_user_stats
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def community(db):
+    await db.users.insert_many([
+        {"id": "alice", "followers_count": 0, "following_count": 0},
+        {"id": "bob", "followers_count": 1, "following_count": 0, "invited_by": "alice"},
+    ])
+    await db.posts_enhanced.insert_many([
+        {"id": "p1", "user_id": "alice"},
+        {"id": "p2", "user_id": "alice"},
+        {"id": "p3", "user_id": "bob"},
+    ])
+    await db.comments.insert_many([
+        {"id": "c1", "post_id": "p1", "user_id": "bob"},
+        {"id": "c2", "post_id": "p1", "user_id": "bob"},
+        {"id": "c3", "post_id": "p3", "user_id": "alice"},
+    ])
+    await db.groups.insert_one({"id": "g1", "creator_id": "bob"})
+    await db.follows.insert_one({"follower_id": "alice", "followee_id": "bob"})
+    return db
+
+
+async def test_reconcile_backfills_missing_stats(community):
+    reconciler = UserStatsReconciler(interval=3600)
+
+    assert await reconciler.reconcile() == 2
+
+    assert await get_user_stats("alice") == {"posts_count": 2, "comments_count": 1, "groups_created": 0}
+    assert await get_user_stats("bob") == {"posts_count": 1, "comments_count": 2, "groups_created": 1}
+    alice = await community.users.find_one({"id": "alice"})
+    assert (alice["following_count"], alice["referral_count"]) == (1, 1)
+    assert reconciler.stats["runs"] == 1
+
+
+async def test_reconcile_corrects_drift_only_where_it_happened(community):
+    reconciler = UserStatsReconciler(interval=3600)
+    await reconciler.reconcile()
+    await bump_user_stats("alice", posts_count=5)
+    await community.users.update_one({"id": "bob"}, {"$set": {"followers_count": 7}})
+    await community.user_stats.insert_one({"_id": "deleted-user", "posts_count": 3})
+
+    assert await reconciler.reconcile() == 2
+
+    assert (await get_user_stats("alice"))["posts_count"] == 2
+    bob = await community.users.find_one({"id": "bob"})
+    assert bob["followers_count"] == 1
+    assert await community.user_stats.find_one({"_id": "deleted-user"}) is None
+    assert await reconciler.reconcile() == 0
+
+
+async def test_incremental_deletes_match_reconciled_counts(community):
+    reconciler = UserStatsReconciler(interval=3600)
+    await reconciler.reconcile()
+
+    assert await delete_post_and_comments("p1") is True
+    assert await delete_post_and_comments("p1") is False
+
+    assert await get_user_stats("alice") == {"posts_count": 1, "comments_count": 1, "groups_created": 0}
+    assert (await get_user_stats("bob"))["comments_count"] == 0
+    assert await reconciler.reconcile() == 0